@@ -0,0 +1,88 @@
+import asyncio
+import weakref
+from typing import Optional
+
+from pyrogram import Client
+
+from app.utils.helper import get_user_balance
+
+
+class BalanceReservation:
+    """Stars set aside for one purchase; committed per sent gift, the rest released."""
+
+    def __init__(self, ledger: "BalanceLedger", unit_price: int, units: int):
+        self.ledger = ledger
+        self.unit_price = unit_price
+        self.units = units
+        self.remaining = unit_price * units
+
+    def commit(self, shadow: bool = False) -> None:
+        """Account for one gift sent out of this reservation; a ``shadow`` one only as if it was sent."""
+        amount = min(self.unit_price, self.remaining)
+        self.remaining -= amount
+        self.ledger.reserved -= amount
+        self.ledger.balance = (self.ledger.balance or 0) - amount
+        if shadow:
+            self.ledger.shadow_spent += amount
+
+    def release(self) -> None:
+        """Return whatever was not spent to the available balance."""
+        self.ledger.reserved -= self.remaining
+        self.remaining = 0
+
+
+class BalanceLedger:
+    """Per-account star balance shared by concurrent purchases.
+
+    The balance is fetched from Telegram only when no purchase is in flight (or after
+    Telegram disagrees with it); while purchases overlap they reserve against the cached
+    value, so a purchase the account cannot afford is rejected locally instead of failing
+    with BALANCE_TOO_LOW. Stars spent by shadow purchases stay deducted from every
+    refreshed balance, so shadow mode runs out of stars when the live bot would have.
+    """
+
+    _ledgers: "weakref.WeakKeyDictionary[Client, BalanceLedger]" = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.balance: Optional[int] = None
+        self.reserved = 0
+        self.shadow_spent = 0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_client(cls, app: Client) -> "BalanceLedger":
+        ledger = cls._ledgers.get(app)
+        if ledger is None:
+            ledger = cls._ledgers[app] = cls()
+        return ledger
+
+    @property
+    def available(self) -> int:
+        return max(0, (self.balance or 0) - self.reserved)
+
+    async def refresh(self, app: Client) -> int:
+        self.balance = max(0, await get_user_balance(app) - self.shadow_spent)
+        self._stale = False
+        return self.balance
+
+    async def current(self, app: Client) -> int:
+        """Stars not yet reserved by purchases in flight."""
+        async with self._lock:
+            if self._stale or self.reserved == 0:
+                await self.refresh(app)
+            return self.available
+
+    async def reserve(self, app: Client, unit_price: int, quantity: int) -> BalanceReservation:
+        """Reserve stars for up to ``quantity`` gifts at ``unit_price``."""
+        async with self._lock:
+            if self._stale or self.reserved == 0:
+                await self.refresh(app)
+
+            units = min(quantity, self.available // unit_price) if unit_price > 0 else quantity
+            reservation = BalanceReservation(self, unit_price, units)
+            self.reserved += reservation.remaining
+            return reservation
+
+
+balance_ledger = BalanceLedger.for_client
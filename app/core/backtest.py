@@ -0,0 +1,119 @@
+import argparse
+import bisect
+import math
+from typing import Dict, List, Optional
+
+from app.core.purchase_queue import priority_key
+from app.core.supply_history import Sample, SupplyRecorder
+from app.core.user_config import PRIORITIZE_LOW_SUPPLY, PRIORITIZE_POSITION, PRIORITIZE_SELLOUT_ETA
+from data.config import config
+
+STRATEGIES = (PRIORITIZE_POSITION, PRIORITIZE_LOW_SUPPLY, PRIORITIZE_SELLOUT_ETA)
+
+
+class Backtest:
+    """Replays recorded supply curves to compare purchase orders on gifts secured.
+
+    Gifts whose first sample falls within ``drop_gap`` seconds of each other form one
+    drop. A simulated account sees the catalog every ``interval`` seconds, wants
+    ``quantity`` copies of every gift and sends one gift per ``send_time`` seconds,
+    always picking the most urgent remaining gift under the strategy. A send
+    succeeds while the recorded supply at that moment is above zero.
+    """
+
+    def __init__(self, recorder: SupplyRecorder, quantity: int = 1, send_time: float = 0.6,
+                 interval: float = 15.0, window: float = 60.0, drop_gap: float = 120.0):
+        self.recorder = recorder
+        self.quantity = quantity
+        self.send_time = send_time
+        self.interval = interval
+        self.window = window
+        self.drop_gap = drop_gap
+        self.series: Dict[int, List[Sample]] = {
+            gift_id: samples for gift_id in recorder.gift_ids() if (samples := recorder.series(gift_id))
+        }
+
+    def drops(self) -> List[List[int]]:
+        drops: List[List[int]] = []
+        last_start = -math.inf
+        for gift_id in sorted(self.series, key=lambda gift: self.series[gift][0][0]):
+            start = self.series[gift_id][0][0]
+            start - last_start > self.drop_gap and drops.append([])
+            drops[-1].append(gift_id)
+            last_start = start
+        return drops
+
+    def run(self, strategy: str, gift_ids: List[int]) -> int:
+        """Number of gifts secured from one drop under ``strategy``."""
+        start = min(self.series[gift_id][0][0] for gift_id in gift_ids)
+        end = max(self.series[gift_id][-1][0] for gift_id in gift_ids)
+        gifts = {
+            gift_id: {"id": gift_id, "is_limited": True, "total_amount": self.series[gift_id][0][1],
+                      "position": len(gift_ids) - position}
+            for position, gift_id in enumerate(gift_ids)
+        }
+        remaining = {gift_id: self.quantity for gift_id in gift_ids}
+        secured, now = 0, start
+
+        while now <= end:
+            polled = start + math.floor((now - start) / self.interval) * self.interval
+            visible = [gift_id for gift_id, left in remaining.items()
+                       if left and self.series[gift_id][0][0] <= polled]
+            if not visible:
+                if not any(remaining.values()):
+                    break
+                now = polled + self.interval
+                continue
+
+            gift_id = min(visible, key=lambda gift: priority_key(gifts[gift], strategy, self._eta(gift, polled)))
+            if self._supply_at(gift_id, now) > 0:
+                secured += 1
+                remaining[gift_id] -= 1
+            else:
+                remaining[gift_id] = 0
+            now += self.send_time
+
+        return secured
+
+    def _eta(self, gift_id: int, polled: float) -> Optional[float]:
+        """ETA as the live monitor would have estimated it from polls up to ``polled``."""
+        samples = self.series[gift_id]
+        end = bisect.bisect_right(samples, (polled, math.inf))
+        # The sample before the window holds the supply the window starts from
+        begin = max(bisect.bisect_right(samples, (polled - self.window, math.inf), 0, end) - 1, 0)
+        return SupplyRecorder.eta_of(samples[begin:end], polled, self.window)
+
+    def _supply_at(self, gift_id: int, at: float) -> int:
+        samples = self.series[gift_id]
+        index = bisect.bisect_right(samples, (at, math.inf)) - 1
+        return samples[max(index, 0)][1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare purchase prioritization strategies on recorded supply")
+    parser.add_argument("--file", default=config.SUPPLY_FILE)
+    parser.add_argument("--quantity", type=int, default=1, help="copies wanted per gift")
+    parser.add_argument("--send-time", type=float, default=0.6, help="seconds per send_gift call")
+    parser.add_argument("--interval", type=float, default=15.0, help="seconds between catalog polls")
+    parser.add_argument("--window", type=float, default=60.0, help="seconds of samples used for the ETA")
+    args = parser.parse_args()
+
+    recorder = SupplyRecorder(args.file, read_only=True)
+    backtest = Backtest(recorder, args.quantity, args.send_time, args.interval, args.window)
+    drops = backtest.drops()
+    if not drops:
+        print(f"No supply samples in {args.file}")
+        return
+
+    totals = {strategy: 0 for strategy in STRATEGIES}
+    for drop in drops:
+        results = {strategy: backtest.run(strategy, drop) for strategy in STRATEGIES}
+        for strategy, secured in results.items():
+            totals[strategy] += secured
+        print(f"Drop of {len(drop)} gifts: " + ", ".join(f"{strategy} {secured}" for strategy, secured in results.items()))
+
+    print("Total gifts secured: " + ", ".join(f"{strategy} {secured}" for strategy, secured in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
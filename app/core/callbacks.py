@@ -1,66 +1,126 @@
-import asyncio
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
 from pyrogram import Client
 
+from app.balance import balance_ledger
+from app.core.catalog_diff import CatalogEvent
+from app.core.planner import plan_purchases, split_units
+from app.core.gift_rules import NO_RANGE, Verdict
+from app.core.purchase_queue import PurchaseJob, gift_priority, purchase_queue
+from app.core.sold_out import sold_out_registry
+from app.journal import purchase_journal
 from app.notifications import send_notification
-from app.purchase import buy_gift
 from app.utils.logger import warn, info
+from app.utils.tracing import current_trace, mark
 from data.config import t
-from app.core.user_config import UserConfig
+from app.core.user_config import PRIORITIZE_SELLOUT_ETA, UserConfig
 
 
 class GiftProcessor:
     @staticmethod
-    async def evaluate_gift(gift_data: Dict[str, Any], user_config: UserConfig) -> tuple[bool, Dict[str, Any]]:
-        gift_price = gift_data.get("price", 0)
-        is_limited = gift_data.get("is_limited", False)
-        is_sold_out = gift_data.get("is_sold_out", False)
-        is_upgradable = "upgrade_price" in gift_data
-        total_amount = gift_data.get("total_amount", 0) if is_limited else 0
+    def evaluate_gift(gift_data: Dict[str, Any], verdict: Verdict) -> tuple[bool, Dict[str, Any]]:
+        if verdict.eligible:
+            return True, {"quantity": verdict.quantity, "recipients": verdict.recipients,
+                          "range_index": verdict.range_index}
 
-        exclusion_rules = {
-            'sold_out': lambda: is_sold_out,
-            'non_limited_blocked': lambda: not is_limited,
-            'non_upgradable_blocked': lambda: user_config.purchase_only_upgradable_gifts and not is_upgradable
-        }
-
-        failed_rule = next((rule for rule, condition in exclusion_rules.items() if condition()), None)
-
-        return (False, {'exclusion_reason': failed_rule}) if failed_rule else \
-            GiftProcessor._evaluate_range_match(gift_price, total_amount, user_config)
-
-    @staticmethod
-    def _evaluate_range_match(gift_price: int, total_amount: int, user_config: UserConfig) -> tuple[bool, Dict[str, Any]]:
-        range_matched, quantity, recipients = user_config.get_matching_range(gift_price, total_amount)
-        return (True, {"quantity": quantity, "recipients": recipients}) if range_matched else (
+        return (False, {'exclusion_reason': verdict.reason}) if verdict.reason != NO_RANGE else (
             False, {
                 "range_error": True,
-                "gift_price": gift_price,
-                "total_amount": total_amount
+                "gift_price": gift_data.get("price", 0),
+                "total_amount": gift_data.get("total_amount", 0)
             }
         )
 
 
-async def process_gift(app: Client, gift_data: Dict[str, Any], user_config: UserConfig) -> None:
-    """Process a new gift for a specific user configuration."""
+async def plan_drop(app: Client, prioritized_gifts: List[Tuple[int, dict]], user_config: UserConfig,
+                    verdicts: Dict[int, Verdict]) -> Optional[Dict[int, int]]:
+    """Allocate the balance across all eligible gifts of a drop before any purchase is sent."""
+    candidates = []
+    spending = budget_spending(app, user_config)
+    for gift_id, gift_data in prioritized_gifts:
+        verdict = verdicts[gift_id]
+        if not verdict.eligible:
+            continue
+        units = verdict.quantity * len(verdict.recipients)
+        affordable = user_config.rules.affordable(verdict.range_index, gift_data.get("price", 0), spending)
+        candidates.append({
+            "gift_id": gift_id,
+            "price": gift_data.get("price", 0),
+            "supply": gift_data.get("total_amount", 0),
+            "units": units if affordable is None else min(units, affordable),
+        })
+
+    # A single gift is bought greedily anyway, so skip the balance lookup
+    if len(candidates) < 2:
+        return None
+
+    return plan_purchases(candidates, await balance_ledger(app).current(app))
+
+
+async def process_gift(app: Client, gift_data: Dict[str, Any], user_config: UserConfig,
+                       planned_units: Optional[int] = None, verdict: Optional[Verdict] = None) -> None:
+    """Process a new gift for a specific user configuration, with the drop's verdict when it has one."""
     gift_id = gift_data.get("id")
 
-    is_eligible, processing_data = await GiftProcessor.evaluate_gift(gift_data, user_config)
+    verdict = verdict or user_config.rules.evaluate(gift_data)
+    is_eligible, processing_data = GiftProcessor.evaluate_gift(gift_data, verdict)
+    mark("evaluation", eligible=is_eligible)
 
     return await send_notification(app, gift_id, **processing_data) if not is_eligible and processing_data else \
-        await _distribute_gifts(app, gift_id, processing_data.get("quantity", 1), processing_data.get("recipients", []))
+        await _distribute_gifts(app, gift_data, processing_data.get("quantity", 1), processing_data.get("recipients", []),
+                                user_config, planned_units, processing_data.get("range_index"))
 
 
-async def _distribute_gifts(app: Client, gift_id: int, quantity: int, recipients: list) -> None:
+async def _distribute_gifts(app: Client, gift_data: Dict[str, Any], quantity: int, recipients: list,
+                            user_config: UserConfig, planned_units: Optional[int] = None,
+                            range_index: Optional[int] = None) -> None:
+    """Queue the gift's purchases on the account's priority queue; they are sent in the background."""
+    gift_id, gift_price = gift_data.get("id"), gift_data.get("price")
+    if purchase_journal(app).handled(gift_id):
+        # History was lost before the last run saved it; the journal already sent or resumed these purchases
+        return info(t("console.journal_already_handled", gift_id=gift_id))
+
     info(t("console.processing_gift", gift_id=gift_id, quantity=quantity, recipients_count=len(recipients)))
 
-    for recipient_id in recipients:
-        try:
-            await buy_gift(app, recipient_id, gift_id, quantity)
-        except Exception as ex:
-            warn(t("console.purchase_error", gift_id=gift_id, chat_id=recipient_id))
-            await send_notification(app, gift_id, error_message=str(ex))
-        await asyncio.sleep(0.5)
+    shares = [(recipient_id, quantity) for recipient_id in recipients] if planned_units is None \
+        else split_units(planned_units, quantity, recipients)
+
+    if not shares and recipients:
+        return await _notify_unplanned(app, gift_id, (gift_price or 0) * quantity * len(recipients))
+
+    shares = user_config.rules.trim(range_index, gift_price or 0, shares, budget_spending(app, user_config))
+    if not shares:
+        return info(t("console.budget_exhausted", gift_id=gift_id))
+
+    queue = purchase_queue(app)
+    priority = gift_priority(gift_data, user_config)
+
+    for recipient_id, recipient_quantity in shares:
+        queue.submit(PurchaseJob(priority, gift_id, recipient_id, recipient_quantity, gift_price, current_trace.get(),
+                                 shadow=user_config.shadow, range_index=range_index))
+
+
+def budget_spending(app: Client, user_config: UserConfig) -> Callable[[Optional[int]], int]:
+    """Stars the account's journal counts against the rule budgets of a range, under the current rules."""
+    journal = purchase_journal(app)
+    journal.start_budget(user_config.gift_rules)
+    return lambda range_index: journal.committed(range_index, user_config.shadow)
+
+
+async def record_sold_out(app: Client, user_config: UserConfig, events: List[CatalogEvent]) -> None:
+    """Cancel queued purchases of gifts the catalog now lists as sold out, for every account."""
+    for event in events:
+        sold_out_registry.mark(event.gift_id)
+
+
+async def reprioritize_purchases(app: Client, user_config: UserConfig, events: List[CatalogEvent]) -> None:
+    """Re-rank queued purchases of gifts whose remaining supply moved, when ordering by sell-out ETA."""
+    queue = purchase_queue(app)
+    user_config.prioritization == PRIORITIZE_SELLOUT_ETA and len(queue) and queue.reprioritize(
+        {event.gift_id: gift_priority(event.gift, user_config)[0] for event in events})
 
 
+async def _notify_unplanned(app: Client, gift_id: int, total_price: int) -> None:
+    current_balance = balance_ledger(app).available
+    warn(t("console.plan_skipped", gift_id=gift_id, balance=current_balance))
+    await send_notification(app, gift_id, balance_error=True, gift_price=total_price, current_balance=current_balance)
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pyrogram import Client, types
+
+from app.core.catalog_diff import CatalogDiffer, CatalogEvent
+from app.utils.logger import info, warn, error
+from app.utils.metrics import track_rpc
+from data.config import config
+
+try:
+    import fcntl
+except ImportError:  # Windows has neither flock nor Unix sockets
+    fcntl = None
+
+# Largest message line accepted; a full catalog is a few hundred KB at most
+MESSAGE_LIMIT = 16 * 1024 * 1024
+# Bytes queued for a subscriber before it is skipped and left to resync
+MAX_BACKLOG = 4 * 1024 * 1024
+
+Catalog = Tuple[int, List[Any]]
+
+
+class CatalogBus:
+    """Shares one catalog poller between every bot process on the host over a Unix socket.
+
+    The process holding the lock next to the socket is elected publisher: it polls
+    ``get_available_gifts`` every ``interval`` seconds with one of its connected
+    clients and sends every poll, numbered by ``seq``, to the others as a JSON line
+    holding the gift order and only the gifts that changed. A subscriber that sees a
+    gap in ``seq`` asks for a full snapshot, which is also what it gets on connect.
+    When the publisher exits or has no connected account left to poll with, its
+    subscribers elect a new one; a process without accounts never stands. Monitors
+    read the latest catalog with ``fetch``, and poll themselves while the bus is not
+    connected or, after it stayed silent for ``stale_after`` seconds, until it
+    publishes again.
+    """
+
+    def __init__(self, socket_path: str = "data/bus/catalog.sock", interval: float = 5.0, enabled: bool = False):
+        self.socket_path = Path(socket_path)
+        self.interval = interval
+        self.stale_after = max(30.0, 5 * interval)
+        self.enabled = enabled and fcntl is not None and hasattr(asyncio, "start_unix_server")
+        self.publisher = False
+        self.following = False
+        self.seq = 0
+        self.gifts: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+        self._clients: "weakref.WeakSet[Client]" = weakref.WeakSet()
+        self._turn = 0
+        self._silent = False
+        self._subscribers: Set[asyncio.StreamWriter] = set()
+        self._lock_file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Join the bus in the background, as publisher or subscriber."""
+        if not self.enabled or (self._task and not self._task.done()):
+            return
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self._close_server()
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def fetch(self, app: Client, after: int = 0) -> Catalog:
+        """The first catalog newer than ``after`` as (seq, gifts in Telegram's order)."""
+        self._clients.add(app)
+        if self.seq <= after and (self._silent or not (self.publisher or self.following)):
+            return after, await self._poll(app)
+
+        while self.seq <= after:
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), self.stale_after)
+            except asyncio.TimeoutError:
+                # Poll directly from now on; the next catalog on the bus ends this
+                self._silent or warn(f"No catalog on the bus for {self.stale_after:.0f}s, polling directly")
+                self._silent = True
+                return after, await self._poll(app)
+        return self.seq, self.gifts
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self._connected_clients():
+                    # No monitor here yet, so nothing to poll with or to follow the bus for
+                    pass
+                elif self._elect():
+                    try:
+                        await self._publish_loop()
+                    finally:
+                        # Closed already when the bus is stopping
+                        self._lock_file and fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    await self._subscribe()
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, FileNotFoundError, ValueError) as ex:
+                # Publisher gone or not listening yet; run the election again
+                warn(f"Catalog bus connection lost: {str(ex)}")
+            except Exception as ex:
+                error(f"Catalog bus error: {str(ex)}")
+            await self._close_server()
+            await asyncio.sleep(1.0)
+
+    def _elect(self) -> bool:
+        if self._lock_file is None:
+            self._lock_file = self.socket_path.with_suffix(".lock").open("a")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def _publish_loop(self) -> None:
+        # Held by us, so a socket file left behind is stale
+        self.socket_path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve, path=str(self.socket_path), limit=MESSAGE_LIMIT)
+        self.publisher = True
+        info("Catalog bus: polling the catalog for every process on this host")
+
+        # Continue the numbering of the previous publisher and of earlier runs; seq only moves on a poll,
+        # so monitors never mistake the empty catalog of a fresh publisher for a real one
+        seq = max(self.seq, int(time.time() * 1000))
+        differ = CatalogDiffer()
+        differ.seed(self.gifts)
+
+        while True:
+            clients = self._connected_clients()
+            if not clients:
+                # Every account here stopped: hand the lock to a process that can still poll
+                info("Catalog bus: no connected account left, stepping down as poller")
+                return
+            self._turn = (self._turn + 1) % len(clients)
+            try:
+                gifts = await self._poll(clients[self._turn])
+                seq += 1
+                self._publish(differ, gifts, seq)
+            except Exception as ex:
+                warn(f"Catalog bus poll failed: {str(ex)}")
+            await asyncio.sleep(self.interval)
+
+    def _connected_clients(self) -> List[Client]:
+        return [client for client in self._clients if client.is_connected]
+
+    def _publish(self, differ: CatalogDiffer, gifts: List[types.Gift], seq: int) -> None:
+        events = differ.diff(gifts)
+        changed = {event.gift_id: event.gift for event in events if event.kind != CatalogEvent.REMOVED}
+        self._update(seq, list(differ.gifts.values()))
+
+        line = self._encode(list(changed.values()))
+        for writer in list(self._subscribers):
+            if writer.is_closing():
+                self._subscribers.discard(writer)
+            elif writer.transport.get_write_buffer_size() < MAX_BACKLOG:
+                writer.write(line)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(self._encode(self.gifts, full=True))
+        self._subscribers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                json.loads(line).get("resync") and writer.write(self._encode(self.gifts, full=True))
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            # Subscriber gone, garbled, or the publisher is shutting down
+            pass
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    async def _subscribe(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(str(self.socket_path), limit=MESSAGE_LIMIT)
+        info("Catalog bus: following the elected poller")
+        resyncing = False
+        self.following = True
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("publisher closed the bus")
+
+                message = json.loads(line)
+                if message.get("full"):
+                    resyncing = False
+                    self._update(message["seq"], message["gifts"])
+                elif not resyncing and message["seq"] > self.seq:
+                    gifts = self._apply(message) if message["seq"] == self.seq + 1 else None
+                    if gifts is None:
+                        # Missed an update (or joined mid-stream): ask for a snapshot, skip deltas until then
+                        resyncing = True
+                        writer.write(b'{"resync": true}\n')
+                    else:
+                        self._update(message["seq"], gifts)
+        finally:
+            self.following = False
+            writer.close()
+
+    def _apply(self, message: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        gifts = {gift["id"]: gift for gift in self.gifts}
+        gifts.update((gift["id"], gift) for gift in message["gifts"])
+        if any(gift_id not in gifts for gift_id in message["ids"]):
+            return None
+        return [gifts[gift_id] for gift_id in message["ids"]]
+
+    def _update(self, seq: int, gifts: List[Dict[str, Any]]) -> None:
+        self.seq, self.gifts = seq, gifts
+        self._silent = False
+        # Wake every monitor waiting for this catalog; later waiters get a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _encode(self, gifts: List[Dict[str, Any]], full: bool = False) -> bytes:
+        message = {"seq": self.seq, "ids": [gift["id"] for gift in self.gifts], "gifts": gifts}
+        full and message.update(full=True)
+        return (json.dumps(message, ensure_ascii=False) + "\n").encode()
+
+    async def _close_server(self) -> None:
+        self.publisher = False
+        for writer in list(self._subscribers):
+            writer.close()
+        self._subscribers.clear()
+        if self._server:
+            self._server.close()
+            self._server = None
+
+    @staticmethod
+    async def _poll(app: Client) -> List[types.Gift]:
+        async with track_rpc("get_available_gifts"):
+            return await app.get_available_gifts()
+
+
+catalog_bus = CatalogBus(config.BUS_SOCKET, config.BUS_INTERVAL, config.BUS_ENABLED)
@@ -0,0 +1,145 @@
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pyrogram import types
+
+# Gift fields that make up its content hash; other fields never produce events
+TRACKED_FIELDS = ("price", "total_amount", "available_amount", "is_sold_out", "upgrade_price")
+
+
+class CatalogEvent:
+    """A change of one gift between two consecutive catalog polls."""
+
+    ADDED = "added"
+    REMOVED = "removed"
+    SOLD_OUT = "sold_out"
+    SUPPLY_CHANGED = "supply_changed"
+    PRICE_CHANGED = "price_changed"
+
+    def __init__(self, kind: str, gift_id: int, gift: Dict[str, Any], previous: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.gift_id = gift_id
+        self.gift = gift
+        self.previous = previous
+
+    def __repr__(self) -> str:
+        return f"CatalogEvent({self.kind}, {self.gift_id})"
+
+
+class CatalogDiffer:
+    """Keeps the previous catalog in memory and reports what changed on each poll.
+
+    Every gift is reduced to a hash of ``TRACKED_FIELDS`` read straight from the
+    Pyrogram object; only gifts whose hash changed are serialized and compared field
+    by field, unchanged ones reuse the dict from the previous poll.
+    """
+
+    def __init__(self):
+        self._snapshot: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+
+    @property
+    def gifts(self) -> Dict[int, Dict[str, Any]]:
+        """The current catalog as dicts, in Telegram's order."""
+        return {gift_id: gift for gift_id, (_, gift) in self._snapshot.items()}
+
+    @property
+    def gift_ids(self) -> List[int]:
+        return list(self._snapshot)
+
+    @staticmethod
+    def fingerprint(gift: Any) -> int:
+        read = gift.get if isinstance(gift, dict) else lambda field, default: getattr(gift, field, default)
+        return hash(tuple(read(field, None) for field in TRACKED_FIELDS))
+
+    @staticmethod
+    def to_dict(gift: Any) -> Dict[str, Any]:
+        # Dicts may be shared with other monitors (catalog bus), so keep a copy to annotate
+        return dict(gift) if isinstance(gift, dict) else \
+            json.loads(json.dumps(gift, default=types.Object.default, ensure_ascii=False))
+
+    def seed(self, gifts: Iterable[Dict[str, Any]]) -> None:
+        """Start from a stored catalog instead of treating every gift as added."""
+        self._snapshot = {gift["id"]: (self.fingerprint(gift), gift) for gift in gifts}
+
+    def diff(self, gifts: Iterable[Any]) -> List[CatalogEvent]:
+        """Replace the snapshot with ``gifts`` (Pyrogram objects or dicts) and return the changes."""
+        events: List[CatalogEvent] = []
+        current: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+
+        for gift in gifts:
+            gift_id = gift["id"] if isinstance(gift, dict) else gift.id
+            fingerprint = self.fingerprint(gift)
+            previous = self._snapshot.get(gift_id)
+
+            if previous and previous[0] == fingerprint:
+                current[gift_id] = previous
+                continue
+
+            data = self.to_dict(gift)
+            current[gift_id] = (fingerprint, data)
+            events.extend(self._changes(gift_id, data, previous[1] if previous else None))
+
+        events.extend(
+            CatalogEvent(CatalogEvent.REMOVED, gift_id, self._snapshot[gift_id][1])
+            for gift_id in self._snapshot.keys() - current.keys()
+        )
+        self._snapshot = current
+        return events
+
+    @staticmethod
+    def _changes(gift_id: int, gift: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> List[CatalogEvent]:
+        if previous is None:
+            return [CatalogEvent(CatalogEvent.ADDED, gift_id, gift)]
+
+        changes = {
+            CatalogEvent.SOLD_OUT: gift.get("is_sold_out", False) and not previous.get("is_sold_out", False),
+            CatalogEvent.PRICE_CHANGED: gift.get("price") != previous.get("price"),
+            CatalogEvent.SUPPLY_CHANGED: (gift.get("available_amount"), gift.get("total_amount")) !=
+                                         (previous.get("available_amount"), previous.get("total_amount")),
+        }
+        return [CatalogEvent(kind, gift_id, gift, previous) for kind, changed in changes.items() if changed]
+
+
+class CatalogSnapshot:
+    """The catalog most recently seen by any monitor in this process, to start new users from.
+
+    Monitors hand in their differ after every poll, which costs nothing; the gifts
+    are only copied out when a user without history starts.
+    """
+
+    def __init__(self):
+        self._differ: Optional[CatalogDiffer] = None
+        self.updated_at = 0.0
+
+    def publish(self, differ: CatalogDiffer) -> None:
+        self._differ = differ
+        self.updated_at = time.time()
+
+    def gifts(self, max_age: float) -> Optional[List[Dict[str, Any]]]:
+        """The shared catalog, or None when no monitor has polled within ``max_age`` seconds."""
+        if self._differ is None or time.time() - self.updated_at > max_age:
+            return None
+        return list(self._differ.gifts.values())
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+Subscriber = Callable[..., Awaitable[Any]]
+
+
+class CatalogFeed:
+    """Dispatches each poll's events to the subscribers of their kinds, in subscription order."""
+
+    def __init__(self):
+        self._subscribers: List[Tuple[frozenset, Subscriber]] = []
+
+    def subscribe(self, handler: Subscriber, *kinds: str) -> None:
+        self._subscribers.append((frozenset(kinds), handler))
+
+    async def publish(self, events: List[CatalogEvent], *args) -> None:
+        """Call every subscriber with ``*args`` and the events it asked for, if there are any."""
+        for kinds, handler in self._subscribers:
+            selected = [event for event in events if event.kind in kinds]
+            selected and await handler(*args, selected)
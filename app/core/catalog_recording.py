@@ -0,0 +1,62 @@
+import gzip
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.catalog_diff import CatalogDiffer, CatalogEvent
+from app.utils.tracing import TraceWriter
+from data.config import config
+
+RecordedCatalog = Tuple[float, List[Dict[str, Any]]]
+
+
+class CatalogRecorder:
+    """Appends every catalog response to a JSON lines file for ``app.core.replay``.
+
+    Each line holds the poll time ``t`` in ms. The first line a process writes has the
+    full catalog; later ones only the gift order ``ids`` and the ``gifts`` that changed,
+    and neither when nothing did, so an idle catalog costs a few bytes per poll.
+    """
+
+    def __init__(self, writer: TraceWriter, enabled: bool = False):
+        self.writer = writer
+        self.enabled = enabled
+        self._differ: Optional[CatalogDiffer] = None
+        self._last: Optional[List[Any]] = None
+
+    def record(self, gifts: List[Any]) -> None:
+        # Monitors sharing a bus catalog hand in the same list; it is recorded once
+        if not self.enabled or gifts is self._last:
+            return
+        self._last = gifts
+
+        record: Dict[str, Any] = {"t": int(time.time() * 1000)}
+        if self._differ is None:
+            self._differ = CatalogDiffer()
+            self._differ.diff(gifts)
+            record.update(ids=self._differ.gift_ids, gifts=list(self._differ.gifts.values()), full=True)
+        else:
+            previous_ids = self._differ.gift_ids
+            events = self._differ.diff(gifts)
+            changed = [event.gift for event in events if event.kind != CatalogEvent.REMOVED]
+            (changed or self._differ.gift_ids != previous_ids) and record.update(ids=self._differ.gift_ids,
+                                                                                 gifts=changed)
+        self.writer.emit([record])
+
+
+def read_recording(file_path: str) -> Iterator[RecordedCatalog]:
+    """Recorded catalogs as (seconds since the epoch, gifts in Telegram's order); ``.gz`` files are read too."""
+    opener = gzip.open if file_path.endswith(".gz") else open
+    gifts: Dict[int, Dict[str, Any]] = {}
+    ids: List[int] = []
+    with opener(file_path, "rt", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get("full"):
+                gifts = {}
+            gifts.update((gift["id"], gift) for gift in record.get("gifts", ()))
+            ids = record.get("ids", ids)
+            yield record["t"] / 1000, [gifts[gift_id] for gift_id in ids]
+
+
+catalog_recorder = CatalogRecorder(TraceWriter(config.REPLAY_FILE), config.REPLAY_RECORD)
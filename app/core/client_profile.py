@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import gc
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from pyrogram import Client
+
+from app.utils.metrics import rss_bytes
+from data.config import config
+
+PROFILE_FULL = "full"
+PROFILE_LEAN = "lean"
+
+# Client options per profile. User accounts only poll the catalog and buy, so the lean one
+# asks Telegram not to push updates, skips the update handler tasks and keeps small caches
+PROFILES: Dict[str, Dict[str, Any]] = {
+    PROFILE_FULL: {},
+    PROFILE_LEAN: {
+        "no_updates": True,
+        "workers": 1,
+        "max_message_cache_size": 100,
+        "max_business_user_connection_cache_size": 10,
+    },
+}
+
+
+def client_options(profile: str) -> Dict[str, Any]:
+    return dict(PROFILES.get(profile, PROFILES[PROFILE_FULL]))
+
+
+async def _start_clients(profile: str, user_ids: List[int], offline: int, workdir: str) -> List[Client]:
+    """Start real accounts through the session store, or build ``offline`` unconnected clients."""
+    if offline:
+        clients = []
+        for index in range(offline):
+            # Session files of the full profile are SQLite files, as they would be on disk
+            client = Client(f"measure_{index}", api_id=1, api_hash="0" * 32, workdir=workdir,
+                            in_memory=profile == PROFILE_LEAN, **client_options(profile))
+            await client.storage.open()
+            await client.dispatcher.start()
+            clients.append(client)
+        return clients
+
+    from app.core.session_store import SessionStore
+    from app.core.user_config import UserConfig
+    from app.database import UserConfigManager
+
+    manager = UserConfigManager()
+    rows = [await manager.get_user_config(user_id) for user_id in user_ids] if user_ids else \
+        await manager.get_active_users()
+    store = SessionStore(None, config.SESSION_STORAGE, profile=profile)
+    clients = []
+    for row in filter(None, rows):
+        client = await store.create_client(UserConfig(row))
+        await client.start()
+        clients.append(client)
+    return clients
+
+
+async def measure(profile: str, user_ids: List[int], seconds: float, offline: int) -> Dict[str, float]:
+    """RSS and idle CPU attributable to each account started with ``profile``."""
+    with tempfile.TemporaryDirectory() as workdir:
+        gc.collect()
+        rss_before = rss_bytes()
+        clients = await _start_clients(profile, user_ids, offline, workdir)
+        try:
+            gc.collect()
+            cpu_before = time.process_time()
+            await asyncio.sleep(seconds)
+            cpu = time.process_time() - cpu_before
+            rss = rss_bytes() - rss_before
+        finally:
+            for client in clients:
+                if client.is_connected:
+                    await client.stop()
+                else:
+                    await client.dispatcher.stop()
+                    await client.storage.close()
+
+    accounts = max(1, len(clients))
+    return {"accounts": len(clients), "rss_mb": rss / accounts / 2 ** 20,
+            "cpu_percent": cpu / seconds / accounts * 100}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure memory and idle CPU per account for client profiles")
+    parser.add_argument("--profile", choices=(PROFILE_FULL, PROFILE_LEAN, "both"), default="both")
+    parser.add_argument("--users", default="", help="comma-separated user ids (default: all active users)")
+    parser.add_argument("--offline", type=int, default=0,
+                        help="build this many unconnected clients instead of logging real accounts in")
+    parser.add_argument("--seconds", type=float, default=60.0, help="idle time to measure CPU over")
+    args = parser.parse_args()
+
+    if args.profile == "both":
+        # A fresh process per profile, so one run's memory does not count towards the other
+        for profile in (PROFILE_FULL, PROFILE_LEAN):
+            subprocess.run([sys.executable, "-m", "app.core.client_profile", "--profile", profile,
+                            "--users", args.users, "--offline", str(args.offline), "--seconds", str(args.seconds)],
+                           check=False)
+        return
+
+    user_ids = [int(user_id) for user_id in args.users.split(",") if user_id.strip()]
+    result = asyncio.run(measure(args.profile, user_ids, args.seconds, args.offline))
+    print(f"{args.profile}: {result['accounts']} accounts, {result['rss_mb']:.2f} MB RSS and "
+          f"{result['cpu_percent']:.3f}% idle CPU per account")
+
+
+if __name__ == "__main__":
+    main()
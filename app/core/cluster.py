@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.supervisor import QUARANTINED, RUNNING, STOPPED
+from app.database import LeaseManager, SQLiteLeaseManager
+from app.utils.logger import info, warn, error
+from data.config import config
+
+# Seconds before a user whose bot failed to start is tried again
+START_RETRY_DELAY = 60.0
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def create_lease_store(store: str = "database", file_path: str = "data/cluster.db"):
+    return SQLiteLeaseManager(file_path) if store == "sqlite" else LeaseManager()
+
+
+class HashRing:
+    """Consistent hashing of user ids onto node ids, with ``replicas`` points per node.
+
+    When a node joins or leaves, only the users on its arcs of the ring move.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 64):
+        self.nodes = sorted(nodes)
+        self._points = sorted((self._hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def owner(self, user_id: int) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(str(user_id))) % len(self._points)
+        return self._points[index][1]
+
+
+class ClusterCoordinator:
+    """Splits the active users between bot instances sharing one lease store.
+
+    Every ``interval`` seconds the node heartbeats, renews the leases of the users it
+    runs and reconciles against the hash ring of live nodes: users that moved to
+    another node are stopped and released, users assigned to this node are started
+    once their lease can be taken. A node that dies stops heartbeating; after ``ttl``
+    seconds it drops off the ring and its leases expire, so its users move to the
+    survivors. A node that cannot reach the store stops its own users before its
+    leases can expire, so no user is ever run by two nodes.
+    """
+
+    def __init__(self, manager, leases, node_id: Optional[str] = None, ttl: float = 30.0, interval: float = 10.0):
+        if ttl <= 2 * interval:
+            # Users are fenced once their leases are within two heartbeats of expiring
+            raise ValueError(f"Cluster LEASE_TTL ({ttl:g}s) must be more than twice HEARTBEAT_INTERVAL ({interval:g}s)")
+        self.manager = manager
+        self.leases = leases
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        self.interval = interval
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.ring = HashRing([self.node_id])
+        self._renewed_at = time.monotonic()
+        self._retry_at: Dict[int, float] = {}
+        self._starts: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, user_data: Dict[str, Any]) -> None:
+        """Follow an active config row, or forget a deactivated one."""
+        if user_data.get('is_active'):
+            self.users[user_data['user_id']] = user_data
+            self._retry_at.pop(user_data['user_id'], None)
+        else:
+            self.users.pop(user_data['user_id'], None)
+
+    def owns(self, user_id: int) -> bool:
+        return self.ring.owner(user_id) == self.node_id
+
+    async def claim(self, user_id: int) -> bool:
+        """Whether this node may run the user: it is assigned here and the lease was taken."""
+        return self.owns(user_id) and await self.leases.acquire(user_id, self.node_id, self.ttl)
+
+    async def release(self, user_id: int) -> None:
+        await self.leases.release(user_id, self.node_id)
+
+    def start(self) -> None:
+        """Start heartbeating and reconciling in the background."""
+        if self._task and not self._task.done():
+            return
+        info(f"Cluster node {self.node_id} joining with {len(self.users)} active users")
+        self._renewed_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop reconciling and hand every user over to the other nodes."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.leases.leave(self.node_id)
+
+    async def _run(self) -> None:
+        # Announce this node first, so nodes starting together split the users instead of racing for them
+        await self.leases.heartbeat(self.node_id, self.ttl)
+        await asyncio.sleep(self.interval)
+
+        while True:
+            try:
+                await self.tick()
+            except Exception as ex:
+                error(f"Cluster coordinator error: {str(ex)}")
+            await asyncio.sleep(self.interval)
+
+    async def tick(self) -> None:
+        # Leases run from when the renewal was sent, not from when its reply arrived
+        sent_at = time.monotonic()
+        nodes = await self.leases.heartbeat(self.node_id, self.ttl)
+        held = set(self.manager.active_clients) | set(self.manager._starting)
+        renewed = await self.leases.renew(self.node_id, list(held), self.ttl) if held and nodes is not None else set()
+        now = time.monotonic()
+
+        if nodes is None or renewed is None:
+            # The next tick can come a full interval late, after the leases expired; fence on the last safe one
+            if held and now - self._renewed_at >= self.ttl - 2 * self.interval:
+                warn(f"Lease store unreachable for {now - self._renewed_at:.0f}s, stopping {len(held)} users")
+                for user_id in list(self.manager.active_clients):
+                    await self.manager.stop_user_bot(user_id)
+            return
+        self._renewed_at = sent_at
+
+        if nodes != self.ring.nodes:
+            info(f"Cluster nodes: {', '.join(nodes) or self.node_id}")
+            self.ring = HashRing(nodes or [self.node_id])
+
+        for user_id in list(self.manager.active_clients):
+            if user_id not in renewed:
+                warn(f"Lease on user {user_id} was taken over, stopping bot")
+                await self.manager.stop_user_bot(user_id)
+            elif not self.owns(user_id):
+                info(f"User {user_id} moved to node {self.ring.owner(user_id)}, handing over")
+                await self.manager.stop_user_bot(user_id)
+
+        for user_id, user_data in list(self.users.items()):
+            if (not self.owns(user_id) or user_id in held or self._retry_at.get(user_id, 0) > now
+                    or self.manager.get_user_health(user_id) == QUARANTINED):
+                continue
+            # A lease still held by the previous owner is retried on the next tick, not after a failed start
+            if not await self.claim(user_id):
+                continue
+            self._retry_at[user_id] = now + START_RETRY_DELAY
+            # Started concurrently so slow logins cannot delay the next heartbeat
+            start = asyncio.create_task(self.manager.start_user_bot(user_id, user_data))
+            self._starts.add(start)
+            start.add_done_callback(self._starts.discard)
+
+
+class SimulatedManager:
+    """Stands in for MultiUserManager in ``simulate``: running a user only marks it as running."""
+
+    def __init__(self):
+        self.active_clients: Dict[int, bool] = {}
+        self._starting: set = set()
+        self.cluster: Optional[ClusterCoordinator] = None
+
+    async def start_user_bot(self, user_id: int, user_data: Optional[Dict] = None, supervised: bool = False):
+        if user_id not in self.active_clients and await self.cluster.claim(user_id):
+            self.active_clients[user_id] = True
+
+    async def stop_user_bot(self, user_id: int):
+        self.active_clients.pop(user_id, None) and await self.cluster.release(user_id)
+
+    def get_user_health(self, user_id: int) -> str:
+        return RUNNING if user_id in self.active_clients else STOPPED
+
+
+async def simulate(args: argparse.Namespace) -> None:
+    manager = SimulatedManager()
+    manager.cluster = ClusterCoordinator(manager, create_lease_store(args.store, args.file), args.node,
+                                         args.ttl, args.interval)
+    for user_id in range(1, args.users + 1):
+        manager.cluster.track({'user_id': user_id, 'is_active': True})
+
+    manager.cluster.start()
+    try:
+        while True:
+            await asyncio.sleep(args.interval)
+            print(f"{manager.cluster.node_id}: running {len(manager.active_clients)} of {args.users} users, "
+                  f"nodes {', '.join(manager.cluster.ring.nodes)}")
+    finally:
+        await manager.cluster.stop()
+
+
+async def status(args: argparse.Namespace) -> None:
+    leases = await create_lease_store(args.store, args.file).get_leases()
+    per_node: Dict[str, int] = {}
+    for lease in leases:
+        per_node[lease['node_id']] = per_node.get(lease['node_id'], 0) + 1
+    print(f"{len(leases)} leases")
+    for node_id, count in sorted(per_node.items()):
+        print(f"  {node_id}: {count} users")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or simulate user partitioning between bot instances")
+    parser.add_argument("command", choices=("status", "simulate"))
+    parser.add_argument("--store", choices=("database", "sqlite"), default=config.CLUSTER_LEASE_STORE)
+    parser.add_argument("--file", default=config.CLUSTER_SQLITE_FILE, help="SQLite lease store")
+    parser.add_argument("--node", default=None, help="node id (default: host-pid)")
+    parser.add_argument("--users", type=int, default=100, help="simulated active users")
+    parser.add_argument("--ttl", type=float, default=config.CLUSTER_LEASE_TTL)
+    parser.add_argument("--interval", type=float, default=config.CLUSTER_HEARTBEAT_INTERVAL)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(simulate(args) if args.command == "simulate" else status(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
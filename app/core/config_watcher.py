@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.utils.logger import info, error
+
+# Seconds re-read before the cursor: updated_at is when a write's transaction started,
+# so a row can commit after one with a later updated_at was already read
+OVERLAP = 10.0
+
+
+class ConfigWatcher:
+    """Follows the user_configs change feed and applies changes to running user bots.
+
+    The pinned supabase-py client has no realtime channel support, so changes are
+    picked up by polling on ``updated_at``. Every poll re-reads ``OVERLAP`` seconds
+    before the newest change seen and skips the (user, updated_at) versions already
+    applied, so late commits are not lost.
+    """
+
+    def __init__(self, manager, interval: float = 5.0):
+        self.manager = manager
+        self.interval = interval
+        self._cursor: Optional[str] = None
+        self._applied: Dict[int, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start following config changes in the background."""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop following config changes."""
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        self._cursor = await self.manager.user_config_manager.get_latest_update_time()
+        # Rows in the first overlap were loaded at startup already; only later versions are changes
+        await self.poll_once(apply=False)
+        info(f"Watching user config changes every {self.interval}s")
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+            except Exception as ex:
+                error(f"Config watcher error: {str(ex)}")
+
+    async def poll_once(self, apply: bool = True) -> None:
+        """Fetch config rows changed since the last poll and apply them (or only note them as seen)."""
+        since = self._cursor and (self._parse(self._cursor) - timedelta(seconds=OVERLAP)).isoformat()
+        changed = await self.manager.user_config_manager.get_configs_updated_since(since)
+
+        for user_data in changed:
+            updated_at = user_data.get('updated_at')
+            if updated_at and self._applied.get(user_data['user_id']) == updated_at:
+                continue
+            if updated_at:
+                self._applied[user_data['user_id']] = updated_at
+                if self._cursor is None or self._parse(updated_at) > self._parse(self._cursor):
+                    self._cursor = updated_at
+            if not apply:
+                continue
+            try:
+                await self.manager.apply_config_change(user_data)
+            except Exception as ex:
+                error(f"Failed to apply config change for user {user_data.get('user_id')}: {str(ex)}")
+
+    @staticmethod
+    def _parse(timestamp: str) -> datetime:
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
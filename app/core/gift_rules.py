@@ -0,0 +1,161 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.sold_out import sold_out_registry
+
+# Why a gift is not bought; the first three are also the skip categories of the summary message
+SOLD_OUT = "sold_out"
+NON_LIMITED = "non_limited_blocked"
+NON_UPGRADABLE = "non_upgradable_blocked"
+DENIED = "denied"
+UPGRADE_TOO_EXPENSIVE = "upgrade_too_expensive"
+NO_RANGE = "no_range"
+
+SKIP_COUNTERS = {SOLD_OUT: 'sold_out_count', NON_LIMITED: 'non_limited_count',
+                 NON_UPGRADABLE: 'non_upgradable_count'}
+
+RULE_SYNTAX = (
+    "`allow <gift_id>,...` - buy only these gifts\n"
+    "`deny <gift_id>,...` - never buy these gifts\n"
+    "`max_upgrade <stars>` - skip gifts whose upgrade costs more\n"
+    "`budget <stars>` - stop buying once this much is spent or queued (counted since the rules changed)\n"
+    "Prefix a rule with `range <n>` to apply it to your n-th gift range only."
+)
+
+_RULE = re.compile(r"^(?:range\s+(\d+)\s+)?(allow|deny|max_upgrade|budget)\s+(.+)$", re.IGNORECASE)
+
+
+class Verdict:
+    """Outcome of evaluating one gift: the matched range, or the reason it is skipped."""
+
+    __slots__ = ("eligible", "reason", "range_index", "quantity", "recipients")
+
+    def __init__(self, eligible: bool, reason: Optional[str] = None, range_index: Optional[int] = None,
+                 quantity: int = 0, recipients: Optional[List] = None):
+        self.eligible = eligible
+        self.reason = reason
+        self.range_index = range_index
+        self.quantity = quantity
+        self.recipients = recipients or []
+
+
+class RuleScope:
+    """Rules applying to every range (``index`` None) or to one gift range."""
+
+    def __init__(self):
+        self.allow: Optional[set] = None
+        self.deny: set = set()
+        self.max_upgrade: Optional[int] = None
+        self.budget: Optional[int] = None
+
+
+def parse_rules(text: str, range_count: int) -> Dict[Optional[int], RuleScope]:
+    """Parse rule lines (or ``;``-separated rules) into scopes; raises ValueError naming the bad rule."""
+    scopes: Dict[Optional[int], RuleScope] = {}
+    for line in re.split(r"[;\n]", text or ""):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        match = _RULE.match(line)
+        if not match:
+            raise ValueError(f"unknown rule `{line}`")
+        range_number, keyword, argument = match.groups()
+        index = int(range_number) - 1 if range_number else None
+        if index is not None and not 0 <= index < range_count:
+            raise ValueError(f"`{line}`: there is no gift range {range_number}")
+
+        scope = scopes.setdefault(index, RuleScope())
+        keyword = keyword.lower()
+        try:
+            if keyword in ("allow", "deny"):
+                ids = {int(gift_id) for gift_id in argument.replace(" ", "").split(",") if gift_id}
+                scope.deny.update(ids) if keyword == "deny" else \
+                    setattr(scope, "allow", (scope.allow or set()) | ids)
+            else:
+                setattr(scope, keyword, int(argument))
+        except ValueError:
+            raise ValueError(f"`{line}`: expected numbers") from None
+
+    return scopes
+
+
+class GiftRules:
+    """Gift ranges and filter rules of one user, compiled into a single evaluation closure.
+
+    ``evaluate`` checks a gift in one pass: sold out, limited, upgradable, the global
+    allow/deny lists and upgrade cap, then the first range it fits whose own rules
+    let it through. Budgets are checked against ``committed``: stars the account's
+    purchase journal shows as sent, plus those still queued, since the rules last
+    changed, so they hold across reloads and restarts.
+    """
+
+    def __init__(self, gift_ranges: List[Dict[str, Any]], text: str = "", upgradable_only: bool = False):
+        self.text = text
+        self.scopes = parse_rules(text, len(gift_ranges))
+        self.evaluate: Callable[[Dict[str, Any]], Verdict] = self._compile(gift_ranges, upgradable_only)
+
+    def _compile(self, gift_ranges: List[Dict[str, Any]], upgradable_only: bool) -> Callable[[Dict[str, Any]], Verdict]:
+        scope = self.scopes.get(None, RuleScope())
+        allow, deny, max_upgrade = scope.allow, frozenset(scope.deny), scope.max_upgrade
+        ranges: Tuple = tuple(
+            (gift_range['min_price'], gift_range['max_price'], gift_range['supply_limit'], gift_range['quantity'],
+             tuple(gift_range['recipients']), index, self.scopes.get(index))
+            for index, gift_range in enumerate(gift_ranges)
+        )
+        sold_out = sold_out_registry
+
+        def evaluate(gift: Dict[str, Any]) -> Verdict:
+            gift_id = gift.get("id")
+            if gift.get("is_sold_out", False) or gift_id in sold_out:
+                return Verdict(False, SOLD_OUT)
+            if not gift.get("is_limited", False):
+                return Verdict(False, NON_LIMITED)
+            upgrade_price = gift.get("upgrade_price")
+            if upgradable_only and "upgrade_price" not in gift:
+                return Verdict(False, NON_UPGRADABLE)
+            if gift_id in deny or (allow is not None and gift_id not in allow):
+                return Verdict(False, DENIED)
+            if max_upgrade is not None and upgrade_price is not None and upgrade_price > max_upgrade:
+                return Verdict(False, UPGRADE_TOO_EXPENSIVE)
+
+            price, total_amount = gift.get("price", 0), gift.get("total_amount", 0)
+            for min_price, max_price, supply_limit, quantity, recipients, index, rules in ranges:
+                if not (min_price <= price <= max_price and total_amount <= supply_limit):
+                    continue
+                if rules and (gift_id in rules.deny or (rules.allow is not None and gift_id not in rules.allow) or
+                              (rules.max_upgrade is not None and upgrade_price is not None
+                               and upgrade_price > rules.max_upgrade)):
+                    continue
+                return Verdict(True, None, index, quantity, list(recipients))
+            return Verdict(False, NO_RANGE)
+
+        return evaluate
+
+    def affordable(self, range_index: Optional[int], price: int,
+                   committed: Callable[[Optional[int]], int]) -> Optional[int]:
+        """Copies at ``price`` the global and range budgets still allow, or None when unlimited.
+
+        ``committed`` gives the stars already spent or queued in a range (all ranges for None).
+        """
+        if price <= 0:
+            return None
+        limits = [
+            (scope.budget - committed(key)) // price
+            for key in (None, range_index) if (scope := self.scopes.get(key)) and scope.budget is not None
+        ]
+        return max(0, min(limits)) if limits else None
+
+    def trim(self, range_index: Optional[int], price: int, shares: List[Tuple[Any, int]],
+             committed: Callable[[Optional[int]], int]) -> List[Tuple[Any, int]]:
+        """Recipient shares cut down to what the remaining budgets allow."""
+        units = self.affordable(range_index, price, committed)
+        if units is None:
+            return shares
+
+        trimmed = []
+        for recipient, share in shares:
+            share = min(share, units)
+            share and trimmed.append((recipient, share))
+            units -= share
+        return trimmed
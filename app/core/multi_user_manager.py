@@ -1,14 +1,31 @@
 import asyncio
-from typing import Dict, Optional
+import time
+from typing import Any, Dict, Optional
 from pyrogram import Client
-from pathlib import Path
 
-from app.database import UserConfigManager
+from app.database import AuthManager, UserConfigManager
 from app.core.user_config import UserConfig
 from app.core.callbacks import process_gift
-from app.utils.detector import gift_monitoring
-from app.notifications import send_start_message
-from app.utils.logger import info, error, warn
+from app.core.catalog_bus import catalog_bus
+from app.core.cluster import ClusterCoordinator, create_lease_store
+from app.core.config_watcher import ConfigWatcher
+from app.core.purchase_queue import purchase_queue
+from app.core.session_store import SessionStore
+from app.core.supervisor import RUNNING, MonitorSupervisor
+from app.journal import purchase_journal
+from app.core.sold_out import sold_out_registry
+from app.utils.cpu_profiler import MONITOR_TASK_PREFIX
+from app.utils.detector import GiftDetector, gift_monitoring
+from app.notifications import bind_notification_channel, send_start_message
+from app.utils.logger import info, error, warn, log_context
+from app.utils.metrics import (
+    FLOOD_WAITS, FLOOD_WAIT_SECONDS, LAST_POLL_LATENCY, LAST_POLL_TIME, PURCHASES_FAILED, PURCHASES_SUCCEEDED,
+    loop_lag_monitor, rss_bytes
+)
+from data.config import config
+
+# Fields that are bound to the MTProto connection and cannot be swapped in place
+RESTART_FIELDS = ('api_id', 'api_hash', 'phone_number', 'session_file_path')
 
 
 class MultiUserManager:
@@ -19,26 +36,69 @@ class MultiUserManager:
         self.active_clients: Dict[int, Client] = {}
         self.active_tasks: Dict[int, asyncio.Task] = {}
         self.user_configs: Dict[int, UserConfig] = {}
+        self._starting: set = set()
+        # Shared by every monitor: one account's sold-out response cancels the gift for all
+        self.sold_out_registry = sold_out_registry
+        self.config_watcher = ConfigWatcher(self, config.CONFIG_RELOAD_INTERVAL)
+        self.supervisor = MonitorSupervisor(self)
+        self.session_store = SessionStore(self, config.SESSION_STORAGE, config.SESSION_FLUSH_INTERVAL,
+                                          config.CLIENT_PROFILE)
+        # Set when several instances share the users; None runs every active user here
+        self.cluster: Optional[ClusterCoordinator] = ClusterCoordinator(
+            self, create_lease_store(config.CLUSTER_LEASE_STORE, config.CLUSTER_SQLITE_FILE),
+            config.CLUSTER_NODE_ID or None, config.CLUSTER_LEASE_TTL, config.CLUSTER_HEARTBEAT_INTERVAL
+        ) if config.CLUSTER_ENABLED else None
+        self.auth_manager = AuthManager()
+        # Bot API client used to alert admins; set by the application once it exists
+        self.bot_client: Optional[Client] = None
 
     async def start_all_active_users(self):
         """Start bot instances for all active users."""
         active_users = await self.user_config_manager.get_active_users()
+        catalog_bus.start()
         
-        info(f"Starting bots for {len(active_users)} active users")
-        
-        for user_data in active_users:
-            user_id = user_data['user_id']
-            try:
-                await self.start_user_bot(user_id, user_data)
-            except Exception as ex:
-                error(f"Failed to start bot for user {user_id}: {str(ex)}")
+        if self.cluster:
+            # The coordinator starts the users this node owns once it has seen the other nodes
+            for user_data in active_users:
+                self.cluster.track(user_data)
+            self.cluster.start()
+        else:
+            info(f"Starting bots for {len(active_users)} active users")
 
-    async def start_user_bot(self, user_id: int, user_data: Optional[Dict] = None):
-        """Start bot instance for a specific user."""
-        if user_id in self.active_clients:
+            for user_data in active_users:
+                user_id = user_data['user_id']
+                try:
+                    await self.start_user_bot(user_id, user_data)
+                except Exception as ex:
+                    error(f"Failed to start bot for user {user_id}: {str(ex)}")
+
+        self.config_watcher.start()
+        self.supervisor.start()
+        self.session_store.start()
+
+    async def start_user_bot(self, user_id: int, user_data: Optional[Dict] = None, supervised: bool = False):
+        """Start bot instance for a specific user.
+
+        Starts requested by the user or a config change lift a quarantine; ``supervised``
+        marks restarts by the supervisor, which keep counting towards one.
+        """
+        if user_id in self.active_clients or user_id in self._starting:
             warn(f"Bot for user {user_id} is already running")
             return
 
+        supervised or self.supervisor.release(user_id)
+
+        if self.cluster and not await self.cluster.claim(user_id):
+            info(f"User {user_id} belongs to another node, not starting it here")
+            return
+
+        self._starting.add(user_id)
+        try:
+            await self._start_user_bot(user_id, user_data)
+        finally:
+            self._starting.discard(user_id)
+
+    async def _start_user_bot(self, user_id: int, user_data: Optional[Dict] = None):
         if not user_data:
             user_data = await self.user_config_manager.get_user_config(user_id)
             if not user_data:
@@ -52,18 +112,9 @@ class MultiUserManager:
             error(f"Incomplete configuration for user {user_id}")
             return
 
-        # Ensure session directory exists
-        session_dir = Path(user_config.session_file_path).parent
-        session_dir.mkdir(parents=True, exist_ok=True)
-
         try:
-            # Create Pyrogram client
-            client = Client(
-                name=user_config.session_file_path,
-                api_id=user_config.api_id,
-                api_hash=user_config.api_hash,
-                phone_number=user_config.phone_number
-            )
+            # Create Pyrogram client on a session file or a session stored in the database
+            client = await self.session_store.create_client(user_config)
 
             # Start client
             await client.start()
@@ -71,15 +122,27 @@ class MultiUserManager:
             # Store client and config
             self.active_clients[user_id] = client
             self.user_configs[user_id] = user_config
+
+            # Persist a fresh login right away instead of at the next flush
+            await self.session_store.flush(user_id, client)
             
+            # Notifications follow the channel of the current (possibly reloaded) config
+            bind_notification_channel(client, lambda: getattr(self.user_configs.get(user_id), 'channel_id', None))
+
             # Send start notification
-            await send_start_message(client)
+            await send_start_message(client, user_config)
+
+            # Resume purchases the journal shows were unfinished when the last run stopped
+            unfinished = purchase_journal(client).open(user_id)
+            for entry in unfinished:
+                purchase_queue(client).resume(entry)
+            unfinished and info(f"Resumed {len(unfinished)} unfinished purchases for user {user_id}")
             
+            # A first start sees the current catalog as known instead of as hundreds of new gifts
+            await GiftDetector.seed_gift_history(client, user_config)
+
             # Start gift monitoring task
-            task = asyncio.create_task(
-                self._run_user_monitoring(client, user_config)
-            )
-            self.active_tasks[user_id] = task
+            self.restart_monitoring(user_id)
             
             info(f"Started bot for user {user_id}")
             
@@ -89,19 +152,28 @@ class MultiUserManager:
 
     async def stop_user_bot(self, user_id: int):
         """Stop bot instance for a specific user."""
+        self.supervisor.forget(user_id)
+
         # Cancel monitoring task
         if user_id in self.active_tasks:
             task = self.active_tasks[user_id]
             task.cancel()
             try:
                 await task
-            except asyncio.CancelledError:
+            except (asyncio.CancelledError, Exception):
+                # A crashed monitor re-raises its error here; the supervisor already logged it
                 pass
             del self.active_tasks[user_id]
 
         # Stop and remove client
         if user_id in self.active_clients:
             client = self.active_clients[user_id]
+            await purchase_queue(client).close()
+            purchase_journal(client).close()
+            try:
+                await self.session_store.flush(user_id, client)
+            except Exception as ex:
+                error(f"Failed to flush session for user {user_id}: {str(ex)}")
             try:
                 await client.stop()
             except Exception as ex:
@@ -112,6 +184,7 @@ class MultiUserManager:
         if user_id in self.user_configs:
             del self.user_configs[user_id]
 
+        self.cluster and await self.cluster.release(user_id)
         info(f"Stopped bot for user {user_id}")
 
     async def restart_user_bot(self, user_id: int):
@@ -120,29 +193,115 @@ class MultiUserManager:
         await asyncio.sleep(1)  # Brief pause
         await self.start_user_bot(user_id)
 
-    async def _run_user_monitoring(self, client: Client, user_config: UserConfig):
-        """Run gift monitoring for a specific user."""
+    async def apply_config_change(self, user_data: Dict):
+        """Apply an updated configuration row to the user's bot without reconnecting it."""
+        user_id = user_data['user_id']
+        current_config = self.user_configs.get(user_id)
+        self.cluster and self.cluster.track(user_data)
+
+        if not user_data.get('is_active'):
+            current_config and await self.stop_user_bot(user_id)
+            return
+
+        if not current_config:
+            await self.start_user_bot(user_id, user_data)
+            return
+
+        new_config = UserConfig(user_data)
+
+        if any(getattr(current_config, field) != getattr(new_config, field) for field in RESTART_FIELDS):
+            info(f"Connection settings changed for user {user_id}, restarting bot")
+            await self.stop_user_bot(user_id)
+            # A stored session belongs to the old phone number
+            current_config.phone_number != new_config.phone_number and await self.session_store.forget(user_id)
+            await self.start_user_bot(user_id, user_data)
+            return
+
+        # The monitor reads its config from here at the start of every tick
+        self.user_configs[user_id] = new_config
+        info(f"Reloaded config for user {user_id}")
+
+    def restart_monitoring(self, user_id: int):
+        """Create the monitoring task on the user's running client and hand it to the supervisor."""
+        task = asyncio.create_task(self._run_user_monitoring(self.active_clients[user_id], user_id),
+                                   name=f"{MONITOR_TASK_PREFIX}{user_id}")
+        self.active_tasks[user_id] = task
+        self.supervisor.watch(user_id, task)
+
+    async def _run_user_monitoring(self, client: Client, user_id: int):
+        """Run gift monitoring for a specific user; failures propagate to the supervisor."""
         try:
-            # Create a wrapper function that passes the user config
-            async def process_gift_with_config(app: Client, gift_data: Dict):
-                return await process_gift(app, gift_data, user_config)
-            
-            await gift_monitoring(client, process_gift_with_config, user_config)
+            with log_context(user_id=user_id):
+                await gift_monitoring(client, process_gift, lambda: self.user_configs[user_id])
         except asyncio.CancelledError:
-            info(f"Monitoring cancelled for user {user_config.user_id}")
+            info(f"Monitoring cancelled for user {user_id}")
+            raise
         except Exception as ex:
-            error(f"Monitoring error for user {user_config.user_id}: {str(ex)}")
+            error(f"Monitoring error for user {user_id}: {str(ex)}")
+            raise
+
+    async def notify_admins(self, text: str):
+        """Send a message to every admin through the Bot API client."""
+        if not self.bot_client:
+            return
+        for admin_id in await self.auth_manager.get_admin_ids():
+            try:
+                await self.bot_client.send_message(admin_id, text)
+            except Exception as ex:
+                error(f"Failed to notify admin {admin_id}: {str(ex)}")
 
     async def stop_all_users(self):
         """Stop all active user bots."""
+        await self.config_watcher.stop()
+        await self.supervisor.stop()
+        await self.session_store.stop()
         user_ids = list(self.active_clients.keys())
         for user_id in user_ids:
             await self.stop_user_bot(user_id)
+        self.cluster and await self.cluster.stop()
+        await catalog_bus.stop()
 
     def get_active_user_count(self) -> int:
         """Get number of active users."""
         return len(self.active_clients)
 
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """Live figures for /admin_stats, read from in-memory state and counters only."""
+        now = time.time()
+        users = []
+        for user_id, client in self.active_clients.items():
+            last_poll = LAST_POLL_TIME.get(user_id=user_id)
+            users.append({
+                'user_id': user_id,
+                'health': self.supervisor.health(user_id),
+                'last_poll_ago': now - last_poll if last_poll else None,
+                'poll_latency': LAST_POLL_LATENCY.get(user_id=user_id) if last_poll else None,
+                'queued_purchases': len(purchase_queue(client)),
+            })
+
+        return {
+            'active_clients': len(self.active_clients),
+            'active_tasks': sum(not task.done() for task in self.active_tasks.values()),
+            'starting': len(self._starting),
+            'node_id': self.cluster.node_id if self.cluster else None,
+            'cluster_nodes': len(self.cluster.ring.nodes) if self.cluster else None,
+            'users': users,
+            'quarantined': dict(self.supervisor.quarantined),
+            'purchases_last_hour': int(PURCHASES_SUCCEEDED.recent()),
+            'failures_last_hour': int(PURCHASES_FAILED.recent()),
+            'flood_waits': int(FLOOD_WAITS.total()),
+            'flood_wait_seconds': int(FLOOD_WAIT_SECONDS.total()),
+            'loop_lag': loop_lag_monitor.lag,
+            'rss_bytes': rss_bytes(),
+        }
+
     def is_user_active(self, user_id: int) -> bool:
-        """Check if a user's bot is currently active."""
-        return user_id in self.active_clients
\ No newline at end of file
+        """Check if a user's bot is connected and its monitor is alive, not restarting or quarantined."""
+        return user_id in self.active_clients and self.supervisor.health(user_id) == RUNNING
+
+    def get_user_health(self, user_id: int) -> str:
+        """Monitor state of a user: running, restarting, quarantined or stopped."""
+        return self.supervisor.health(user_id)
+
+
+multi_user_manager = MultiUserManager()
@@ -0,0 +1,89 @@
+import math
+from functools import reduce
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bound on DP cell updates; costs are coarsened beyond it so planning stays in the millisecond range
+MAX_DP_OPERATIONS = 100_000
+
+
+class PurchasePlanner:
+    """Splits the balance across all eligible gifts of a drop before any purchase is sent.
+
+    Each gift contributes ``quantity * len(recipients)`` units at its price; a unit is
+    worth ``1 / total_amount`` so rarer gifts are preferred. The allocation maximizing
+    the total value within the balance is found with a bounded knapsack.
+    """
+
+    @staticmethod
+    def plan(candidates: List[Dict[str, Any]], balance: int) -> Optional[Dict[int, int]]:
+        """Return units to buy per gift id, or None when the balance covers everything."""
+        candidates = [c for c in candidates if c["units"] > 0]
+        if sum(c["price"] * c["units"] for c in candidates) <= balance:
+            return None
+
+        free = {c["gift_id"]: c["units"] for c in candidates if c["price"] <= 0}
+        paid = [c for c in candidates if c["price"] > 0]
+        capacity, weights = PurchasePlanner._scale(paid, balance)
+
+        # Binary splitting turns each bounded item into O(log units) 0/1 items
+        items: List[Tuple[int, int, float]] = []
+        for index, candidate in enumerate(paid):
+            value = 1.0 / max(1, candidate["supply"])
+            remaining, chunk = candidate["units"], 1
+            while remaining > 0:
+                take = min(chunk, remaining)
+                items.append((index, take, take * value))
+                remaining -= take
+                chunk *= 2
+
+        best = [0.0] * (capacity + 1)
+        taken: List[bytearray] = []
+        for index, count, value in items:
+            weight = weights[index] * count
+            choice = bytearray(capacity + 1)
+            if weight <= capacity:
+                shifted = [previous + value for previous in best[:capacity + 1 - weight]]
+                for slot, candidate_value in enumerate(shifted, start=weight):
+                    if candidate_value > best[slot]:
+                        best[slot] = candidate_value
+                        choice[slot] = 1
+            taken.append(choice)
+
+        # Walk the recorded choices back from the most valuable final capacity
+        allocation = {c["gift_id"]: 0 for c in paid}
+        slot = max(range(capacity + 1), key=best.__getitem__)
+        for (index, count, _), choice in zip(reversed(items), reversed(taken)):
+            if choice[slot]:
+                allocation[paid[index]["gift_id"]] += count
+                slot -= weights[index] * count
+
+        allocation.update(free)
+        return allocation
+
+    @staticmethod
+    def _scale(candidates: List[Dict[str, Any]], balance: int) -> Tuple[int, List[int]]:
+        """Reduce prices and balance to the smallest integer grid that fits the DP budget."""
+        prices = [c["price"] for c in candidates]
+        budget = min(balance, sum(c["price"] * c["units"] for c in candidates))
+        quantum = reduce(math.gcd, prices, 0) or 1
+
+        chunks = sum(max(1, c["units"].bit_length()) for c in candidates)
+        if (budget // quantum) * chunks > MAX_DP_OPERATIONS:
+            # Rounding costs up keeps every plan affordable at a small loss of optimality
+            quantum = math.ceil(budget * chunks / MAX_DP_OPERATIONS)
+
+        return budget // quantum, [math.ceil(price / quantum) for price in prices]
+
+    @staticmethod
+    def split_units(units: int, quantity: int, recipients: List) -> List[Tuple[Any, int]]:
+        """Hand out planned units to recipients in order, ``quantity`` each at most."""
+        shares = []
+        for recipient in recipients:
+            share = min(quantity, units)
+            share and shares.append((recipient, share))
+            units -= share
+        return shares
+
+
+plan_purchases = PurchasePlanner.plan
+split_units = PurchasePlanner.split_units
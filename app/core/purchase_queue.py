@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pyrogram import Client
+
+from app.core.sold_out import sold_out_registry
+from app.core.supply_history import supply_recorder
+from app.core.user_config import PRIORITIZE_POSITION, PRIORITIZE_SELLOUT_ETA, UserConfig
+from app.journal import JournalEntry, PurchaseJournal, purchase_journal
+from app.notifications import send_notification
+from app.purchase import buy_gift
+from app.utils.logger import info, warn, error, log_context
+from app.utils.tracing import GiftTrace, current_trace
+from data.config import t
+
+
+def priority_key(gift_data: Dict[str, Any], strategy: str, eta: Optional[float] = None) -> Tuple:
+    """Sort key shared by drop prioritization, the purchase queue and the backtest.
+
+    ``low_supply`` orders limited gifts by total supply; ``sellout_eta`` orders them by
+    the predicted seconds until they sell out, falling back to total supply for gifts
+    without a measurable rate yet (such as those seen for the first time). Ties keep
+    the catalog position.
+    """
+    limited = strategy != PRIORITIZE_POSITION and gift_data.get("is_limited", False)
+    supply = gift_data.get("total_amount", float('inf')) if limited else float('inf')
+    urgency = eta if limited and strategy == PRIORITIZE_SELLOUT_ETA and eta is not None else float('inf')
+    return urgency, supply, gift_data.get("position", 0)
+
+
+def gift_priority(gift_data: Dict[str, Any], user_config: UserConfig) -> Tuple:
+    """Priority of a gift under the user's strategy, with the ETA from recorded supply samples."""
+    strategy = user_config.prioritization
+    eta = supply_recorder.sellout_eta(gift_data.get("id")) if strategy == PRIORITIZE_SELLOUT_ETA else None
+    return priority_key(gift_data, strategy, eta)
+
+
+class PurchaseJob:
+    """Copies of one gift for one recipient waiting in an account's purchase queue."""
+
+    _sequence = itertools.count()
+
+    def __init__(self, priority: Tuple, gift_id: int, recipient: Union[int, str], quantity: int,
+                 gift_price: Optional[int] = None, trace: Optional[GiftTrace] = None, job_id: Optional[str] = None,
+                 shadow: bool = False, range_index: Optional[int] = None):
+        self.priority = priority
+        self.seq = next(PurchaseJob._sequence)
+        self.job_id = job_id or PurchaseJournal.new_job_id()
+        self.gift_id = gift_id
+        self.recipient = recipient
+        self.remaining = quantity
+        self.gift_price = gift_price
+        self.trace = trace
+        self.shadow = shadow
+        self.range_index = range_index
+        self.preempted = False
+
+    def __lt__(self, other: "PurchaseJob") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class PurchaseQueue:
+    """Per-account queue of purchases ordered by the ``prioritize_gifts`` key.
+
+    A single worker sends gifts one at a time. Before every send it checks whether a
+    higher-priority job has arrived (a rarer gift seen on a later poll); if so the
+    current job goes back into the queue and resumes, balance permitting, once the
+    higher-priority work is done.
+    """
+
+    _queues: "weakref.WeakKeyDictionary[Client, PurchaseQueue]" = weakref.WeakKeyDictionary()
+
+    def __init__(self, app: Client, delay: float = 0.5):
+        self.app = app
+        self.delay = delay
+        self._heap: List[PurchaseJob] = []
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._worker: Optional[asyncio.Task] = None
+        self._current: Optional[PurchaseJob] = None
+
+    @classmethod
+    def for_client(cls, app: Client) -> "PurchaseQueue":
+        queue = cls._queues.get(app)
+        if queue is None:
+            queue = cls._queues[app] = cls(app)
+        return queue
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def submit(self, job: PurchaseJob) -> None:
+        purchase_journal(self.app).begin(job.job_id, job.gift_id, job.recipient, job.remaining,
+                                         job.gift_price, job.priority, job.shadow, job.range_index)
+        self._push(job)
+
+    def resume(self, entry: JournalEntry) -> None:
+        """Re-queue a job the journal shows was left unfinished by a previous run."""
+        self._push(PurchaseJob(entry.priority, entry.gift_id, entry.recipient, entry.remaining,
+                               entry.gift_price, job_id=entry.job_id, shadow=entry.shadow,
+                               range_index=entry.range_index))
+
+    def _push(self, job: PurchaseJob) -> None:
+        job.trace and job.trace.drop.hold()
+        job.trace and job.trace.mark("enqueued", recipient=job.recipient)
+        heapq.heappush(self._heap, job)
+
+        self._idle.clear()
+        self._wakeup.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def join(self) -> None:
+        """Wait until every queued purchase has been handled."""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        """Stop the worker; queued jobs stay open in the journal and resume on the next start."""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        for job in self._heap:
+            job.trace and job.trace.drop.release()
+        self._heap.clear()
+        self._idle.set()
+
+    def reprioritize(self, urgencies: Dict[int, float]) -> None:
+        """Replace the leading (urgency) part of queued and running jobs' priorities per gift id."""
+        jobs = self._heap + ([self._current] if self._current else [])
+        for job in jobs:
+            job.gift_id in urgencies and setattr(job, "priority", (urgencies[job.gift_id], *job.priority[1:]))
+        heapq.heapify(self._heap)
+
+    def _should_yield(self, job: PurchaseJob) -> bool:
+        job.preempted = job.preempted or bool(self._heap and self._heap[0] < job)
+        return job.preempted
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            job = self._current = heapq.heappop(self._heap)
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                # Closing: the job stays open in the journal, but its drop must not wait on it
+                job.trace and job.trace.drop.release()
+                raise
+            except Exception as ex:
+                # A failing error report must not take the account's worker down with it
+                error(f"Purchase worker error for gift {job.gift_id}: {ex}")
+            finally:
+                self._current = None
+
+            if job.preempted and job.remaining > 0 and job.gift_id not in sold_out_registry:
+                info(t("console.purchase_preempted", gift_id=job.gift_id, remaining=job.remaining))
+                job.preempted = False
+                heapq.heappush(self._heap, job)
+            else:
+                purchase_journal(self.app).finish(job.job_id)
+                job.trace and job.trace.drop.release()
+
+            await asyncio.sleep(self.delay)
+
+    async def _execute(self, job: PurchaseJob) -> None:
+        token = current_trace.set(job.trace)
+        try:
+            with log_context(gift_id=job.gift_id):
+                job.trace and job.trace.mark("dequeued", recipient=job.recipient)
+
+                if job.gift_id in sold_out_registry:
+                    info(t("console.sold_out_cancelled", gift_id=job.gift_id, cancelled=job.remaining))
+                    return
+
+                job.remaining -= await buy_gift(self.app, job.recipient, job.gift_id, job.remaining, job.gift_price,
+                                                preempt=lambda: self._should_yield(job), job_id=job.job_id,
+                                                shadow=job.shadow)
+        except Exception as ex:
+            warn(t("console.purchase_error", gift_id=job.gift_id, chat_id=job.recipient))
+            await send_notification(self.app, job.gift_id, error_message=str(ex))
+        finally:
+            current_trace.reset(token)
+
+
+purchase_queue = PurchaseQueue.for_client
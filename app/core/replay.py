@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import bisect
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Union
+
+from pyrogram.errors import BadRequest, StargiftUsageLimited
+
+from app.core.callbacks import process_gift
+from app.core.catalog_bus import catalog_bus
+from app.core.catalog_recording import RecordedCatalog, catalog_recorder, read_recording
+from app.core.purchase_queue import purchase_queue
+from app.core.supply_history import supply_recorder
+from app.core.user_config import UserConfig
+from app.utils.detector import GiftDetector, gift_monitoring
+from app.utils.tracing import trace_writer
+from data.config import config
+
+
+class ReplayFinished(Exception):
+    """The recording has no more catalogs to serve."""
+
+
+class ReplayClient:
+    """Stands in for a user's Pyrogram client, serving recorded catalogs to the monitor.
+
+    With ``speed`` above 0 the recording plays on a clock running ``speed`` times real
+    time and every poll gets the newest catalog recorded by then. With ``speed`` 0
+    every poll gets the next recorded catalog once the purchases queued from the
+    previous one are done, so a run makes the same decisions every time. ``send_gift``
+    succeeds while the current catalog lists the gift as available and the simulated
+    balance covers it, and records the latency from the poll that first showed the gift.
+    """
+
+    def __init__(self, catalogs: List[RecordedCatalog], speed: float = 0.0, balance: int = 1_000_000,
+                 send_time: float = 0.0, user_id: int = 0):
+        self.catalogs = catalogs
+        self.times = [at for at, _ in catalogs]
+        self.speed = speed
+        self.balance = balance
+        self.send_time = send_time
+        self.me = SimpleNamespace(id=user_id)
+        self.is_connected = True
+        self.index = -1
+        self.sends: List[Dict[str, Any]] = []
+        self.first_seen: Dict[int, float] = {}
+        self._started_at: Optional[float] = None
+
+    async def start(self) -> None:
+        self.is_connected = True
+
+    async def get_available_gifts(self) -> List[Dict[str, Any]]:
+        if self.index == len(self.catalogs) - 1:
+            raise ReplayFinished()
+
+        if self.speed:
+            self._started_at = self._started_at or time.perf_counter()
+            played = self.times[0] + (time.perf_counter() - self._started_at) * self.speed
+            self.index = max(self.index, bisect.bisect_right(self.times, played) - 1, 0)
+        else:
+            await purchase_queue(self).join()
+            self.index += 1
+
+        now = time.perf_counter()
+        gifts = self.catalogs[self.index][1]
+        for gift in gifts:
+            self.first_seen.setdefault(gift["id"], now)
+        return gifts
+
+    async def send_gift(self, chat_id: Union[int, str], gift_id: int, hide_my_name: bool = True) -> None:
+        await asyncio.sleep(self.send_time / self.speed if self.speed else 0)
+        gift = next((gift for gift in self.catalogs[self.index][1] if gift["id"] == gift_id), None)
+        if gift is None or gift.get("is_sold_out") or gift.get("available_amount") == 0:
+            raise StargiftUsageLimited()
+        if gift["price"] > self.balance:
+            raise BadRequest("BALANCE_TOO_LOW")
+
+        self.balance -= gift["price"]
+        self.sends.append({"gift_id": gift_id, "recipient": chat_id, "price": gift["price"],
+                           "latency_ms": (time.perf_counter() - self.first_seen[gift_id]) * 1000})
+
+    async def get_stars_balance(self) -> int:
+        return self.balance
+
+    async def get_chat(self, chat_id: Union[int, str]) -> SimpleNamespace:
+        return SimpleNamespace(username=str(chat_id) if isinstance(chat_id, str) else None)
+
+    async def send_message(self, chat_id: Union[int, str], text: str, **kwargs) -> None:
+        pass
+
+
+def summarize(client: ReplayClient) -> Dict[str, Any]:
+    """Decisions (copies per gift and recipient) and send latency of a finished replay."""
+    decisions: Dict[str, int] = {}
+    for send in client.sends:
+        key = f"{send['gift_id']}:{send['recipient']}"
+        decisions[key] = decisions.get(key, 0) + 1
+
+    latencies = sorted(send["latency_ms"] for send in client.sends)
+    percentile = lambda share: round(latencies[min(len(latencies) - 1, int(len(latencies) * share))], 3) \
+        if latencies else None
+    return {
+        "catalogs": client.index + 1,
+        "sent": len(client.sends),
+        "stars_spent": sum(send["price"] for send in client.sends),
+        "decisions": dict(sorted(decisions.items())),
+        "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, slack_ms: float) -> List[str]:
+    """Differences that make a replay a regression against ``baseline``."""
+    problems = []
+    if result["decisions"] != baseline["decisions"]:
+        keys = set(result["decisions"]) | set(baseline["decisions"])
+        changed = [f"{key} {baseline['decisions'].get(key, 0)} -> {result['decisions'].get(key, 0)}"
+                   for key in sorted(keys) if result["decisions"].get(key) != baseline["decisions"].get(key)]
+        problems.append("decisions changed: " + ", ".join(changed))
+
+    current, previous = result["latency_ms"]["p95"], baseline["latency_ms"]["p95"]
+    if current is not None and previous is not None and current > previous * tolerance + slack_ms:
+        problems.append(f"p95 latency {current:.1f}ms exceeds baseline {previous:.1f}ms")
+    return problems
+
+
+async def replay(catalogs: List[RecordedCatalog], user_config: UserConfig, speed: float = 0.0,
+                 balance: int = 1_000_000, send_time: float = 0.0) -> Dict[str, Any]:
+    """Run the recorded catalogs through the detection loop and purchase pipeline of one account.
+
+    Gifts of the first catalog count as already seen, as they would for a bot running
+    when the recording started.
+    """
+    # A replay must not feed recorded gifts back into live state
+    catalog_bus.enabled = catalog_recorder.enabled = supply_recorder.enabled = trace_writer.enabled = False
+    history_file = GiftDetector.history_file(user_config.user_id)
+    await GiftDetector.save_gift_history(catalogs[0][1], user_config.user_id)
+
+    client = ReplayClient(catalogs, speed, balance, send_time, user_config.user_id)
+    try:
+        await gift_monitoring(client, process_gift, lambda: user_config)
+    except ReplayFinished:
+        pass
+    finally:
+        await purchase_queue(client).join()
+        await purchase_queue(client).close()
+        history_file.unlink(missing_ok=True)
+
+    return summarize(client)
+
+
+def load_user_config(file_path: Optional[str], user_id: int, interval: float) -> UserConfig:
+    """User settings from a JSON file shaped like a ``user_configs`` row; by default one copy of every gift."""
+    config_data = json.loads(Path(file_path).read_text(encoding="utf-8")) if file_path else {
+        "gift_ranges": [{"min_price": 0, "max_price": 10 ** 9, "supply_limit": 10 ** 9, "quantity": 1,
+                         "recipients": ["1"]}]
+    }
+    config_data.update(user_id=user_id, interval=interval, channel_id=None)
+    return UserConfig(config_data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded catalogs through the purchase pipeline")
+    parser.add_argument("file", nargs="?", default=config.REPLAY_FILE, help="recording (.jsonl or .jsonl.gz)")
+    parser.add_argument("--config", help="user settings as JSON (default: one copy of every gift)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="playback speed relative to real time; 0 replays poll by poll, deterministically")
+    parser.add_argument("--interval", type=float, default=15.0, help="recorded seconds between polls at --speed")
+    parser.add_argument("--balance", type=int, default=1_000_000, help="simulated stars balance")
+    parser.add_argument("--send-time", type=float, default=0.0, help="recorded seconds per send_gift call")
+    parser.add_argument("--user-id", type=int, default=0, help="account id the replay runs as")
+    parser.add_argument("--output", help="write the result as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="fail if decisions differ from this result or latency regressed")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p95 latency ratio to the baseline")
+    parser.add_argument("--slack", type=float, default=5.0, help="allowed p95 latency increase in ms on top")
+    args = parser.parse_args()
+
+    catalogs = list(read_recording(args.file))
+    if not catalogs:
+        print(f"No catalogs recorded in {args.file}")
+        return
+
+    user_config = load_user_config(args.config, args.user_id, args.interval / args.speed if args.speed else 0.0)
+    result = asyncio.run(replay(catalogs, user_config, args.speed, args.balance, args.send_time))
+
+    latency = result["latency_ms"]
+    print(f"Replayed {result['catalogs']} of {len(catalogs)} catalogs: {result['sent']} gifts sent for "
+          f"{result['stars_spent']}⭐ | latency p50 {latency['p50']}ms, p95 {latency['p95']}ms, max {latency['max']}ms")
+    args.output and Path(args.output).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        problems = compare(result, json.loads(Path(args.baseline).read_text(encoding="utf-8")),
+                           args.tolerance, args.slack)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        problems and sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pyrogram import Client
+from pyrogram.storage import FileStorage, MemoryStorage
+
+from app.core.client_profile import PROFILE_FULL, PROFILE_LEAN, client_options
+from app.core.user_config import UserConfig
+from app.database import SessionManager
+from app.utils.logger import info, error
+
+STORAGE_FILE = "file"
+STORAGE_DATABASE = "database"
+
+# Most recently seen peers kept in the stored peer cache
+PEER_LIMIT = 1000
+
+
+def peer_rows(storage) -> List[List[Any]]:
+    """The most recently seen peers of an opened SQLite-based Pyrogram storage."""
+    return [list(row) for row in storage.conn.execute(
+        "SELECT id, access_hash, type, username, phone_number FROM peers "
+        "ORDER BY last_update_on DESC LIMIT ?", (PEER_LIMIT,)
+    )]
+
+
+class DatabaseSessionStorage(MemoryStorage):
+    """In-memory Pyrogram storage seeded with a session and peers, flushed back to the database or ``session_file``."""
+
+    def __init__(self, name: str, session_string: Optional[str] = None, peers: Optional[List[List[Any]]] = None,
+                 session_file: Optional[Path] = None):
+        super().__init__(name, session_string)
+        self.session_file = session_file
+        self.saved_session = session_string
+        self.peers = peers or []
+        self.dirty = False
+
+    async def open(self):
+        await super().open()
+        self.peers and await super().update_peers([tuple(peer) for peer in self.peers])
+
+    async def update_peers(self, peers):
+        await super().update_peers(peers)
+        self.dirty = self.dirty or bool(peers)
+
+
+class SessionStore:
+    """Creates user clients on local session files or on sessions stored in the database.
+
+    With database storage the client keeps its session and peer cache in memory, so it
+    does no disk I/O and any node can start it. Changes are written back every
+    ``flush_interval`` seconds and when the bot stops. A local session file found for
+    an account without a stored session is imported once.
+
+    Clients are built with the options of ``profile`` (see ``client_profile``). The lean
+    profile also loads an existing session file into memory instead of keeping it open
+    and flushes changes back to it like database sessions; accounts without one still
+    log in on a file-backed client.
+    """
+
+    def __init__(self, manager, storage: str = STORAGE_FILE, flush_interval: float = 300.0,
+                 profile: str = PROFILE_FULL):
+        self.manager = manager
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.profile = profile
+        self.session_manager = SessionManager()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start flushing changed sessions in the background."""
+        flushed = self.storage == STORAGE_DATABASE or self.profile == PROFILE_LEAN
+        if not flushed or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def create_client(self, user_config: UserConfig) -> Client:
+        """Build an unstarted client for the user on the configured session storage."""
+        options = client_options(self.profile)
+        if self.storage != STORAGE_DATABASE:
+            session_file = Path(user_config.session_file_path + FileStorage.FILE_EXTENSION)
+            stored = await self._read_file(user_config) if self.profile == PROFILE_LEAN else {}
+            if not stored:
+                # Ensure session directory exists
+                Path(user_config.session_file_path).parent.mkdir(parents=True, exist_ok=True)
+                return Client(
+                    name=user_config.session_file_path,
+                    api_id=user_config.api_id,
+                    api_hash=user_config.api_hash,
+                    phone_number=user_config.phone_number,
+                    **options
+                )
+        else:
+            session_file = None
+            stored = await self.session_manager.get_session(user_config.user_id) or await self._import_file(user_config)
+
+        return Client(
+            name=f"user_{user_config.user_id}",
+            api_id=user_config.api_id,
+            api_hash=user_config.api_hash,
+            phone_number=user_config.phone_number,
+            storage=DatabaseSessionStorage(f"user_{user_config.user_id}", stored.get('session_string'),
+                                           stored.get('peers'), session_file),
+            **options
+        )
+
+    async def flush(self, user_id: int, client: Client) -> None:
+        """Write the client's session back if its auth data or peer cache changed."""
+        storage = client.storage
+        if not isinstance(storage, DatabaseSessionStorage) or not client.is_connected:
+            return
+
+        session_string = await storage.export_session_string()
+        if session_string == storage.saved_session and not storage.dirty:
+            return
+
+        peers = peer_rows(storage) if storage.dirty else None
+        storage.dirty = False
+        saved = await self._write_file(user_id, storage, peers) if storage.session_file else \
+            await self.session_manager.save_session(user_id, session_string, peers)
+        if saved:
+            storage.saved_session = session_string
+        else:
+            storage.dirty = storage.dirty or peers is not None
+
+    async def forget(self, user_id: int) -> None:
+        """Drop the stored session, e.g. because the account's phone number changed."""
+        self.storage == STORAGE_DATABASE and await self.session_manager.delete_session(user_id)
+
+    async def _read_file(self, user_config: UserConfig) -> Dict[str, Any]:
+        """Session string and peers of an authorized local session file, or an empty dict."""
+        session_path = Path(user_config.session_file_path + FileStorage.FILE_EXTENSION)
+        if not session_path.is_file():
+            return {}
+
+        file_storage = FileStorage(session_path.stem, session_path.parent)
+        try:
+            await file_storage.open()
+            authorized = await file_storage.user_id() is not None
+            session_string, peers = await file_storage.export_session_string(), peer_rows(file_storage)
+            await file_storage.close()
+        except Exception as ex:
+            error(f"Failed to read session file for user {user_config.user_id}: {str(ex)}")
+            return {}
+
+        return {'session_string': session_string, 'peers': peers} if authorized else {}
+
+    @staticmethod
+    async def _write_file(user_id: int, storage: DatabaseSessionStorage, peers: Optional[List[List[Any]]]) -> bool:
+        """Copy the in-memory auth data, and the peers if given, into the session file it was loaded from."""
+        file_storage = FileStorage(storage.session_file.stem, storage.session_file.parent)
+        try:
+            await file_storage.open()
+            for field in ("dc_id", "api_id", "test_mode", "auth_key", "user_id", "is_bot"):
+                await getattr(file_storage, field)(await getattr(storage, field)())
+            peers and await file_storage.update_peers([tuple(peer) for peer in peers])
+            await file_storage.save()
+            await file_storage.close()
+            return True
+        except Exception as ex:
+            error(f"Failed to write session file for user {user_id}: {str(ex)}")
+            return False
+
+    async def _import_file(self, user_config: UserConfig) -> Dict[str, Any]:
+        """Copy a local session file into the database; an empty dict starts a fresh login."""
+        stored = await self._read_file(user_config)
+        if stored:
+            await self.session_manager.save_session(user_config.user_id, stored['session_string'], stored['peers'])
+            info(f"Imported session file of user {user_config.user_id} into the database")
+        return stored
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            for user_id, client in list(self.manager.active_clients.items()):
+                try:
+                    await self.flush(user_id, client)
+                except Exception as ex:
+                    error(f"Failed to flush session for user {user_id}: {str(ex)}")
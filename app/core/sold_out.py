@@ -0,0 +1,36 @@
+import time
+from typing import Dict
+
+
+class SoldOutRegistry:
+    """Process-wide record of gifts Telegram has reported as sold out.
+
+    Shared by every monitor so that the first STARGIFT_USAGE_LIMITED response stops
+    all accounts from sending further doomed purchases of that gift.
+    """
+
+    def __init__(self):
+        self._gifts: Dict[int, float] = {}
+
+    def mark(self, gift_id: int) -> bool:
+        """Record a gift as sold out; returns True the first time it is seen."""
+        if gift_id in self._gifts:
+            return False
+        self._gifts[gift_id] = time.time()
+        return True
+
+    def is_sold_out(self, gift_id: int) -> bool:
+        return gift_id in self._gifts
+
+    def sold_out_among(self, gift_ids) -> set:
+        """Return which of the given gift ids are known to be sold out."""
+        return self._gifts.keys() & set(gift_ids)
+
+    def __contains__(self, gift_id: int) -> bool:
+        return gift_id in self._gifts
+
+    def __len__(self) -> int:
+        return len(self._gifts)
+
+
+sold_out_registry = SoldOutRegistry()
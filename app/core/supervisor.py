@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.utils.logger import info, warn, error
+from app.utils.metrics import LAST_POLL_TIME
+
+RUNNING = "running"
+RESTARTING = "restarting"
+QUARANTINED = "quarantined"
+STOPPED = "stopped"
+
+
+class MonitorSupervisor:
+    """Watches every monitoring task of a MultiUserManager and keeps it alive.
+
+    A monitor that raises, returns, or stops polling is restarted after an
+    exponential backoff: the first time only the task is recreated, after that the
+    client is reconnected too. An account failing ``crash_limit`` times within
+    ``crash_window`` seconds is quarantined: its bot is stopped and admins are told.
+    Quarantine ends when the account is started again by the user or its config changes.
+    """
+
+    def __init__(self, manager, base_delay: float = 2.0, max_delay: float = 300.0, crash_limit: int = 5,
+                 crash_window: float = 600.0, stall_after: float = 120.0, check_interval: float = 5.0):
+        self.manager = manager
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.crash_limit = crash_limit
+        self.crash_window = crash_window
+        self.stall_after = stall_after
+        self.check_interval = check_interval
+        self.quarantined: Dict[int, str] = {}
+        self._failures: Dict[int, Deque[float]] = {}
+        self._started_at: Dict[int, float] = {}
+        self._restarts: Dict[int, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start checking monitors for stalls in the background."""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in list(self._restarts.values()) + ([self._task] if self._task else []):
+            task.cancel()
+        self._restarts.clear()
+        self._task = None
+
+    def watch(self, user_id: int, task: asyncio.Task) -> None:
+        """Supervise a freshly created monitoring task."""
+        self._started_at[user_id] = time.time()
+        task.add_done_callback(lambda done: self._on_done(user_id, done))
+
+    def forget(self, user_id: int) -> None:
+        """Drop a pending restart because the bot is being stopped on purpose."""
+        restart = self._restarts.pop(user_id, None)
+        restart and restart is not asyncio.current_task() and restart.cancel()
+        self._started_at.pop(user_id, None)
+
+    def release(self, user_id: int) -> None:
+        """Clear quarantine and failure history so the account starts with a clean slate."""
+        self.quarantined.pop(user_id, None) and info(f"User {user_id} released from quarantine")
+        self._failures.pop(user_id, None)
+
+    def health(self, user_id: int) -> str:
+        if user_id in self.quarantined:
+            return QUARANTINED
+        if user_id in self._restarts:
+            return RESTARTING
+        task = self.manager.active_tasks.get(user_id)
+        return RUNNING if task and not task.done() else STOPPED
+
+    def _on_done(self, user_id: int, task: asyncio.Task) -> None:
+        # Cancellation means the bot was stopped or restarted deliberately
+        if task.cancelled() or self.manager.active_tasks.get(user_id) is not task:
+            return
+        exception = task.exception()
+        self._schedule_restart(user_id, f"{type(exception).__name__}: {exception}" if exception else "monitor exited")
+
+    def _schedule_restart(self, user_id: int, reason: str) -> None:
+        if user_id not in self._restarts:
+            self._restarts[user_id] = asyncio.create_task(self._restart(user_id, reason))
+
+    async def _restart(self, user_id: int, reason: str) -> None:
+        try:
+            now = time.monotonic()
+            failures = self._failures.setdefault(user_id, deque())
+            failures.append(now)
+            while failures and now - failures[0] > self.crash_window:
+                failures.popleft()
+
+            if len(failures) >= self.crash_limit:
+                await self._quarantine(user_id, reason, len(failures))
+                return
+
+            delay = min(self.max_delay, self.base_delay * 2 ** (len(failures) - 1))
+            warn(f"Monitor for user {user_id} failed ({reason}), restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+            task = self.manager.active_tasks.get(user_id)
+            # Stopped meanwhile, or already restarted along with the whole bot
+            if user_id not in self.manager.active_clients or (task and not task.done()):
+                return
+            if len(failures) == 1:
+                self.manager.restart_monitoring(user_id)
+            else:
+                await self.manager.stop_user_bot(user_id)
+                await self.manager.start_user_bot(user_id, supervised=True)
+        except Exception as ex:
+            error(f"Failed to restart monitor for user {user_id}: {str(ex)}")
+        finally:
+            self._restarts.get(user_id) is asyncio.current_task() and self._restarts.pop(user_id)
+
+    async def _quarantine(self, user_id: int, reason: str, failures: int) -> None:
+        self.quarantined[user_id] = reason
+        error(f"User {user_id} quarantined after {failures} monitor failures: {reason}")
+        await self.manager.stop_user_bot(user_id)
+        await self.manager.notify_admins(
+            f"🚫 **Account quarantined**\n\n"
+            f"User `{user_id}` crashed {failures} times in {self.crash_window / 60:.0f} minutes and was stopped.\n"
+            f"Last error: `{reason}`\n\n"
+            f"It starts again on `/start_bot` or when its configuration changes."
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.check_stalled()
+            except Exception as ex:
+                error(f"Supervisor error: {str(ex)}")
+
+    def check_stalled(self) -> None:
+        """Restart monitors that are alive but have not completed a poll for too long."""
+        now = time.time()
+        for user_id, task in list(self.manager.active_tasks.items()):
+            if task.done() or user_id in self._restarts:
+                continue
+
+            user_config = self.manager.user_configs.get(user_id)
+            limit = max(self.stall_after, 5 * (user_config.interval if user_config else 0))
+            last_seen = max(LAST_POLL_TIME.get(user_id=user_id), self._started_at.get(user_id, now))
+            if now - last_seen > limit:
+                # Cancelled tasks are ignored by the done callback, so restart explicitly
+                task.cancel()
+                self._schedule_restart(user_id, f"no poll for {now - last_seen:.0f}s")
@@ -0,0 +1,300 @@
+import atexit
+import bisect
+import itertools
+import mmap
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pyrogram import Client
+
+from app.core.catalog_diff import CatalogEvent
+from app.core.user_config import UserConfig
+from app.utils.logger import info
+from data.config import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: one bot process per store is assumed
+    fcntl = None
+
+# Block: header followed by fixed-width deltas from the previous sample of the same gift
+HEADER = struct.Struct("<qqqiI")  # sequence, gift id, first sample ms, first sample supply, delta count
+DELTA = struct.Struct("<ii")  # ms since previous sample, supply change
+BLOCK_SIZE = 4096
+DELTAS_PER_BLOCK = (BLOCK_SIZE - HEADER.size) // DELTA.size
+MAX_DELTA_MS = 2 ** 31 - 1
+
+Sample = Tuple[float, int]
+
+
+class SupplyBlock:
+    """In-memory index entry for one block of the store."""
+
+    __slots__ = ("index", "sequence", "gift_id", "start_ms", "end_ms", "count", "last_supply", "last_delta")
+
+    def __init__(self, index: int, sequence: int, gift_id: int, start_ms: int, supply: int, count: int = 0):
+        self.index = index
+        self.sequence = sequence
+        self.gift_id = gift_id
+        self.start_ms = self.end_ms = start_ms
+        self.count = count
+        self.last_supply = supply
+        self.last_delta = (0, 0)
+
+    @property
+    def offset(self) -> int:
+        return self.index * BLOCK_SIZE
+
+
+class SupplyRecorder:
+    """Remaining supply of limited gifts over time, shared by every monitored account.
+
+    Samples live in a memory-mapped file of fixed-size blocks, each holding one gift's
+    first sample followed by (ms, supply) deltas. The file is a ring: when it is full
+    the oldest block is reused, which bounds retention. A gift gets at most one sample
+    per ``resolution`` seconds (later values within that window replace the last one),
+    and unchanged values are dropped, so every account reporting the same catalog
+    costs nothing after the first.
+
+    Each store has one writer, holding an flock on it: a process that finds the file
+    taken records to the first free numbered sibling (``supply-1.bin``, ...) instead.
+    ``read_only`` recorders map the file as it is without taking it.
+    """
+
+    def __init__(self, file_path: str = "data/supply/supply.bin", blocks: int = 1024,
+                 resolution: float = 1.0, enabled: bool = True, read_only: bool = False):
+        self.file_path = Path(file_path)
+        self.path = self.file_path
+        self.blocks = max(2, blocks)
+        self.resolution_ms = int(resolution * 1000)
+        self.enabled = enabled
+        self.read_only = read_only
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._slots: List[Optional[SupplyBlock]] = []
+        self._by_gift: Dict[int, List[SupplyBlock]] = {}
+        self._sequence = 0
+        self._next = 0
+
+    def open(self) -> None:
+        """Map the store, creating it if needed, and index the blocks it already holds."""
+        if self._map is not None:
+            return
+
+        if self.read_only:
+            self._file = self.path.open("rb")
+            self.blocks = max(1, self.path.stat().st_size // BLOCK_SIZE)
+            self._map = mmap.mmap(self._file.fileno(), self.blocks * BLOCK_SIZE, access=mmap.ACCESS_READ)
+        else:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self._claim()
+            self._file.truncate(self.blocks * BLOCK_SIZE)
+            self._map = mmap.mmap(self._file.fileno(), self.blocks * BLOCK_SIZE)
+
+        self._slots = [self._load_block(index) for index in range(self.blocks)]
+        used = sorted((block for block in self._slots if block), key=lambda block: block.sequence)
+        for block in used:
+            self._by_gift.setdefault(block.gift_id, []).append(block)
+
+        self._sequence = used[-1].sequence if used else 0
+        free = [index for index, block in enumerate(self._slots) if block is None]
+        self._next = free[0] if free else (used[0].index if used else 0)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self.read_only or self._map.flush()
+            self._map.close()
+            # Closing the file also gives up its lock
+            self._file.close()
+            self._map = self._file = None
+            self._slots, self._by_gift = [], {}
+
+    def record(self, gift_id: int, supply: int, timestamp: Optional[float] = None) -> None:
+        """Add a sample; a no-op when the supply did not change since the gift's last sample."""
+        if not self.enabled or self.read_only:
+            return
+        self._map is None and self.open()
+
+        now_ms = int((time.time() if timestamp is None else timestamp) * 1000)
+        blocks = self._by_gift.get(gift_id)
+        block = blocks[-1] if blocks else None
+
+        if block is None:
+            self._allocate(gift_id, now_ms, supply)
+            return
+        if supply == block.last_supply:
+            return
+
+        elapsed = now_ms - block.end_ms
+        if elapsed < self.resolution_ms:
+            self._replace_last(block, supply)
+        elif block.count >= DELTAS_PER_BLOCK or elapsed > MAX_DELTA_MS:
+            self._allocate(gift_id, now_ms, supply)
+        else:
+            self._append(block, elapsed, supply)
+
+    async def on_catalog_events(self, app: Client, user_config: UserConfig, events: List[CatalogEvent]) -> None:
+        """Catalog feed subscriber recording the remaining supply of limited gifts."""
+        now = time.time()
+        for event in events:
+            supply = event.gift.get("available_amount")
+            event.gift.get("is_limited") and supply is not None and self.record(event.gift_id, supply, now)
+
+    def series(self, gift_id: int, since: Optional[float] = None, until: Optional[float] = None) -> List[Sample]:
+        """(timestamp, remaining supply) samples of a gift, oldest first, within [since, until]."""
+        if self._map is None:
+            self.enabled and self.file_path.exists() and self.open()
+        since_ms = int(since * 1000) if since is not None else None
+        until_ms = int(until * 1000) if until is not None else None
+
+        samples: List[Sample] = []
+        for block in self._by_gift.get(gift_id, []):
+            if (since_ms is not None and block.end_ms < since_ms) or (until_ms is not None and block.start_ms > until_ms):
+                continue
+            samples.extend(self._decode(block))
+
+        times = [at for at, _ in samples]
+        start = bisect.bisect_left(times, since) if since is not None else 0
+        end = bisect.bisect_right(times, until) if until is not None else len(samples)
+        return samples[start:end]
+
+    def gift_ids(self) -> List[int]:
+        """Gifts with recorded samples."""
+        if self._map is None:
+            self.enabled and self.file_path.exists() and self.open()
+        return list(self._by_gift)
+
+    def latest(self, gift_id: int) -> Optional[Sample]:
+        blocks = self._by_gift.get(gift_id)
+        return (blocks[-1].end_ms / 1000, blocks[-1].last_supply) if blocks else None
+
+    def depletion_rate(self, gift_id: int, window: float = 300.0) -> Optional[float]:
+        """Units sold per second over the last ``window`` seconds, if measurable."""
+        now = time.time()
+        return self.rate_of(self._window(gift_id, now, window), now, window)
+
+    def sellout_eta(self, gift_id: int, window: float = 60.0) -> Optional[float]:
+        """Seconds until the gift sells out at its recent rate; None when it is not selling."""
+        now = time.time()
+        return self.eta_of(self._window(gift_id, now, window), now, window)
+
+    @staticmethod
+    def rate_of(samples: List[Sample], now: float, window: float) -> Optional[float]:
+        """Units sold per second over the ``window`` seconds up to ``now``.
+
+        ``samples`` run up to ``now`` and start with the last one before the window, if any.
+        Unchanged supply is not sampled, so a window without samples means a rate of 0.
+        """
+        if not samples:
+            return None
+        start = max(now - window, samples[0][0])
+        if now <= start:
+            return None
+        index = bisect.bisect_right(samples, (start, float('inf'))) - 1
+        return max(0.0, (samples[max(index, 0)][1] - samples[-1][1]) / (now - start))
+
+    @staticmethod
+    def eta_of(samples: List[Sample], now: float, window: float) -> Optional[float]:
+        rate = SupplyRecorder.rate_of(samples, now, window)
+        remaining = samples[-1][1] if samples else None
+        if remaining is not None and remaining <= 0:
+            return 0.0
+        return remaining / rate if rate else None
+
+    def _window(self, gift_id: int, now: float, window: float) -> List[Sample]:
+        """Samples of the last ``window`` seconds, led by the one holding the supply as the window began."""
+        since_ms = int((now - window) * 1000)
+        blocks = self._by_gift.get(gift_id, [])
+        first = len(blocks)
+        while first and blocks[first - 1].end_ms >= since_ms:
+            first -= 1
+        samples = [sample for block in blocks[max(first - 1, 0):] for sample in self._decode(block)]
+        start = bisect.bisect_right(samples, (now - window, float('inf')))
+        return samples[max(start - 1, 0):]
+
+    def _claim(self):
+        """Open and lock the first store no other process writes to."""
+        for number in itertools.count():
+            path = self.file_path.with_name(f"{self.file_path.stem}-{number}{self.file_path.suffix}") \
+                if number else self.file_path
+            file = path.open("r+b" if path.exists() else "w+b")
+            if fcntl is None:
+                return file
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                continue
+            if number:
+                info(f"Supply history: {self.file_path} is written by another process, recording to {path}")
+            self.path = path
+            return file
+
+    def _load_block(self, index: int) -> Optional[SupplyBlock]:
+        sequence, gift_id, start_ms, supply, count = HEADER.unpack_from(self._map, index * BLOCK_SIZE)
+        if sequence <= 0 or count > DELTAS_PER_BLOCK:
+            return None
+
+        block = SupplyBlock(index, sequence, gift_id, start_ms, supply, count)
+        for elapsed, change in DELTA.iter_unpack(self._deltas(block)):
+            block.end_ms += elapsed
+            block.last_supply += change
+            block.last_delta = (elapsed, change)
+        return block
+
+    def _deltas(self, block: SupplyBlock) -> memoryview:
+        start = block.offset + HEADER.size
+        return memoryview(self._map)[start:start + block.count * DELTA.size]
+
+    def _decode(self, block: SupplyBlock) -> List[Sample]:
+        _, _, at, supply, _ = HEADER.unpack_from(self._map, block.offset)
+        samples = [(at / 1000, supply)]
+        for elapsed, change in DELTA.iter_unpack(self._deltas(block)):
+            at += elapsed
+            supply += change
+            samples.append((at / 1000, supply))
+        return samples
+
+    def _allocate(self, gift_id: int, at_ms: int, supply: int) -> None:
+        index = self._next
+        evicted = self._slots[index]
+        if evicted is not None:
+            self._by_gift[evicted.gift_id].remove(evicted)
+            self._by_gift[evicted.gift_id] or self._by_gift.pop(evicted.gift_id)
+
+        self._sequence += 1
+        block = SupplyBlock(index, self._sequence, gift_id, at_ms, supply)
+        HEADER.pack_into(self._map, block.offset, block.sequence, gift_id, at_ms, supply, 0)
+        self._slots[index] = block
+        self._by_gift.setdefault(gift_id, []).append(block)
+        self._next = (index + 1) % self.blocks
+
+    def _append(self, block: SupplyBlock, elapsed: int, supply: int) -> None:
+        change = supply - block.last_supply
+        DELTA.pack_into(self._map, block.offset + HEADER.size + block.count * DELTA.size, elapsed, change)
+        block.count += 1
+        self._write_count(block)
+        block.end_ms += elapsed
+        block.last_supply = supply
+        block.last_delta = (elapsed, change)
+
+    def _replace_last(self, block: SupplyBlock, supply: int) -> None:
+        """Keep the last sample's time but move its value, so the gift stays within the resolution."""
+        if block.count == 0:
+            struct.pack_into("<i", self._map, block.offset + 24, supply)
+        else:
+            elapsed, change = block.last_delta
+            change += supply - block.last_supply
+            DELTA.pack_into(self._map, block.offset + HEADER.size + (block.count - 1) * DELTA.size, elapsed, change)
+            block.last_delta = (elapsed, change)
+        block.last_supply = supply
+
+    def _write_count(self, block: SupplyBlock) -> None:
+        struct.pack_into("<I", self._map, block.offset + 28, block.count)
+
+
+supply_recorder = SupplyRecorder(config.SUPPLY_FILE, config.SUPPLY_BLOCKS, config.SUPPLY_RESOLUTION,
+                                 config.SUPPLY_ENABLED)
+atexit.register(supply_recorder.close)
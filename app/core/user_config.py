@@ -1,7 +1,15 @@
 from typing import List, Union, Dict, Any, Optional
 import json
+from app.core.gift_rules import GiftRules
 from app.utils.localization import localization
 from app.utils.logger import error
+from data.config import config
+
+
+# Orders for purchasing a drop's gifts, see ``priority_key``
+PRIORITIZE_POSITION = "position"
+PRIORITIZE_LOW_SUPPLY = "low_supply"
+PRIORITIZE_SELLOUT_ETA = "sellout_eta"
 
 
 class UserConfig:
@@ -18,9 +26,15 @@ class UserConfig:
         self.gift_ranges = self._parse_gift_ranges(config_data.get('gift_ranges', []))
         self.purchase_only_upgradable_gifts = config_data.get('purchase_only_upgradable_gifts', False)
         self.prioritize_low_supply = config_data.get('prioritize_low_supply', False)
+        self.prioritize_sellout_eta = config_data.get('prioritize_sellout_eta', False)
+        self.shadow_mode = config_data.get('shadow_mode', False)
+        self.buy_existing_gifts = config_data.get('buy_existing_gifts', False)
+        self.gift_rules = config_data.get('gift_rules') or ''
         self.is_active = config_data.get('is_active', False)
         self.session_file_path = config_data.get('session_file_path', f"data/sessions/user_{self.user_id}")
         
+        self.rules = self._compile_rules()
+
         # Set localization for this user
         localization.set_locale(self.language)
 
@@ -84,16 +98,24 @@ class UserConfig:
         else:
             return recipient
 
-    def get_matching_range(self, price: int, total_amount: int) -> tuple[bool, int, List[Union[int, str]]]:
-        """Get matching range for a gift based on price and supply."""
-        matching_ranges = [
-            (range_config['quantity'], range_config['recipients'])
-            for range_config in self.gift_ranges
-            if (range_config['min_price'] <= price <= range_config['max_price'] and
-                total_amount <= range_config['supply_limit'])
-        ]
+    def _compile_rules(self) -> GiftRules:
+        """Compile gift ranges and filter rules; invalid stored rules are dropped, not the ranges."""
+        try:
+            return GiftRules(self.gift_ranges, self.gift_rules, self.purchase_only_upgradable_gifts)
+        except ValueError as ex:
+            error(f"Invalid gift rules for user {self.user_id}: {str(ex)}")
+            return GiftRules(self.gift_ranges, '', self.purchase_only_upgradable_gifts)
 
-        return (True, *matching_ranges[0]) if matching_ranges else (False, 0, [])
+    @property
+    def prioritization(self) -> str:
+        """Purchase order for a drop; sell-out ETA takes precedence over low supply."""
+        return PRIORITIZE_SELLOUT_ETA if self.prioritize_sellout_eta else \
+            PRIORITIZE_LOW_SUPPLY if self.prioritize_low_supply else PRIORITIZE_POSITION
+
+    @property
+    def shadow(self) -> bool:
+        """Whether purchases are only recorded, for this user or for everyone via ``[Shadow] ENABLED``."""
+        return bool(self.shadow_mode or config.SHADOW_ENABLED)
 
     @property
     def language_display(self) -> str:
@@ -116,6 +138,10 @@ class UserConfig:
             'gift_ranges': self.gift_ranges,
             'purchase_only_upgradable_gifts': self.purchase_only_upgradable_gifts,
             'prioritize_low_supply': self.prioritize_low_supply,
+            'prioritize_sellout_eta': self.prioritize_sellout_eta,
+            'shadow_mode': self.shadow_mode,
+            'buy_existing_gifts': self.buy_existing_gifts,
+            'gift_rules': self.gift_rules,
             'is_active': self.is_active,
             'session_file_path': self.session_file_path
         }
\ No newline at end of file
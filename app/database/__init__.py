@@ -1,5 +1,7 @@
 from .client import get_supabase_client
 from .user_config import UserConfigManager
 from .auth import AuthManager
+from .sessions import SessionManager
+from .leases import LeaseManager, SQLiteLeaseManager
 
-__all__ = ['get_supabase_client', 'UserConfigManager', 'AuthManager']
\ No newline at end of file
+__all__ = ['get_supabase_client', 'UserConfigManager', 'AuthManager', 'SessionManager', 'LeaseManager', 'SQLiteLeaseManager']
\ No newline at end of file
@@ -1,6 +1,7 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from .client import get_supabase_client
 from app.utils.logger import error, info
+from app.utils.metrics import track_db
 
 
 class AuthManager:
@@ -10,7 +11,8 @@ class AuthManager:
     async def is_user_authorized(self, user_id: int) -> bool:
         """Check if a user is authorized to use the bot."""
         try:
-            result = self.supabase.table('authorized_users').select('user_id').eq('user_id', user_id).execute()
+            with track_db('authorized_users', 'select'):
+                result = self.supabase.table('authorized_users').select('user_id').eq('user_id', user_id).execute()
             return len(result.data) > 0
         except Exception as ex:
             error(f"Error checking user authorization: {str(ex)}")
@@ -24,17 +26,30 @@ class AuthManager:
                 'username': username,
                 'is_admin': is_admin
             }
-            self.supabase.table('authorized_users').insert(data).execute()
+            with track_db('authorized_users', 'insert'):
+                self.supabase.table('authorized_users').insert(data).execute()
             info(f"Added authorized user: {user_id} (@{username})")
             return True
         except Exception as ex:
             error(f"Error adding authorized user: {str(ex)}")
             return False
 
+    async def upsert_authorized_users(self, users: List[Dict[str, Any]]) -> bool:
+        """Insert or update many authorized users in a single request."""
+        try:
+            with track_db('authorized_users', 'upsert'):
+                self.supabase.table('authorized_users').upsert(users, on_conflict='user_id').execute()
+            info(f"Imported {len(users)} authorized users")
+            return True
+        except Exception as ex:
+            error(f"Error importing authorized users: {str(ex)}")
+            return False
+
     async def remove_authorized_user(self, user_id: int) -> bool:
         """Remove a user from the authorized users list."""
         try:
-            self.supabase.table('authorized_users').delete().eq('user_id', user_id).execute()
+            with track_db('authorized_users', 'delete'):
+                self.supabase.table('authorized_users').delete().eq('user_id', user_id).execute()
             info(f"Removed authorized user: {user_id}")
             return True
         except Exception as ex:
@@ -44,17 +59,51 @@ class AuthManager:
     async def get_authorized_users(self) -> List[Dict[str, Any]]:
         """Get all authorized users."""
         try:
-            result = self.supabase.table('authorized_users').select('*').execute()
+            with track_db('authorized_users', 'select'):
+                result = self.supabase.table('authorized_users').select('*').execute()
             return result.data
         except Exception as ex:
             error(f"Error fetching authorized users: {str(ex)}")
             return []
 
+    async def get_authorized_users_page(self, after: Optional[int] = None, before: Optional[int] = None,
+                                        limit: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+        """Get one page of authorized users ordered by user_id, using the last/first id seen as the cursor.
+
+        Returns the page and whether more users exist in the direction being paged.
+        """
+        try:
+            query = self.supabase.table('authorized_users').select('user_id,username,is_admin')
+            if before is not None:
+                query = query.lt('user_id', before).order('user_id', desc=True)
+            else:
+                query = (query.gt('user_id', after) if after is not None else query).order('user_id')
+
+            with track_db('authorized_users', 'select'):
+                result = query.limit(limit + 1).execute()
+
+            users = result.data[:limit]
+            return (users[::-1] if before is not None else users), len(result.data) > limit
+        except Exception as ex:
+            error(f"Error fetching authorized users: {str(ex)}")
+            return [], False
+
     async def is_user_admin(self, user_id: int) -> bool:
         """Check if a user has admin privileges."""
         try:
-            result = self.supabase.table('authorized_users').select('is_admin').eq('user_id', user_id).execute()
+            with track_db('authorized_users', 'select'):
+                result = self.supabase.table('authorized_users').select('is_admin').eq('user_id', user_id).execute()
             return len(result.data) > 0 and result.data[0].get('is_admin', False)
         except Exception as ex:
             error(f"Error checking admin status: {str(ex)}")
-            return False
\ No newline at end of file
+            return False
+
+    async def get_admin_ids(self) -> List[int]:
+        """Get the user ids of all admins."""
+        try:
+            with track_db('authorized_users', 'select'):
+                result = self.supabase.table('authorized_users').select('user_id').eq('is_admin', True).execute()
+            return [row['user_id'] for row in result.data]
+        except Exception as ex:
+            error(f"Error fetching admins: {str(ex)}")
+            return []
@@ -0,0 +1,190 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, List, Set
+from .client import get_supabase_client
+from app.utils.logger import error
+from app.utils.metrics import track_db
+
+
+class LeaseManager:
+    """Node heartbeats and per-user leases in Supabase, so several instances can split the users.
+
+    Expiry is decided by the database clock through the functions in the
+    ``cluster_leases`` migration, which also make taking over a lease atomic.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+
+    async def heartbeat(self, node_id: str, ttl: float) -> Optional[List[str]]:
+        """Mark the node alive for ``ttl`` seconds and return all live nodes, or None on failure."""
+        try:
+            with track_db('cluster_nodes', 'heartbeat'):
+                result = self.supabase.rpc('cluster_heartbeat', {'p_node_id': node_id, 'p_ttl': ttl}).execute()
+            return [row['live_node_id'] for row in result.data]
+        except Exception as ex:
+            error(f"Error sending cluster heartbeat: {str(ex)}")
+            return None
+
+    async def acquire(self, user_id: int, node_id: str, ttl: float) -> bool:
+        """Take or extend the lease on a user; fails while another node holds an unexpired one."""
+        try:
+            with track_db('user_leases', 'acquire'):
+                result = self.supabase.rpc('acquire_user_lease', {
+                    'p_user_id': user_id, 'p_node_id': node_id, 'p_ttl': ttl
+                }).execute()
+            return result.data is True
+        except Exception as ex:
+            error(f"Error acquiring lease for user {user_id}: {str(ex)}")
+            return False
+
+    async def renew(self, node_id: str, user_ids: List[int], ttl: float) -> Optional[Set[int]]:
+        """Extend the node's leases on ``user_ids``; returns the ones it still holds, or None on failure."""
+        try:
+            with track_db('user_leases', 'renew'):
+                result = self.supabase.rpc('renew_user_leases', {
+                    'p_node_id': node_id, 'p_user_ids': user_ids, 'p_ttl': ttl
+                }).execute()
+            return {row['leased_user_id'] for row in result.data}
+        except Exception as ex:
+            error(f"Error renewing leases: {str(ex)}")
+            return None
+
+    async def release(self, user_id: int, node_id: str) -> bool:
+        try:
+            with track_db('user_leases', 'delete'):
+                self.supabase.table('user_leases').delete().eq('user_id', user_id).eq('node_id', node_id).execute()
+            return True
+        except Exception as ex:
+            error(f"Error releasing lease for user {user_id}: {str(ex)}")
+            return False
+
+    async def leave(self, node_id: str) -> bool:
+        """Remove the node and its leases so the others take over its users right away."""
+        try:
+            with track_db('user_leases', 'delete'):
+                self.supabase.table('user_leases').delete().eq('node_id', node_id).execute()
+            with track_db('cluster_nodes', 'delete'):
+                self.supabase.table('cluster_nodes').delete().eq('node_id', node_id).execute()
+            return True
+        except Exception as ex:
+            error(f"Error leaving cluster: {str(ex)}")
+            return False
+
+    async def get_leases(self) -> List[Dict[str, Any]]:
+        try:
+            with track_db('user_leases', 'select'):
+                result = self.supabase.table('user_leases').select('*').order('user_id').execute()
+            return result.data
+        except Exception as ex:
+            error(f"Error fetching leases: {str(ex)}")
+            return []
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cluster_nodes (node_id TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS user_leases (user_id INTEGER PRIMARY KEY, node_id TEXT NOT NULL, expires_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS user_leases_node_id_idx ON user_leases (node_id);
+"""
+
+
+class SQLiteLeaseManager:
+    """LeaseManager on a local SQLite file, for running several nodes on one host without Supabase.
+
+    Every call runs in a worker thread, so waiting for another node's write lock (up to
+    ``timeout`` seconds) never blocks the event loop.
+    """
+
+    def __init__(self, file_path: str = "data/cluster.db", timeout: float = 5.0):
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(file_path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SQLITE_SCHEMA)
+        # One transaction at a time on the shared connection, even when a caller gave up waiting
+        self._lock = threading.Lock()
+
+    async def _transaction(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.to_thread(self._run, work)
+
+    def _run(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so check-and-set is atomic across processes
+            self.conn.execute("BEGIN IMMEDIATE")
+            with self.conn:
+                return work(self.conn)
+
+    async def heartbeat(self, node_id: str, ttl: float) -> Optional[List[str]]:
+        def work(conn: sqlite3.Connection) -> List[str]:
+            now = time.time()
+            conn.execute("REPLACE INTO cluster_nodes VALUES (?, ?)", (node_id, now + ttl))
+            conn.execute("DELETE FROM cluster_nodes WHERE expires_at < ?", (now - 3600,))
+            rows = conn.execute("SELECT node_id FROM cluster_nodes WHERE expires_at > ? ORDER BY node_id", (now,))
+            return [row[0] for row in rows]
+
+        try:
+            return await self._transaction(work)
+        except sqlite3.Error as ex:
+            error(f"Error sending cluster heartbeat: {str(ex)}")
+            return None
+
+    async def acquire(self, user_id: int, node_id: str, ttl: float) -> bool:
+        def work(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO user_leases VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE "
+                "SET node_id = excluded.node_id, expires_at = excluded.expires_at "
+                "WHERE user_leases.node_id = excluded.node_id OR user_leases.expires_at < ?",
+                (user_id, node_id, now + ttl, now)
+            )
+            return cursor.rowcount > 0
+
+        try:
+            return await self._transaction(work)
+        except sqlite3.Error as ex:
+            error(f"Error acquiring lease for user {user_id}: {str(ex)}")
+            return False
+
+    async def renew(self, node_id: str, user_ids: List[int], ttl: float) -> Optional[Set[int]]:
+        def work(conn: sqlite3.Connection) -> Set[int]:
+            conn.executemany("UPDATE user_leases SET expires_at = ? WHERE user_id = ? AND node_id = ?",
+                             [(time.time() + ttl, user_id, node_id) for user_id in user_ids])
+            rows = conn.execute("SELECT user_id FROM user_leases WHERE node_id = ?", (node_id,))
+            return {row[0] for row in rows} & set(user_ids)
+
+        try:
+            return await self._transaction(work)
+        except sqlite3.Error as ex:
+            error(f"Error renewing leases: {str(ex)}")
+            return None
+
+    async def release(self, user_id: int, node_id: str) -> bool:
+        try:
+            await self._transaction(lambda conn: conn.execute(
+                "DELETE FROM user_leases WHERE user_id = ? AND node_id = ?", (user_id, node_id)))
+            return True
+        except sqlite3.Error as ex:
+            error(f"Error releasing lease for user {user_id}: {str(ex)}")
+            return False
+
+    async def leave(self, node_id: str) -> bool:
+        def work(conn: sqlite3.Connection) -> None:
+            conn.execute("DELETE FROM user_leases WHERE node_id = ?", (node_id,))
+            conn.execute("DELETE FROM cluster_nodes WHERE node_id = ?", (node_id,))
+
+        try:
+            await self._transaction(work)
+            return True
+        except sqlite3.Error as ex:
+            error(f"Error leaving cluster: {str(ex)}")
+            return False
+
+    async def get_leases(self) -> List[Dict[str, Any]]:
+        try:
+            rows = await self._transaction(lambda conn: conn.execute(
+                "SELECT user_id, node_id, expires_at FROM user_leases ORDER BY user_id").fetchall())
+        except sqlite3.Error as ex:
+            error(f"Error fetching leases: {str(ex)}")
+            return []
+        return [{'user_id': user_id, 'node_id': node_id, 'expires_at': expires_at} for user_id, node_id, expires_at in rows]
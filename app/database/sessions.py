@@ -0,0 +1,45 @@
+from typing import Optional, Dict, Any, List
+from .client import get_supabase_client
+from app.utils.logger import error
+from app.utils.metrics import track_db
+
+
+class SessionManager:
+    """Pyrogram sessions stored in the database, so any node can start any account."""
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+
+    async def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get the stored session string and peer cache of a user."""
+        try:
+            with track_db('user_sessions', 'select'):
+                result = self.supabase.table('user_sessions').select('*').eq('user_id', user_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as ex:
+            error(f"Error fetching session for {user_id}: {str(ex)}")
+            return None
+
+    async def save_session(self, user_id: int, session_string: str, peers: Optional[List[List[Any]]] = None) -> bool:
+        """Store a user's session string, and the peer cache when given."""
+        row: Dict[str, Any] = {'user_id': user_id, 'session_string': session_string}
+        if peers is not None:
+            row['peers'] = peers
+
+        try:
+            with track_db('user_sessions', 'upsert'):
+                self.supabase.table('user_sessions').upsert(row, on_conflict='user_id').execute()
+            return True
+        except Exception as ex:
+            error(f"Error saving session for {user_id}: {str(ex)}")
+            return False
+
+    async def delete_session(self, user_id: int) -> bool:
+        """Delete a user's stored session."""
+        try:
+            with track_db('user_sessions', 'delete'):
+                self.supabase.table('user_sessions').delete().eq('user_id', user_id).execute()
+            return True
+        except Exception as ex:
+            error(f"Error deleting session for {user_id}: {str(ex)}")
+            return False
@@ -2,6 +2,7 @@ from typing import Optional, Dict, Any, List, Union
 import json
 from .client import get_supabase_client
 from app.utils.logger import error, info
+from app.utils.metrics import track_db
 
 
 class UserConfigManager:
@@ -11,7 +12,8 @@ class UserConfigManager:
     async def get_user_config(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user configuration from database."""
         try:
-            result = self.supabase.table('user_configs').select('*').eq('user_id', user_id).execute()
+            with track_db('user_configs', 'select'):
+                result = self.supabase.table('user_configs').select('*').eq('user_id', user_id).execute()
             return result.data[0] if result.data else None
         except Exception as ex:
             error(f"Error fetching user config for {user_id}: {str(ex)}")
@@ -27,7 +29,8 @@ class UserConfigManager:
             if 'gift_ranges' in config_data and isinstance(config_data['gift_ranges'], list):
                 config_data['gift_ranges'] = json.dumps(config_data['gift_ranges'])
             
-            self.supabase.table('user_configs').insert(config_data).execute()
+            with track_db('user_configs', 'insert'):
+                self.supabase.table('user_configs').insert(config_data).execute()
             info(f"Created config for user {user_id}")
             return True
         except Exception as ex:
@@ -43,7 +46,8 @@ class UserConfigManager:
             if 'gift_ranges' in config_data and isinstance(config_data['gift_ranges'], list):
                 config_data['gift_ranges'] = json.dumps(config_data['gift_ranges'])
             
-            self.supabase.table('user_configs').update(config_data).eq('user_id', user_id).execute()
+            with track_db('user_configs', 'update'):
+                self.supabase.table('user_configs').update(config_data).eq('user_id', user_id).execute()
             info(f"Updated config for user {user_id}")
             return True
         except Exception as ex:
@@ -53,7 +57,8 @@ class UserConfigManager:
     async def delete_user_config(self, user_id: int) -> bool:
         """Delete user configuration."""
         try:
-            self.supabase.table('user_configs').delete().eq('user_id', user_id).execute()
+            with track_db('user_configs', 'delete'):
+                self.supabase.table('user_configs').delete().eq('user_id', user_id).execute()
             info(f"Deleted config for user {user_id}")
             return True
         except Exception as ex:
@@ -63,19 +68,45 @@ class UserConfigManager:
     async def get_active_users(self) -> List[Dict[str, Any]]:
         """Get all active user configurations."""
         try:
-            result = self.supabase.table('user_configs').select('*').eq('is_active', True).execute()
+            with track_db('user_configs', 'select'):
+                result = self.supabase.table('user_configs').select('*').eq('is_active', True).execute()
             return result.data
         except Exception as ex:
             error(f"Error fetching active users: {str(ex)}")
             return []
 
+    async def get_configs_updated_since(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get user configurations changed after the given updated_at timestamp."""
+        try:
+            query = self.supabase.table('user_configs').select('*')
+            if since:
+                query = query.gt('updated_at', since)
+            with track_db('user_configs', 'select'):
+                result = query.order('updated_at').execute()
+            return result.data
+        except Exception as ex:
+            error(f"Error fetching updated user configs: {str(ex)}")
+            return []
+
+    async def get_latest_update_time(self) -> Optional[str]:
+        """Get the most recent updated_at timestamp across all user configurations."""
+        try:
+            with track_db('user_configs', 'select'):
+                result = self.supabase.table('user_configs').select('updated_at') \
+                    .order('updated_at', desc=True).limit(1).execute()
+            return result.data[0]['updated_at'] if result.data else None
+        except Exception as ex:
+            error(f"Error fetching latest config update time: {str(ex)}")
+            return None
+
     async def set_user_active_status(self, user_id: int, is_active: bool) -> bool:
         """Set user's active status."""
         try:
-            self.supabase.table('user_configs').update({
-                'is_active': is_active,
-                'updated_at': 'now()'
-            }).eq('user_id', user_id).execute()
+            with track_db('user_configs', 'update'):
+                self.supabase.table('user_configs').update({
+                    'is_active': is_active,
+                    'updated_at': 'now()'
+                }).eq('user_id', user_id).execute()
             info(f"Set user {user_id} active status to {is_active}")
             return True
         except Exception as ex:
@@ -3,6 +3,7 @@ from typing import Dict, Any
 from pyrogram import Client
 from pyrogram.errors import RPCError
 
+from app.core.sold_out import sold_out_registry
 from app.notifications import send_notification
 from app.utils.logger import error
 from data.config import t
@@ -34,6 +35,9 @@ class ErrorHandler:
                                 gift_price: int = 0, current_balance: int = 0) -> None:
         error_handlers = ErrorHandler.get_error_handlers()
 
+        # Stop every account from sending further purchases of this gift
+        error_handlers['STARGIFT_USAGE_LIMITED']['check'](ex) and sold_out_registry.mark(gift_id)
+
         notification_data = {
             'balance_error': {'balance_error': True, 'gift_price': gift_price, 'current_balance': current_balance},
             'sold_out': {'sold_out': True},
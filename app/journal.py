@@ -0,0 +1,250 @@
+import json
+import os
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pyrogram import Client
+
+from app.utils.logger import warn
+
+# Records appended since the last rewrite before the journal is compacted again
+COMPACT_EVERY = 500
+# Seconds a sent gift stays handled after compaction, well past the history save that follows a drop
+HANDLED_FOR = 3600.0
+
+
+class JournalEntry:
+    """Replayed state of one journaled purchase job."""
+
+    def __init__(self, record: Dict[str, Any]):
+        self.job_id: str = record["job"]
+        self.gift_id: int = record["gift_id"]
+        self.recipient = record["recipient"]
+        self.quantity: int = record["quantity"]
+        self.gift_price: Optional[int] = record.get("price")
+        self.priority = tuple(record.get("priority", ()))
+        self.shadow: bool = record.get("shadow", False)
+        self.range_index: Optional[int] = record.get("range")
+        self.sent = 0
+        self.in_flight = False
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.quantity - self.sent)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"op": "job", "job": self.job_id, "gift_id": self.gift_id, "recipient": self.recipient,
+                "quantity": self.remaining, "price": self.gift_price, "priority": list(self.priority),
+                "shadow": self.shadow, "range": self.range_index}
+
+
+class PurchaseJournal:
+    """Per-account append-only log of purchase intents and outcomes.
+
+    Every record is fsync'd before the call it describes proceeds:
+
+    * ``job``  - copies of a gift queued for a recipient
+    * ``try``  - one ``send_gift`` is about to be issued
+    * ``ok``   - it succeeded; ``fail`` - Telegram rejected it
+    * ``done`` - the job will not send anything more
+    * ``budget`` - the gift rules changed; stars sent before no longer count
+
+    A ``try`` without an outcome means the process died mid-call; the gift is counted
+    as sent so a restart never buys it twice. The file is rewritten to the open jobs
+    on startup and every ``COMPACT_EVERY`` records, so replay only reads the tail.
+    Gifts actually sent stay handled for ``HANDLED_FOR`` seconds after their last send;
+    shadow jobs and gifts that only failed never count. Stars sent per gift range (and
+    shadow or not) are kept across compactions for the rule budgets.
+    """
+
+    _journals: "weakref.WeakKeyDictionary[Client, PurchaseJournal]" = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.path: Optional[Path] = None
+        self.jobs: Dict[str, JournalEntry] = {}
+        self.gifts: Dict[int, float] = {}
+        self.spent: Dict[Tuple[Optional[int], bool], int] = {}
+        self.budget_rules: Optional[str] = None
+        self._file = None
+        self._appended = 0
+
+    @classmethod
+    def for_client(cls, app: Client) -> "PurchaseJournal":
+        journal = cls._journals.get(app)
+        if journal is None:
+            journal = cls._journals[app] = cls()
+        return journal
+
+    @staticmethod
+    def new_job_id() -> str:
+        return uuid.uuid4().hex
+
+    def open(self, user_id: int) -> List[JournalEntry]:
+        """Attach the account's journal file and return the jobs left unfinished by the last run."""
+        self.close()
+        self.path = Path(f"data/journal/user_{user_id}.jsonl")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._replay()
+        for entry in self.jobs.values():
+            if entry.in_flight:
+                warn(f"Purchase of gift {entry.gift_id} for {entry.recipient} was interrupted; counting it as sent")
+                entry.sent += 1
+                entry.in_flight = False
+                self._count_sent(entry, time.time())
+
+        self.jobs = {job_id: entry for job_id, entry in self.jobs.items() if entry.remaining > 0}
+        # Rewriting also drops a record torn by a crash before new ones are appended after it
+        self.compact()
+        return list(self.jobs.values())
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def handled(self, gift_id: int) -> bool:
+        """Whether the gift was recently sent, or is still queued, for real on this account."""
+        return gift_id in self.gifts or any(entry.gift_id == gift_id and not entry.shadow
+                                            for entry in self.jobs.values())
+
+    def committed(self, range_index: Optional[int], shadow: bool) -> int:
+        """Stars sent plus stars still queued for the gift range (every range when None)."""
+        matches = lambda index: range_index is None or index == range_index
+        sent = sum(stars for (index, is_shadow), stars in self.spent.items() if is_shadow == shadow and matches(index))
+        return sent + sum(entry.remaining * (entry.gift_price or 0) for entry in self.jobs.values()
+                          if entry.shadow == shadow and matches(entry.range_index))
+
+    def start_budget(self, rules: str) -> None:
+        """Count spending from scratch when the gift rules differ from those it was counted under."""
+        if rules != self.budget_rules:
+            record = {"op": "budget", "rules": rules}
+            self._apply(record)
+            self._append(record)
+
+    def begin(self, job_id: str, gift_id: int, recipient, quantity: int, gift_price: Optional[int] = None,
+              priority: tuple = (), shadow: bool = False, range_index: Optional[int] = None) -> None:
+        record = {"op": "job", "job": job_id, "gift_id": gift_id, "recipient": recipient, "quantity": quantity,
+                  "price": gift_price, "priority": list(priority), "shadow": shadow, "range": range_index}
+        self._apply(record)
+        self._append(record)
+
+    def attempt(self, job_id: str) -> None:
+        self._write({"op": "try", "job": job_id})
+
+    def succeeded(self, job_id: str) -> None:
+        self._write({"op": "ok", "job": job_id, "at": time.time()})
+
+    def failed(self, job_id: str, reason: Optional[str] = None) -> None:
+        self._write({"op": "fail", "job": job_id, "error": reason})
+
+    def finish(self, job_id: str) -> None:
+        self._write({"op": "done", "job": job_id})
+        if self._appended >= COMPACT_EVERY or not self.jobs:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the journal as the handled gift ids, the budget spending and one record per open job."""
+        if self.path is None:
+            return
+
+        self.close()
+        now = time.time()
+        self.gifts = {gift_id: sent_at for gift_id, sent_at in self.gifts.items() if now - sent_at < HANDLED_FOR}
+        records = [{"op": "gifts", "sent": [[gift_id, sent_at] for gift_id, sent_at in self.gifts.items()]}]
+        self.budget_rules is not None and records.append({"op": "budget", "rules": self.budget_rules})
+        records.append({"op": "spent", "stars": [[index, shadow, stars] for (index, shadow), stars in self.spent.items()]})
+        records += [entry.to_record() for entry in self.jobs.values()]
+        temp_path = self.path.with_suffix(".tmp")
+        with temp_path.open("w", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record) + "\n" for record in records))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self._fsync_directory()
+
+        # Compacted jobs restart their count from the remaining quantity
+        for entry in self.jobs.values():
+            entry.quantity, entry.sent = entry.remaining, 0
+        self._appended = 0
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if record["job"] in self.jobs:
+            self._apply(record)
+            self._append(record)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if self.path is None:
+            return
+
+        if self._file is None:
+            self._file = self.path.open("a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._appended += 1
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record["op"]
+        if op == "gifts":
+            self.gifts.update((gift_id, sent_at) for gift_id, sent_at in record["sent"])
+            return
+        if op == "budget":
+            self.budget_rules, self.spent = record["rules"], {}
+            return
+        if op == "spent":
+            self.spent = {(index, shadow): stars for index, shadow, stars in record["stars"]}
+            return
+        if op == "job":
+            self.jobs[record["job"]] = JournalEntry(record)
+            return
+
+        entry = self.jobs.get(record["job"])
+        if entry is None:
+            return
+        if op == "try":
+            entry.in_flight = True
+        elif op in ("ok", "fail"):
+            entry.in_flight = False
+            if op == "ok":
+                entry.sent += 1
+                self._count_sent(entry, record["at"])
+        elif op == "done":
+            del self.jobs[entry.job_id]
+
+    def _count_sent(self, entry: JournalEntry, sent_at: float) -> None:
+        if not entry.shadow:
+            self.gifts[entry.gift_id] = sent_at
+        key = (entry.range_index, entry.shadow)
+        self.spent[key] = self.spent.get(key, 0) + (entry.gift_price or 0)
+
+    def _replay(self) -> None:
+        self.jobs, self.gifts, self.spent, self.budget_rules = {}, {}, {}, None
+        try:
+            with self.path.open("r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        # Only the last record can be torn; anything after it was never acknowledged
+                        break
+        except FileNotFoundError:
+            pass
+
+    def _fsync_directory(self) -> None:
+        try:
+            descriptor = os.open(self.path.parent, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
+
+
+purchase_journal = PurchaseJournal.for_client
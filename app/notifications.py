@@ -1,21 +1,48 @@
+import weakref
+from typing import Callable, List, Union
+
 from pyrogram import Client
 from pyrogram.errors import RPCError
 
+from app.core.catalog_diff import CatalogEvent
+from app.core.user_config import UserConfig
 from app.utils.helper import get_user_balance, format_user_reference
 from app.utils.logger import error
-from data.config import config, t
+from app.utils.metrics import NOTIFICATIONS_IN_FLIGHT, track_rpc
+from app.utils.tracing import mark
+from data.config import t
+
+Channel = Union[int, str, None]
 
 
 class NotificationManager:
+    _channels: "weakref.WeakKeyDictionary[Client, Callable[[], Channel]]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def bind_channel(app: Client, get_channel: Callable[[], Channel]) -> None:
+        """Route the client's notifications to the channel returned by ``get_channel`` at send time."""
+        NotificationManager._channels[app] = get_channel
+
+    @staticmethod
+    def channel_for(app: Client) -> Channel:
+        get_channel = NotificationManager._channels.get(app)
+        return get_channel() if get_channel else None
+
     @staticmethod
     async def send_message(app: Client, message: str) -> None:
-        if not config.CHANNEL_ID:
+        channel_id = NotificationManager.channel_for(app)
+        if not channel_id:
             return
 
+        NOTIFICATIONS_IN_FLIGHT.inc()
         try:
-            await app.send_message(config.CHANNEL_ID, message, disable_web_page_preview=True)
+            async with track_rpc("send_message"):
+                await app.send_message(channel_id, message, disable_web_page_preview=True)
         except RPCError as ex:
-            error(f'Failed to send message to channel {config.CHANNEL_ID}: {str(ex)}')
+            error(f'Failed to send message to channel {channel_id}: {str(ex)}')
+        finally:
+            NOTIFICATIONS_IN_FLIGHT.dec()
+            mark("notification")
 
     @staticmethod
     async def send_notification(app: Client, gift_id: int, **kwargs) -> None:
@@ -55,20 +82,31 @@ class NotificationManager:
             error(f'Failed to send notification: {str(ex)}')
 
     @staticmethod
-    async def send_start_message(client: Client) -> None:
+    async def send_start_message(client: Client, user_config: UserConfig) -> None:
         balance = await get_user_balance(client)
         ranges_text = "\n".join([
             f"• {r['min_price']}-{r['max_price']} ⭐ (supply ≤ {r['supply_limit']}) x{r['quantity']} -> {len(r['recipients'])} recipients"
-            for r in config.GIFT_RANGES
+            for r in user_config.gift_ranges
         ])
 
         message = t("telegram.start_message",
-                    language=config.language_display,
-                    locale=config.LANGUAGE,
+                    language=user_config.language_display,
+                    locale=user_config.language.upper(),
                     balance=balance,
                     ranges=ranges_text)
         await NotificationManager.send_message(client, message)
 
+    @staticmethod
+    async def send_catalog_changes(app: Client, user_config: UserConfig, events: List[CatalogEvent]) -> None:
+        """Report gifts that sold out or changed price since the previous poll in one message."""
+        lines = [
+            t("telegram.catalog_sold_out", gift_id=event.gift_id) if event.kind == CatalogEvent.SOLD_OUT else
+            t("telegram.catalog_price_changed", gift_id=event.gift_id,
+              old_price=event.previous.get("price"), price=event.gift.get("price"))
+            for event in events
+        ]
+        await NotificationManager.send_message(app, t("telegram.catalog_changes_header") + "\n" + "\n".join(lines))
+
     @staticmethod
     async def send_summary_message(app: Client, sold_out_count: int = 0,
                                    non_limited_count: int = 0, non_upgradable_count: int = 0) -> None:
@@ -92,4 +130,6 @@ class NotificationManager:
 send_message = NotificationManager.send_message
 send_notification = NotificationManager.send_notification
 send_start_message = NotificationManager.send_start_message
+send_catalog_changes = NotificationManager.send_catalog_changes
+bind_notification_channel = NotificationManager.bind_channel
 send_summary_message = NotificationManager.send_summary_message
@@ -1,56 +1,119 @@
+from typing import Callable, Optional
+
 from pyrogram import Client
 from pyrogram.errors import RPCError
 
+from app.balance import BalanceLedger, BalanceReservation, balance_ledger
+from app.core.sold_out import sold_out_registry
 from app.errors import handle_gift_error
+from app.journal import PurchaseJournal, purchase_journal
 from app.notifications import send_notification
-from app.utils.helper import get_recipient_info, get_user_balance
+from app.shadow import shadow_recorder
+from app.utils.helper import get_recipient_info
 from app.utils.logger import info, warn
+from app.utils.metrics import PURCHASES_ATTEMPTED, PURCHASES_SUCCEEDED, PURCHASES_FAILED, track_rpc
+from app.utils.tracing import mark
 from data.config import t
 
 
 class GiftPurchaser:
     @staticmethod
-    async def buy_gift(app: Client, chat_id: int, gift_id: int, quantity: int = 1) -> None:
+    async def buy_gift(app: Client, chat_id: int, gift_id: int, quantity: int = 1,
+                       gift_price: Optional[int] = None, preempt: Optional[Callable[[], bool]] = None,
+                       job_id: Optional[str] = None, shadow: bool = False) -> int:
+        """Buy up to ``quantity`` copies for one recipient and return how many were sent.
+
+        ``preempt`` is checked before every send; returning True stops early so the
+        caller can run more urgent purchases first. Sends of a journaled ``job_id`` are
+        recorded in the account's purchase journal. In ``shadow`` mode nothing is sent:
+        each copy is handed to the shadow recorder and counted as sent.
+        """
         recipient_info, username = await get_recipient_info(app, chat_id)
-        gift_price = await GiftPurchaser._get_gift_price(app, gift_id)
-        current_balance = await get_user_balance(app)
+        gift_price = await GiftPurchaser._get_gift_price(app, gift_id) if gift_price is None else gift_price
 
-        max_affordable = min(quantity, current_balance // gift_price) if gift_price > 0 else quantity
+        ledger = balance_ledger(app)
+        reservation = await ledger.reserve(app, gift_price, quantity)
+        max_affordable = reservation.units
 
-        max_affordable == 0 and await GiftPurchaser._handle_insufficient_balance(
-            app, gift_id, gift_price, current_balance, quantity)
+        try:
+            max_affordable == 0 and await GiftPurchaser._handle_insufficient_balance(
+                app, gift_id, gift_price, ledger.available, quantity)
 
-        await GiftPurchaser._purchase_gifts(app, chat_id, gift_id, max_affordable, recipient_info, username)
+            sent = await GiftPurchaser._purchase_gifts(app, chat_id, gift_id, max_affordable, recipient_info,
+                                                       username, ledger, reservation, preempt,
+                                                       purchase_journal(app), job_id, shadow)
+        finally:
+            reservation.release()
 
         max_affordable < quantity and await GiftPurchaser._notify_partial_purchase(
-            app, gift_id, quantity, max_affordable, gift_price, current_balance)
+            app, gift_id, quantity, max_affordable, gift_price, ledger.available)
+
+        return sent
 
     @staticmethod
     async def _get_gift_price(app: Client, gift_id: int) -> int:
         try:
-            gifts = await app.get_available_gifts()
+            async with track_rpc("get_available_gifts"):
+                gifts = await app.get_available_gifts()
             return next((gift.price for gift in gifts if gift.id == gift_id), 0)
         except Exception:
             return 0
 
     @staticmethod
     async def _purchase_gifts(app: Client, chat_id: int, gift_id: int, quantity: int,
-                              recipient_info: str, username: str) -> None:
+                              recipient_info: str, username: str,
+                              ledger: BalanceLedger, reservation: BalanceReservation,
+                              preempt: Optional[Callable[[], bool]] = None,
+                              journal: Optional[PurchaseJournal] = None, job_id: Optional[str] = None,
+                              shadow: bool = False) -> int:
+        sent = 0
         for i in range(quantity):
             current_gift = i + 1
+            if gift_id in sold_out_registry:
+                info(t("console.sold_out_cancelled", gift_id=gift_id, cancelled=quantity - i))
+                break
+
+            if preempt and preempt():
+                break
+
+            shadow or PURCHASES_ATTEMPTED.inc()
+            mark("purchase_prep", recipient=chat_id)
+            journal and journal.attempt(job_id)
+            if shadow:
+                latency = shadow_recorder.record(app, chat_id, gift_id, reservation.unit_price, current_gift, quantity)
+                journal and journal.succeeded(job_id)
+                reservation.commit(shadow=True)
+                sent += 1
+                mark("shadow_send", recipient=chat_id)
+                info(t("console.shadow_gift_sent", current=current_gift, total=quantity, gift_id=gift_id,
+                       recipient=recipient_info, latency=f"{latency:.0f}" if latency is not None else "?"))
+                continue
+
             try:
-                await app.send_gift(chat_id=chat_id, gift_id=gift_id, hide_my_name=True)
+                async with track_rpc("send_gift"):
+                    await app.send_gift(chat_id=chat_id, gift_id=gift_id, hide_my_name=True)
+                journal and journal.succeeded(job_id)
+                PURCHASES_SUCCEEDED.inc()
+                reservation.commit()
+                sent += 1
+                mark("send_gift", recipient=chat_id, ok=True)
                 info(t("console.gift_sent", current=current_gift, total=quantity,
                           gift_id=gift_id, recipient=recipient_info))
                 await send_notification(app, gift_id, user_id=chat_id, username=username,
                                         current_gift=current_gift, total_gifts=quantity,
                                         success_message=True)
             except RPCError as ex:
-                current_balance = await get_user_balance(app)
-                await handle_gift_error(app, ex, gift_id, chat_id,
-                                        await GiftPurchaser._get_gift_price(app, gift_id), current_balance)
+                journal and journal.failed(job_id, getattr(ex, "ID", None))
+                PURCHASES_FAILED.inc()
+                mark("send_gift", recipient=chat_id, ok=False, error=getattr(ex, "ID", None))
+                reservation.release()
+                # Telegram disagrees with the cached balance (spent elsewhere), so re-read it
+                'BALANCE_TOO_LOW' in str(ex) and await ledger.refresh(app)
+                await handle_gift_error(app, ex, gift_id, chat_id, reservation.unit_price, ledger.available)
                 break
 
+        return sent
+
     @staticmethod
     async def _handle_insufficient_balance(app: Client, gift_id: int, gift_price: int, current_balance: int,
                                            requested_quantity: int) -> None:
@@ -0,0 +1,67 @@
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from pyrogram import Client
+
+from app.utils.metrics import SHADOW_PURCHASES
+from app.utils.tracing import TraceWriter, current_trace
+from data.config import config
+
+
+class ShadowRecorder:
+    """Stands in for ``send_gift`` in shadow mode and records the purchase that would have been made.
+
+    Records are JSON lines with the account, gift, recipient and price, plus the
+    decision latency: milliseconds from the start of the catalog poll that found the
+    gift to the moment it would have been sent.
+    """
+
+    def __init__(self, writer: TraceWriter):
+        self.writer = writer
+
+    def record(self, app: Client, chat_id: Union[int, str], gift_id: int, price: int,
+               current: int, total: int) -> Optional[float]:
+        """Record one copy as sent and return its decision latency in ms (None outside a traced drop)."""
+        trace = current_trace.get()
+        latency = round((time.perf_counter() - trace.marks[0][1]) * 1000, 3) if trace else None
+        self.writer.emit([{
+            "time": time.time(),
+            "user_id": trace.drop.user_id if trace else getattr(getattr(app, "me", None), "id", None),
+            "drop_id": trace.drop.drop_id if trace else None,
+            "gift_id": gift_id,
+            "recipient": chat_id,
+            "price": price,
+            "copy": current,
+            "copies": total,
+            "decision_ms": latency,
+        }])
+        SHADOW_PURCHASES.inc()
+        return latency
+
+
+def report(file_path: str) -> str:
+    """Summarize recorded shadow purchases per user: copies, stars and decision latency."""
+    by_user: Dict[Any, List[Dict[str, Any]]] = {}
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            by_user.setdefault(record["user_id"], []).append(record)
+
+    lines = []
+    for user_id, records in by_user.items():
+        latencies = sorted(record["decision_ms"] for record in records if record["decision_ms"] is not None)
+        gifts = {record["gift_id"] for record in records}
+        stars = sum(record["price"] or 0 for record in records)
+        latency_text = f"decision p50 {latencies[len(latencies) // 2]:.0f}ms, max {latencies[-1]:.0f}ms" \
+            if latencies else "no traced decisions"
+        lines.append(f"user {user_id}: {len(records)} copies of {len(gifts)} gifts for {stars}⭐ | {latency_text}")
+
+    return "\n".join(lines)
+
+
+shadow_recorder = ShadowRecorder(TraceWriter(config.SHADOW_FILE))
+
+if __name__ == "__main__":
+    print(report(sys.argv[1] if len(sys.argv) > 1 else config.SHADOW_FILE))
@@ -1,22 +1,33 @@
 from pyrogram import Client
-from pyrogram.types import Message
-from typing import Dict, Any
+from pyrogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from typing import Dict, Any, List, Optional, Tuple
+import csv
+import io
 import json
 
 from app.database import UserConfigManager, AuthManager
+from app.core.gift_rules import RULE_SYNTAX, parse_rules
 from app.core.user_config import UserConfig
-from app.core.multi_user_manager import MultiUserManager
+from app.core.multi_user_manager import multi_user_manager
+from app.core.supervisor import QUARANTINED, RESTARTING, RUNNING
 from app.utils.logger import info, error
+from app.utils.cpu_profiler import cpu_profiler
+from app.utils.memory_profiler import memory_profiler
 from data.config import t
 
 # Global managers
 user_config_manager = UserConfigManager()
 auth_manager = AuthManager()
-multi_user_manager = MultiUserManager()
 
 # Store user setup states
 user_setup_states: Dict[int, Dict[str, Any]] = {}
 
+ADMIN_USERS_PAGE_SIZE = 20
+ADMIN_STATS_MAX_USERS = 30
+ADMIN_CPU_MAX_SECONDS = 300
+HEALTH_ICONS = {RUNNING: '🟢', RESTARTING: '🟡', QUARANTINED: '⛔'}
+MAX_IMPORT_FILE_SIZE = 1024 * 1024
+
 
 async def handle_start(client: Client, message: Message):
     """Handle /start command."""
@@ -36,6 +47,7 @@ async def handle_start(client: Client, message: Message):
         f"**Available Commands:**\n"
         f"• `/setup` - Configure your gift buying settings\n"
         f"• `/settings` - View your current configuration\n"
+        f"• `/rules` - Filter gifts by id, upgrade price and budget\n"
         f"• `/start_bot` - Start your gift buying bot\n"
         f"• `/stop` - Stop your gift buying bot\n\n"
         f"Use `/setup` to get started with configuring your bot!"
@@ -164,8 +176,11 @@ async def handle_setup_step(client: Client, message: Message):
                 "✅ Gift ranges saved!\n\n"
                 "**Step 8/8: Final Options**\n"
                 "Send your preferences in this format:\n"
-                "`upgradable_only:true/false,prioritize_low_supply:true/false`\n\n"
-                "Example: `upgradable_only:false,prioritize_low_supply:true`"
+                "`upgradable_only:true/false,prioritize_low_supply:true/false,prioritize_sellout_eta:true/false,shadow:true/false,buy_existing:true/false`\n\n"
+                "Example: `upgradable_only:false,prioritize_low_supply:true`\n"
+                "`prioritize_sellout_eta` buys the gifts predicted to sell out soonest first.\n"
+                "`shadow` only records what would have been bought, without spending stars.\n"
+                "`buy_existing` also buys matching gifts already on sale when your bot first starts."
             )
         
         elif step == 'final_options':
@@ -173,15 +188,19 @@ async def handle_setup_step(client: Client, message: Message):
             options = parse_final_options(options_text)
             config.update(options)
             
-            # Save configuration
-            success = await user_config_manager.create_user_config(user_id, config)
+            # Save configuration; a running bot picks up updates without restarting
+            if await user_config_manager.get_user_config(user_id):
+                success = await user_config_manager.update_user_config(user_id, config)
+            else:
+                success = await user_config_manager.create_user_config(user_id, config)
             
             if success:
                 await message.reply(
                     "🎉 **Configuration Complete!**\n\n"
                     "Your bot has been configured successfully!\n"
                     "Use `/start_bot` to start your gift buying bot.\n"
-                    "Use `/settings` to view your configuration."
+                    "Use `/settings` to view your configuration.\n"
+                    "If your bot is already running, the new settings apply automatically."
                 )
             else:
                 await message.reply(
@@ -223,21 +242,74 @@ async def handle_my_settings(client: Client, message: Message):
         for r in user_config.gift_ranges
     ])
     
+    rules_text = f"`{'; '.join(user_config.gift_rules.splitlines())}`" if user_config.gift_rules else "None"
+
+    health = multi_user_manager.get_user_health(user_id)
+    health_text = f" (monitor {health})" if user_config.is_active and health != RUNNING else ""
+
     settings_text = (
         f"⚙️ **Your Current Settings**\n\n"
-        f"**Status:** {'🟢 Active' if user_config.is_active else '🔴 Inactive'}\n"
+        f"**Status:** {'🟢 Active' if user_config.is_active else '🔴 Inactive'}{health_text}\n"
         f"**Language:** {user_config.language_display}\n"
         f"**Check Interval:** {user_config.interval}s\n"
         f"**Channel ID:** {user_config.channel_id or 'Disabled'}\n"
         f"**Only Upgradable:** {'Yes' if user_config.purchase_only_upgradable_gifts else 'No'}\n"
-        f"**Prioritize Low Supply:** {'Yes' if user_config.prioritize_low_supply else 'No'}\n\n"
+        f"**Prioritize Low Supply:** {'Yes' if user_config.prioritize_low_supply else 'No'}\n"
+        f"**Prioritize Sell-out ETA:** {'Yes' if user_config.prioritize_sellout_eta else 'No'}\n"
+        f"**Shadow Mode:** {'Yes' if user_config.shadow else 'No'}\n"
+        f"**Buy Existing Gifts on First Start:** {'Yes' if user_config.buy_existing_gifts else 'No'}\n\n"
         f"**Gift Ranges:**\n{ranges_text}\n\n"
-        f"Use `/setup` to reconfigure your settings."
+        f"**Rules:** {rules_text}\n\n"
+        f"Use `/setup` to reconfigure your settings or `/rules` to change the rules."
     )
     
     await message.reply(settings_text)
 
 
+async def handle_rules(client: Client, message: Message):
+    """Handle /rules command to view or replace the gift filter rules."""
+    user_id = message.from_user.id
+
+    if not await auth_manager.is_user_authorized(user_id):
+        await message.reply("❌ You are not authorized to use this bot.")
+        return
+
+    config_data = await user_config_manager.get_user_config(user_id)
+
+    if not config_data:
+        await message.reply(
+            "❌ No configuration found.\n"
+            "Use `/setup` to configure your bot first."
+        )
+        return
+
+    user_config = UserConfig(config_data)
+    parts = message.text.split(maxsplit=1)
+
+    if len(parts) < 2:
+        current = f"```\n{user_config.gift_rules}\n```" if user_config.gift_rules else "No rules set."
+        await message.reply(
+            f"📜 **Gift Rules**\n\n{current}\n\n"
+            f"Send `/rules` followed by one rule per line to replace them, or `/rules clear`.\n\n"
+            f"{RULE_SYNTAX}\n\n"
+            f"Example:\n`/rules deny 5170145012310081615\nmax_upgrade 250\nrange 1 budget 5000`"
+        )
+        return
+
+    rules = '' if parts[1].strip().lower() == 'clear' else parts[1].strip()
+    try:
+        parse_rules(rules, len(user_config.gift_ranges))
+    except ValueError as e:
+        await message.reply(f"❌ Invalid rule: {str(e)}\n\n{RULE_SYNTAX}")
+        return
+
+    # A running bot picks the new rules up without restarting
+    if await user_config_manager.update_user_config(user_id, {'gift_rules': rules}):
+        await message.reply("✅ Rules cleared." if not rules else "✅ Rules saved and applied.")
+    else:
+        await message.reply("❌ Failed to save rules. Please try again.")
+
+
 async def handle_start_bot(client: Client, message: Message):
     """Handle /start_bot command."""
     user_id = message.from_user.id
@@ -301,18 +373,173 @@ async def handle_admin_users(client: Client, message: Message):
         await message.reply("❌ Admin access required.")
         return
     
-    users = await auth_manager.get_authorized_users()
-    
-    if not users:
-        await message.reply("No authorized users found.")
+    text, markup = await render_users_page()
+    await message.reply(text, reply_markup=markup)
+
+
+async def handle_admin_users_page(client: Client, callback_query: CallbackQuery):
+    """Handle the inline navigation buttons of /admin_users."""
+    if not await auth_manager.is_user_admin(callback_query.from_user.id):
+        await callback_query.answer("❌ Admin access required.", show_alert=True)
         return
-    
+
+    _, direction, cursor = callback_query.data.split(":")
+    text, markup = await render_users_page(**{direction: int(cursor)})
+    await callback_query.message.edit_text(text, reply_markup=markup)
+    await callback_query.answer()
+
+
+async def render_users_page(after: Optional[int] = None,
+                            before: Optional[int] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Build one page of /admin_users; the buttons carry the first/last user_id as keyset cursors."""
+    users, more = await auth_manager.get_authorized_users_page(after, before, ADMIN_USERS_PAGE_SIZE)
+
+    if not users:
+        return "No authorized users found.", None
+
     users_text = "\n".join([
-        f"• {user['user_id']} (@{user.get('username', 'N/A')}) {'👑' if user.get('is_admin') else ''}"
+        f"• {user['user_id']} (@{user.get('username') or 'N/A'}) {'👑' if user.get('is_admin') else ''}"
         for user in users
     ])
-    
-    await message.reply(f"**Authorized Users:**\n{users_text}")
+
+    has_previous = more if before is not None else after is not None
+    has_next = more if before is None else True
+    buttons = []
+    if has_previous:
+        buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"admin_users:before:{users[0]['user_id']}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"admin_users:after:{users[-1]['user_id']}"))
+
+    return f"**Authorized Users:**\n{users_text}", InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def handle_admin_stats(client: Client, message: Message):
+    """Handle /admin_stats command (admin only): live runtime figures without any DB queries."""
+    user_id = message.from_user.id
+
+    if not await auth_manager.is_user_admin(user_id):
+        await message.reply("❌ Admin access required.")
+        return
+
+    stats = multi_user_manager.get_runtime_stats()
+
+    users_text = "\n".join([
+        f"• {user['user_id']}: {HEALTH_ICONS.get(user['health'], '🔴')} "
+        + (f"polled {user['last_poll_ago']:.0f}s ago in {user['poll_latency'] * 1000:.0f}ms"
+           if user['last_poll_ago'] is not None else "not polled yet")
+        + (f", {user['queued_purchases']} queued" if user['queued_purchases'] else "")
+        for user in stats['users'][:ADMIN_STATS_MAX_USERS]
+    ]) or "None"
+    hidden = len(stats['users']) - ADMIN_STATS_MAX_USERS
+    if hidden > 0:
+        users_text += f"\n…and {hidden} more"
+    quarantined_text = "\n".join(
+        f"• {quarantined_id}: `{reason}`" for quarantined_id, reason in stats['quarantined'].items()
+    )
+
+    await message.reply(
+        f"📈 **Runtime Stats**\n\n"
+        f"**Active clients:** {stats['active_clients']} ({stats['active_tasks']} monitoring tasks"
+        f"{', ' + str(stats['starting']) + ' starting' if stats['starting'] else ''})\n"
+        + (f"**Node:** {stats['node_id']} ({stats['cluster_nodes']} live nodes)\n" if stats['node_id'] else "")
+        + f"**Purchases (last hour):** {stats['purchases_last_hour']} sent, {stats['failures_last_hour']} failed\n"
+        f"**FLOOD_WAIT:** {stats['flood_waits']} times, {stats['flood_wait_seconds']}s total\n"
+        f"**Event loop lag:** {stats['loop_lag'] * 1000:.1f}ms\n"
+        f"**Memory (RSS):** {stats['rss_bytes'] / 1024 / 1024:.1f} MB\n\n"
+        f"**Accounts:**\n{users_text}"
+        + (f"\n\n**Quarantined:**\n{quarantined_text}" if quarantined_text else "")
+    )
+
+
+async def handle_admin_memory(client: Client, message: Message):
+    """Handle /admin_memory command (admin only): tracemalloc snapshot diffed against the previous one."""
+    user_id = message.from_user.id
+
+    if not await auth_manager.is_user_admin(user_id):
+        await message.reply("❌ Admin access required.")
+        return
+
+    args = message.text.split()
+    if len(args) > 1 and args[1].lower() == 'stop':
+        memory_profiler.stop()
+        await message.reply("🧠 Memory tracing stopped.")
+        return
+
+    try:
+        summary = await memory_profiler.snapshot()
+    except Exception as ex:
+        error(f"Memory snapshot failed: {str(ex)}")
+        await message.reply("❌ Memory snapshot failed.")
+        return
+
+    info(f"Admin {user_id} took a memory snapshot")
+    await message.reply(f"🧠 **Memory Snapshot**\n\n{summary}")
+
+
+async def handle_admin_cpu(client: Client, message: Message):
+    """Handle /admin_cpu command (admin only): sample the event loop for a few seconds."""
+    user_id = message.from_user.id
+
+    if not await auth_manager.is_user_admin(user_id):
+        await message.reply("❌ Admin access required.")
+        return
+
+    args = message.text.split()
+    try:
+        seconds = float(args[1]) if len(args) > 1 else cpu_profiler.seconds
+    except ValueError:
+        await message.reply("❌ Usage: /admin_cpu [seconds]")
+        return
+    seconds = max(1.0, min(seconds, ADMIN_CPU_MAX_SECONDS))
+
+    if cpu_profiler.running:
+        await message.reply("❌ A CPU profile is already running.")
+        return
+
+    await message.reply(f"🔥 Profiling the event loop for {seconds:.0f}s...")
+    info(f"Admin {user_id} started a {seconds:.0f}s CPU profile")
+    try:
+        summary = await cpu_profiler.profile(seconds)
+    except Exception as ex:
+        error(f"CPU profile failed: {str(ex)}")
+        await message.reply("❌ CPU profile failed.")
+        return
+
+    await message.reply(f"🔥 **CPU Profile**\n\n{summary}")
+
+
+async def handle_admin_import(client: Client, message: Message):
+    """Handle /admin_import command (admin only): bulk add users from a CSV/text file or inline lines."""
+    user_id = message.from_user.id
+
+    if not await auth_manager.is_user_admin(user_id):
+        await message.reply("❌ Admin access required.")
+        return
+
+    document = message.document or (message.reply_to_message and message.reply_to_message.document)
+    if document:
+        if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+            await message.reply("❌ File is too large (1 MB max).")
+            return
+        content = (await client.download_media(document, in_memory=True)).getvalue().decode('utf-8-sig', 'replace')
+    else:
+        content = (message.text or "").partition("\n")[2]
+
+    users, skipped = parse_user_import(content)
+    if not users:
+        await message.reply(
+            "Usage: send a CSV/text file with the caption `/admin_import`, reply `/admin_import` to one, "
+            "or put the lines after the command.\n"
+            "One user per line: `user_id[,username[,admin]]` (admin: true/false, defaults to false; "
+            "existing users are overwritten)."
+        )
+        return
+
+    if await auth_manager.upsert_authorized_users(users):
+        admins = sum(user['is_admin'] for user in users)
+        await message.reply(f"✅ Imported {len(users)} users ({admins} admins), skipped {skipped} lines.")
+    else:
+        await message.reply("❌ Failed to import users.")
 
 
 async def handle_admin_add_user(client: Client, message: Message):
@@ -370,6 +597,31 @@ async def handle_admin_remove_user(client: Client, message: Message):
         await message.reply("❌ Invalid user ID.")
 
 
+def parse_user_import(content: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Parse `user_id[,username[,admin]]` lines into unique rows; returns the rows and skipped line count."""
+    users: Dict[int, Dict[str, Any]] = {}
+    skipped = 0
+
+    for row in csv.reader(io.StringIO(content.replace(';', ','))):
+        cells = [cell.strip() for cell in (row[0].split() if len(row) == 1 else row)]
+        if not cells or not cells[0]:
+            continue
+
+        try:
+            target_user_id = int(cells[0])
+        except ValueError:
+            # Header rows and anything else that is not a user id
+            skipped += 1
+            continue
+
+        username = cells[1].lstrip('@') if len(cells) > 1 and cells[1] else None
+        is_admin = len(cells) > 2 and cells[2].lower() in ('true', 'admin', 'admin:true', 'yes', '1')
+        users[target_user_id] = {'user_id': target_user_id, 'username': username, 'is_admin': is_admin}
+
+    # Postgres rejects an upsert that touches the same row twice, so duplicates keep their last line
+    return list(users.values()), skipped
+
+
 def parse_gift_ranges_from_text(ranges_text: str) -> list:
     """Parse gift ranges from user input text."""
     ranges = []
@@ -408,7 +660,10 @@ def parse_final_options(options_text: str) -> dict:
     """Parse final options from user input."""
     options = {
         'purchase_only_upgradable_gifts': False,
-        'prioritize_low_supply': False
+        'prioritize_low_supply': False,
+        'prioritize_sellout_eta': False,
+        'shadow_mode': False,
+        'buy_existing_gifts': False
     }
     
     try:
@@ -421,6 +676,12 @@ def parse_final_options(options_text: str) -> dict:
                 options['purchase_only_upgradable_gifts'] = value
             elif key == 'prioritize_low_supply':
                 options['prioritize_low_supply'] = value
+            elif key == 'prioritize_sellout_eta':
+                options['prioritize_sellout_eta'] = value
+            elif key == 'shadow':
+                options['shadow_mode'] = value
+            elif key == 'buy_existing':
+                options['buy_existing_gifts'] = value
     
     except (ValueError, IndexError):
         pass
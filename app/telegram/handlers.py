@@ -1,9 +1,9 @@
 from pyrogram import Client, filters, handlers
 from pyrogram.types import Message
 from .commands import (
-    handle_start, handle_setup, handle_my_settings, handle_stop_bot,
+    handle_start, handle_setup, handle_my_settings, handle_rules, handle_stop_bot,
     handle_start_bot, handle_admin_users, handle_admin_add_user,
-    handle_admin_remove_user, handle_setup_step
+    handle_admin_remove_user, handle_admin_import, handle_admin_stats, handle_admin_memory, handle_admin_cpu, handle_admin_users_page, handle_setup_step
 )
 
 
@@ -14,6 +14,7 @@ def setup_handlers(app: Client):
     app.add_handler(handlers.MessageHandler(handle_start, filters.command("start") & filters.private))
     app.add_handler(handlers.MessageHandler(handle_setup, filters.command("setup") & filters.private))
     app.add_handler(handlers.MessageHandler(handle_my_settings, filters.command("settings") & filters.private))
+    app.add_handler(handlers.MessageHandler(handle_rules, filters.command("rules") & filters.private))
     app.add_handler(handlers.MessageHandler(handle_stop_bot, filters.command("stop") & filters.private))
     app.add_handler(handlers.MessageHandler(handle_start_bot, filters.command("start_bot") & filters.private))
     
@@ -21,6 +22,11 @@ def setup_handlers(app: Client):
     app.add_handler(handlers.MessageHandler(handle_admin_users, filters.command("admin_users") & filters.private))
     app.add_handler(handlers.MessageHandler(handle_admin_add_user, filters.command("admin_add") & filters.private))
     app.add_handler(handlers.MessageHandler(handle_admin_remove_user, filters.command("admin_remove") & filters.private))
+    app.add_handler(handlers.MessageHandler(handle_admin_import, filters.command("admin_import") & filters.private))
+    app.add_handler(handlers.MessageHandler(handle_admin_stats, filters.command("admin_stats") & filters.private))
+    app.add_handler(handlers.MessageHandler(handle_admin_memory, filters.command("admin_memory") & filters.private))
+    app.add_handler(handlers.MessageHandler(handle_admin_cpu, filters.command("admin_cpu") & filters.private))
+    app.add_handler(handlers.CallbackQueryHandler(handle_admin_users_page, filters.regex(r"^admin_users:(after|before):-?\d+$")))
     
     # Setup conversation handler
     app.add_handler(handlers.MessageHandler(handle_setup_step, filters.text & filters.private))
\ No newline at end of file
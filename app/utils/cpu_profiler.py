@@ -0,0 +1,172 @@
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Dict, Optional
+
+from app.utils.logger import info, error, log_user_id
+from data.config import config
+
+# Monitor tasks are named after their user, for Pythons whose tasks do not expose their context
+MONITOR_TASK_PREFIX = "monitor_"
+
+# Frames kept per sample, innermost first; deeper callers are cut off
+MAX_DEPTH = 64
+
+
+class CpuProfiler:
+    """Statistical profiler for the event loop thread, switched on for a fixed time.
+
+    Where the loop runs on the main thread of a Unix process, a CPU-time timer
+    (``ITIMER_PROF``) interrupts it every ``interval`` seconds of CPU and the signal
+    handler records the interrupted stack, so idle time is not sampled. Elsewhere a
+    background thread reads the loop thread's stack from ``sys._current_frames`` every
+    ``interval`` seconds of wall time, with the GIL switch interval shortened so the
+    loop cannot hold it back until the next ``select``. Samples are
+    counted under the user whose monitor (or purchase worker) task is running, read
+    from its ``log_context``, and written in collapsed format (``user_1;frame;frame
+    count``) for flamegraph.pl, speedscope or inferno. Nothing runs while it is off.
+    """
+
+    def __init__(self, directory: str = "data/profiles", interval: float = 0.005, seconds: float = 30.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.seconds = seconds
+        self._labels: Dict[CodeType, str] = {}
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def profile(self, seconds: float) -> str:
+        """Sample the loop for ``seconds`` and return a summary; the stacks go to a file in ``directory``."""
+        if self.running:
+            raise RuntimeError("a CPU profile is already running")
+
+        samples: Counter = Counter()
+        timer = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+        started_at = time.time()
+        if timer:
+            previous_handler = signal.signal(signal.SIGPROF, lambda signum, frame: self._record(samples, frame))
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            # Make the loop thread hand over the GIL well within a sampling interval
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(switch_interval, self.interval / 10))
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="cpu-profiler", daemon=True,
+                                            args=(asyncio.get_running_loop(), threading.get_ident(), samples))
+            self._thread.start()
+        self._running = True
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._running = False
+            if timer:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, previous_handler)
+            else:
+                self._stop.set()
+                await asyncio.to_thread(self._thread.join)
+                self._thread = None
+                sys.setswitchinterval(switch_interval)
+
+        total = sum(samples.values())
+        header = f"{total} samples, ~{total * self.interval:.1f}s of CPU in {seconds:.0f}s" if timer else \
+            f"{total} samples over {seconds:.0f}s of wall time"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"cpu-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started_at))}.folded"
+        await asyncio.to_thread(path.write_text, "".join(f"{stack} {count}\n" for stack, count in samples.items()),
+                                "utf-8")
+        return f"{self._summarize(samples, header)}\n\nStacks: {path}"
+
+    def on_signal(self) -> None:
+        """Signal handler: profile for the default ``seconds`` in the background and log the summary."""
+        asyncio.get_running_loop().create_task(self._log_profile(self.seconds))
+
+    async def _log_profile(self, seconds: float) -> None:
+        try:
+            info(f"CPU profiling for {seconds:.0f}s")
+            info(await self.profile(seconds))
+        except Exception as ex:
+            error(f"CPU profile failed: {str(ex)}")
+
+    def _record(self, samples: Counter, frame: Optional[FrameType]) -> None:
+        # Runs in the loop thread, inside the context of the interrupted task
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        samples[f"{self._tag(task, log_user_id.get())};{self._stack(frame)}"] += 1
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, thread_id: int, samples: Counter) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            try:
+                task = asyncio.current_task(loop)
+            except RuntimeError:
+                task = None
+            get_context = getattr(task, "get_context", None)
+            samples[f"{self._tag(task, get_context().get(log_user_id) if get_context else None)};"
+                    f"{self._stack(frame)}"] += 1
+
+    @staticmethod
+    def _tag(task: Optional[asyncio.Task], user_id: Optional[int]) -> str:
+        if user_id is not None:
+            return f"user_{user_id}"
+        if task is None:
+            return "loop"
+        name = task.get_name()
+        return f"user_{name[len(MONITOR_TASK_PREFIX):]}" if name.startswith(MONITOR_TASK_PREFIX) else "loop"
+
+    def _stack(self, frame: Optional[FrameType]) -> str:
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._labels.get(frame.f_code) or self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _label(self, code: CodeType) -> str:
+        filename = code.co_filename.replace("\\", "/")
+        if "/site-packages/" in filename:
+            filename = filename.split("/site-packages/", 1)[1]
+        elif filename.startswith(os.getcwd().replace("\\", "/") + "/"):
+            filename = filename[len(os.getcwd()) + 1:]
+        else:
+            filename = filename.rsplit("/", 1)[-1]
+        label = self._labels[code] = f"{filename}:{code.co_name}".replace(";", ":").replace(" ", "_")
+        return label
+
+    @staticmethod
+    def _summarize(samples: Counter, header: str) -> str:
+        total = sum(samples.values())
+        if not total:
+            return header
+
+        users: Counter = Counter()
+        leaves: Counter = Counter()
+        for stack, count in samples.items():
+            tag, _, frames = stack.partition(";")
+            users[tag] += count
+            leaves[frames.rsplit(";", 1)[-1]] += count
+
+        share = lambda count: f"{count / total * 100:.1f}%"
+        return "\n".join(
+            [header, "", "By account:"]
+            + [f"• {tag}: {share(count)}" for tag, count in users.most_common(5)]
+            + ["", "Top functions (self):"]
+            + [f"• `{leaf}`: {share(count)}" for leaf, count in leaves.most_common(8)]
+        )
+
+
+cpu_profiler = CpuProfiler(config.PROFILE_DIR, config.PROFILE_CPU_INTERVAL, config.PROFILE_CPU_SECONDS)
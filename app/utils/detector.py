@@ -1,22 +1,38 @@
 import asyncio
 import json
-import time
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 
 from pyrogram import Client, types
 
-from app.notifications import send_summary_message
-from app.utils.logger import log_same_line, info
+from app.notifications import send_catalog_changes, send_summary_message
+from app.utils.logger import log_same_line, info, log_context
+from app.utils.metrics import LAST_POLL_LATENCY, LAST_POLL_TIME, POLL_LATENCY, track_rpc
+from app.utils.tracing import DropTrace
 from data.config import t
+from app.core.callbacks import plan_drop, record_sold_out, reprioritize_purchases
+from app.core.catalog_bus import catalog_bus
+from app.core.gift_rules import SKIP_COUNTERS, Verdict
+from app.core.catalog_diff import CatalogDiffer, CatalogEvent, CatalogFeed, catalog_snapshot
+from app.core.catalog_recording import catalog_recorder
+from app.core.purchase_queue import gift_priority
+from app.core.sold_out import sold_out_registry
+from app.core.supply_history import supply_recorder
 from app.core.user_config import UserConfig
 
+# Oldest shared catalog a new user's history is seeded from; older ones are fetched again
+SEED_SNAPSHOT_MAX_AGE = 60.0
+
 
 class GiftDetector:
+    @staticmethod
+    def history_file(user_id: int) -> Path:
+        return Path(f"data/history/user_{user_id}_history.json")
+
     @staticmethod
     async def load_gift_history(user_id: int) -> Dict[int, dict]:
         """Load gift history for a specific user."""
-        history_file = Path(f"data/history/user_{user_id}_history.json")
+        history_file = GiftDetector.history_file(user_id)
         try:
             with history_file.open("r", encoding='utf-8') as file:
                 return {gift["id"]: gift for gift in json.load(file)}
@@ -26,87 +42,153 @@ class GiftDetector:
     @staticmethod
     async def save_gift_history(gifts: List[dict], user_id: int) -> None:
         """Save gift history for a specific user."""
-        history_file = Path(f"data/history/user_{user_id}_history.json")
+        history_file = GiftDetector.history_file(user_id)
         history_file.parent.mkdir(parents=True, exist_ok=True)
         
         with history_file.open("w", encoding='utf-8') as file:
             json.dump(gifts, file, indent=4, default=types.Object.default, ensure_ascii=False)
 
     @staticmethod
-    async def fetch_current_gifts(app: Client) -> Tuple[Dict[int, dict], List[int]]:
-        gifts = [
-            json.loads(json.dumps(gift, default=types.Object.default, ensure_ascii=False))
-            for gift in await app.get_available_gifts()
-        ]
-        gifts_dict = {gift["id"]: gift for gift in gifts}
-        return gifts_dict, list(gifts_dict.keys())
+    async def seed_gift_history(app: Client, user_config: UserConfig) -> None:
+        """Give a user without history the current catalog as already seen.
+
+        The catalog comes from another monitor of this process when one polled recently,
+        otherwise from one fetch. The first poll then only reacts to real drops instead of
+        treating the whole catalog as new. With ``buy_existing_gifts`` the gifts the user's
+        rules would buy are left out, so the first poll queues exactly those.
+        """
+        if GiftDetector.history_file(user_config.user_id).exists():
+            return
+
+        gifts = catalog_snapshot.gifts(SEED_SNAPSHOT_MAX_AGE)
+        if gifts is None:
+            differ = CatalogDiffer()
+            differ.diff((await GiftDetector.fetch_current_gifts(app))[1])
+            gifts = list(differ.gifts.values())
+
+        seen = [gift for gift in gifts if not user_config.rules.evaluate(gift).eligible] \
+            if user_config.buy_existing_gifts else gifts
+        await GiftDetector.save_gift_history(seen, user_config.user_id)
+        info(f"Seeded gift history of user {user_config.user_id} with {len(seen)} gifts"
+             + (f", {len(gifts) - len(seen)} on sale left to buy" if len(seen) < len(gifts) else ""))
+
+    @staticmethod
+    async def fetch_current_gifts(app: Client, after: int = 0) -> Tuple[int, List[Any]]:
+        """The catalog as (bus sequence number, gifts); straight from Telegram when the bus is off."""
+        if catalog_bus.enabled:
+            catalog = await catalog_bus.fetch(app, after)
+        else:
+            async with track_rpc("get_available_gifts"):
+                catalog = after, await app.get_available_gifts()
+        catalog_recorder.record(catalog[1])
+        return catalog
+
+    @staticmethod
+    def diff_catalog(differ: CatalogDiffer, available_gifts: List[Any]) -> List[CatalogEvent]:
+        events = differ.diff(available_gifts)
+
+        # Another account may already have hit STARGIFT_USAGE_LIMITED before the catalog caught up. Only the
+        # events see it: the snapshot keeps Telegram's values, so its own sold-out flip is still reported
+        sold_out = sold_out_registry.sold_out_among(event.gift_id for event in events)
+        for event in events:
+            if event.gift_id in sold_out and not event.gift.get("is_sold_out"):
+                event.gift = {**event.gift, "is_sold_out": True}
+        return events
 
     @staticmethod
-    def categorize_skipped_gifts(gift_data: Dict[str, Any], user_config: UserConfig) -> Dict[str, int]:
-        skip_rules = {
-            'sold_out_count': gift_data.get("is_sold_out", False),
-            'non_limited_count': not gift_data.get("is_limited"),
-            'non_upgradable_count': user_config.purchase_only_upgradable_gifts and "upgrade_price" not in gift_data
-        }
-        return {key: 1 if condition else 0 for key, condition in skip_rules.items()}
+    def categorize_skipped_gifts(verdict: Verdict) -> Optional[str]:
+        """The summary counter a gift is skipped under, from the same verdict that decides its purchase."""
+        return SKIP_COUNTERS.get(verdict.reason)
 
     @staticmethod
     def prioritize_gifts(gifts: Dict[int, dict], gift_ids: List[int], user_config: UserConfig) -> List[Tuple[int, dict]]:
         for gift_id, gift_data in gifts.items():
             gift_data["position"] = len(gift_ids) - gift_ids.index(gift_id)
 
-        sorted_gifts = sorted(gifts.items(), key=lambda x: x[1]["position"])
-
-        return sorted(sorted_gifts, key=lambda x: (
-            x[1].get("total_amount", float('inf')) if x[1].get("is_limited", False) else float('inf'),
-            x[1]["position"]
-        )) if user_config.prioritize_low_supply else sorted_gifts
+        return sorted(gifts.items(), key=lambda x: gift_priority(x[1], user_config))
 
 
 class GiftMonitor:
     @staticmethod
-    async def run_detection_loop(app: Client, callback: Callable, user_config: UserConfig) -> None:
-        """Run gift detection loop for a specific user."""
+    async def run_detection_loop(app: Client, callback: Callable, get_config: Callable[[], UserConfig]) -> None:
+        """Run gift detection loop for a specific user.
+
+        The config is re-read from ``get_config`` on every tick so hot-reloaded
+        settings apply without reconnecting the client. Each poll is diffed against
+        the previous one and the resulting events go to the purchase pipeline and
+        notifications; history is read once to seed the diff and written only on change.
+        """
         animation_counter = 0
-        user_id = user_config.user_id
+        catalog_seq = 0
+        user_id = get_config().user_id
+
+        differ = CatalogDiffer()
+        differ.seed((await GiftDetector.load_gift_history(user_id)).values())
+        drop = DropTrace(user_id)
+
+        async def on_added(client: Client, user_config: UserConfig, events: List[CatalogEvent]) -> None:
+            new_gifts = {event.gift_id: event.gift for event in events}
+            await GiftMonitor._process_new_gifts(client, new_gifts, differ.gift_ids, callback, user_config, drop)
+
+        feed = CatalogFeed()
+        feed.subscribe(on_added, CatalogEvent.ADDED)
+        feed.subscribe(record_sold_out, CatalogEvent.SOLD_OUT)
+        feed.subscribe(send_catalog_changes, CatalogEvent.SOLD_OUT, CatalogEvent.PRICE_CHANGED)
+        feed.subscribe(supply_recorder.on_catalog_events, CatalogEvent.ADDED, CatalogEvent.SUPPLY_CHANGED)
+        # Runs after the recorder so ETAs include this poll's samples
+        feed.subscribe(reprioritize_purchases, CatalogEvent.SUPPLY_CHANGED)
 
         while True:
+            user_config = get_config()
             animation_counter = (animation_counter + 1) % 4
             log_same_line(f'{t("console.gift_checking")}{"." * animation_counter}')
-            time.sleep(0.2)
 
             app.is_connected or await app.start()
 
-            old_gifts = await GiftDetector.load_gift_history(user_id)
-            current_gifts, gift_ids = await GiftDetector.fetch_current_gifts(app)
+            drop = DropTrace(user_id)
+            catalog_seq, available_gifts = await GiftDetector.fetch_current_gifts(app, catalog_seq)
+            drop.mark("catalog_fetch")
+            poll_latency = drop.marks[-1][1] - drop.marks[0][1]
+            POLL_LATENCY.observe(poll_latency, user_id=user_id)
+            LAST_POLL_LATENCY.set(poll_latency, user_id=user_id)
+            LAST_POLL_TIME.set(drop.started_at, user_id=user_id)
 
-            new_gifts = {
-                gift_id: gift_data for gift_id, gift_data in current_gifts.items()
-                if gift_id not in old_gifts
-            }
+            events = GiftDetector.diff_catalog(differ, available_gifts)
+            catalog_snapshot.publish(differ)
+            drop.mark("diff", changed=len(events))
 
-            new_gifts and await GiftMonitor._process_new_gifts(app, new_gifts, gift_ids, callback, user_config)
+            await feed.publish(events, app, user_config)
 
-            await GiftDetector.save_gift_history(list(current_gifts.values()), user_id)
+            events and await GiftDetector.save_gift_history(list(differ.gifts.values()), user_id)
             await asyncio.sleep(user_config.interval)
 
     @staticmethod
-    async def _process_new_gifts(app: Client, new_gifts: Dict[int, dict], gift_ids: List[int], 
-                                 callback: Callable, user_config: UserConfig) -> None:
+    async def _process_new_gifts(app: Client, new_gifts: Dict[int, dict], gift_ids: List[int],
+                                 callback: Callable, user_config: UserConfig, drop: DropTrace) -> None:
         info(f'{t("console.new_gifts")} {len(new_gifts)}')
 
         skip_counts = {'sold_out_count': 0, 'non_limited_count': 0, 'non_upgradable_count': 0}
 
-        for gift_data in new_gifts.values():
-            gift_skips = GiftDetector.categorize_skipped_gifts(gift_data, user_config)
-            for key, value in gift_skips.items():
-                skip_counts[key] += value
+        # One rule pass per gift; the verdict feeds the summary, the plan and the purchase
+        verdicts = {gift_id: user_config.rules.evaluate(gift_data) for gift_id, gift_data in new_gifts.items()}
+        for verdict in verdicts.values():
+            counter = GiftDetector.categorize_skipped_gifts(verdict)
+            if counter:
+                skip_counts[counter] += 1
 
         prioritized_gifts = GiftDetector.prioritize_gifts(new_gifts, gift_ids, user_config)
+        drop.mark("prioritization")
+
+        allocations = await plan_drop(app, prioritized_gifts, user_config, verdicts)
+        drop.mark("planning")
 
         for gift_id, gift_data in prioritized_gifts:
             gift_data['id'] = gift_id
-            await callback(app, gift_data)
+            with drop.gift(gift_id), log_context(gift_id=gift_id):
+                await callback(app, gift_data, user_config, allocations.get(gift_id) if allocations else None,
+                               verdicts[gift_id])
+
+        drop.finish()
 
         await send_summary_message(app, **skip_counts)
 
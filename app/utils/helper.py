@@ -2,19 +2,23 @@ from typing import Optional, Tuple
 
 from pyrogram import Client
 
+from app.utils.metrics import track_rpc
+
 
 class UserHelper:
     @staticmethod
     async def get_user_balance(client: Client) -> int:
         try:
-            return await client.get_stars_balance()
+            async with track_rpc("get_stars_balance"):
+                return await client.get_stars_balance()
         except Exception:
             return 0
 
     @staticmethod
     async def get_recipient_info(app: Client, chat_id: int) -> Tuple[str, str]:
         try:
-            user = await app.get_chat(chat_id)
+            async with track_rpc("get_chat"):
+                user = await app.get_chat(chat_id)
             username = user.username or ""
 
             format_rules = {
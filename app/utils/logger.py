@@ -1,51 +1,170 @@
+import atexit
 import datetime
+import json
 import logging
+import queue
 import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Optional
+
+STATUS_LEVEL = 5
+logging.addLevelName(STATUS_LEVEL, "STATUS")
+
+log_user_id: ContextVar[Optional[int]] = ContextVar("log_user_id", default=None)
+log_gift_id: ContextVar[Optional[int]] = ContextVar("log_gift_id", default=None)
+
+
+@contextmanager
+def log_context(user_id: Optional[int] = None, gift_id: Optional[int] = None) -> Iterator[None]:
+    """Attach user/gift ids to every record logged from the current task."""
+    tokens = [
+        (var, var.set(value)) for var, value in ((log_user_id, user_id), (log_gift_id, gift_id))
+        if value is not None
+    ]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        # The status line aggregates every account, so it carries no context
+        aggregate = record.levelno == STATUS_LEVEL
+        record.user_id = None if aggregate else log_user_id.get()
+        record.gift_id = None if aggregate else log_gift_id.get()
+        return True
 
 
 class TimestampFormatter(logging.Formatter):
     def __init__(self):
         super().__init__('%(message)s')
+        self._cached_second = None
+        self._cached_timestamp = ""
+
+    def _timestamp(self, created: float) -> str:
+        # Records arrive many per second; only reformat when the second changes
+        second = int(created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_timestamp = datetime.datetime.fromtimestamp(second).strftime("%d.%m.%y %H:%M:%S")
+        return self._cached_timestamp
 
     def format(self, record):
-        timestamp = datetime.datetime.now().strftime("%d.%m.%y %H:%M:%S")
-        record.message = f"[{timestamp}] - [{record.levelname}]: {record.getMessage()}"
+        context = "".join(
+            f"[{label}:{value}] " for label, value in (("user", getattr(record, "user_id", None)),
+                                                        ("gift", getattr(record, "gift_id", None)))
+            if value is not None
+        )
+        level = getattr(record, "status_level", record.levelname)
+        record.message = f"[{self._timestamp(record.created)}] - [{level}]: {context}{record.getMessage()}"
         return record.message
 
 
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "ts": record.created,
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "user_id": getattr(record, "user_id", None),
+            "gift_id": getattr(record, "gift_id", None),
+        }, ensure_ascii=False)
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """Writes log lines and the single status line; runs on the background writer thread."""
+
+    def __init__(self, stream=None):
+        super().__init__(stream or sys.stdout)
+        self.json_lines = False
+
+    def emit(self, record):
+        try:
+            if record.levelno == STATUS_LEVEL:
+                if not self.json_lines:
+                    self.stream.write(f"\r{self.format(record)}")
+                    self.flush()
+                return
+
+            self.stream.write(f"{'' if self.json_lines else chr(13)}{self.format(record)}\n")
+            self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class StatusLine:
+    """Collapses per-user status updates into one line drawn at most once per interval."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._last_render = 0.0
+        self._sources = {}
+
+    def update(self, message: str, level: str) -> None:
+        now = time.monotonic()
+        self._sources[log_user_id.get()] = now
+
+        if now - self._last_render < self.interval:
+            return
+
+        self._last_render = now
+        self._sources = {source: seen for source, seen in self._sources.items() if now - seen < self.interval * 2}
+        accounts = len(self._sources)
+        suffix = f" [{accounts} accounts]" if accounts > 1 else ""
+        logger.log(STATUS_LEVEL, f"{message}{suffix}", extra={"status_level": level.upper()})
+
+
 logger = logging.getLogger("gifts_buyer")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(STATUS_LEVEL)
+logger.propagate = False
 
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.DEBUG)
+handler = ConsoleHandler()
+handler.setLevel(STATUS_LEVEL)
 handler.setFormatter(TimestampFormatter())
-logger.addHandler(handler)
+
+# Callers only enqueue records; formatting and stdout writes happen on the listener thread
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(ContextFilter())
+logger.addHandler(queue_handler)
+
+listener = QueueListener(log_queue, handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+status_line = StatusLine()
 
 
 class LoggerInterface:
     @staticmethod
-    def _log_clear(level_method, message: str) -> None:
-        print("\r", end="")
-        level_method(message)
+    def configure(log_format: str = "text", status_interval: float = 1.0) -> None:
+        handler.json_lines = log_format.lower() == "json"
+        handler.setFormatter(JsonLinesFormatter() if handler.json_lines else TimestampFormatter())
+        status_line.interval = status_interval
 
     @staticmethod
     def info(message: str) -> None:
-        LoggerInterface._log_clear(logger.info, message)
+        logger.info(message)
 
     @staticmethod
     def warn(message: str) -> None:
-        LoggerInterface._log_clear(logger.warning, message)
+        logger.warning(message)
 
     @staticmethod
     def error(message: str) -> None:
-        LoggerInterface._log_clear(logger.error, message)
+        logger.error(message)
 
     @staticmethod
     def log_same_line(message: str, level: str = "INFO") -> None:
-        timestamp = datetime.datetime.now().strftime("%d.%m.%y %H:%M:%S")
-        print(f"\r[{timestamp}] - [{level.upper()}]: {message}", end="", flush=True)
+        status_line.update(message, level)
 
 
+configure_logging = LoggerInterface.configure
 info = LoggerInterface.info
 warn = LoggerInterface.warn
 error = LoggerInterface.error
@@ -0,0 +1,123 @@
+import asyncio
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.logger import info, error
+from data.config import config
+
+# Subsystems an allocation is charged to: the innermost frame whose path contains one of the markers
+SUBSYSTEMS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("catalog copies", ("app/core/catalog_bus.py", "app/core/catalog_recording.py")),
+    ("detector history", ("app/utils/detector.py", "app/core/catalog_diff.py")),
+    ("supply history", ("app/core/supply_history.py",)),
+    ("notifications", ("app/notifications.py",)),
+    ("i18n", ("app/utils/localization.py", "/yaml/")),
+    ("purchases", ("app/purchase.py", "app/journal.py", "app/balance.py", "app/core/purchase_queue.py",
+                   "app/core/callbacks.py", "app/core/planner.py")),
+    ("tracing & logs", ("app/utils/tracing.py", "app/utils/logger.py", "app/utils/metrics.py")),
+    ("database", ("app/database/", "/supabase/", "/postgrest/", "/httpx/", "/httpcore/")),
+    ("pyrogram clients", ("/pyrogram/", "/tgcrypto")),
+    ("other app code", ("app/", "data/", "main.py")),
+)
+OTHER = "other"
+
+# Allocation sites listed in the report file
+TOP_SITES = 30
+
+
+def subsystem_of(traceback: tracemalloc.Traceback) -> str:
+    for frame in reversed(traceback):
+        filename = frame.filename.replace("\\", "/")
+        for name, markers in SUBSYSTEMS:
+            if any(marker in filename for marker in markers):
+                return name
+    return OTHER
+
+
+class MemoryProfiler:
+    """tracemalloc snapshots on demand, diffed against the previous one and grouped by subsystem.
+
+    The first ``snapshot`` starts tracing (allocations made before it are not seen) and
+    records a baseline; every later one reports what grew since the previous snapshot
+    and writes the full report, with the top allocation sites, to ``directory``.
+    Tracing slows allocations down, so ``stop`` it once the growth is found.
+    """
+
+    def __init__(self, directory: str = "data/profiles", frames: int = 10):
+        self.directory = Path(directory)
+        self.frames = frames
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._previous_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._previous = None
+
+    async def snapshot(self) -> str:
+        """Take a snapshot and return a short summary of the growth since the previous one."""
+        async with self._lock:
+            if not self.tracing:
+                tracemalloc.start(self.frames)
+                self._previous, self._previous_at = await asyncio.to_thread(self._take), time.time()
+                return "Memory tracing started; the next snapshot reports what grew since now."
+
+            snapshot, taken_at = await asyncio.to_thread(self._take), time.time()
+            report, summary = await asyncio.to_thread(self._report, snapshot, taken_at)
+            self._previous, self._previous_at = snapshot, taken_at
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"memory-{time.strftime('%Y%m%d-%H%M%S', time.localtime(taken_at))}.txt"
+            path.write_text(report, encoding="utf-8")
+            return f"{summary}\n\nFull report: {path}"
+
+    def on_signal(self) -> None:
+        """Signal handler: snapshot in the background and log the summary."""
+        asyncio.get_running_loop().create_task(self._log_snapshot())
+
+    async def _log_snapshot(self) -> None:
+        try:
+            info(await self.snapshot())
+        except Exception as ex:
+            error(f"Memory snapshot failed: {str(ex)}")
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    def _report(self, snapshot: tracemalloc.Snapshot, taken_at: float) -> Tuple[str, str]:
+        diffs = snapshot.compare_to(self._previous, "traceback")
+        totals: Dict[str, List[int]] = {}
+        for diff in diffs:
+            total = totals.setdefault(subsystem_of(diff.traceback), [0, 0, 0])
+            total[0] += diff.size
+            total[1] += diff.size_diff
+            total[2] += diff.count_diff
+
+        rows = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        traced, peak = tracemalloc.get_traced_memory()
+        minutes = (taken_at - self._previous_at) / 60
+        header = f"Traced {traced / 2 ** 20:.1f} MB (peak {peak / 2 ** 20:.1f} MB), change over {minutes:.1f} min:"
+        lines = [f"{name}: {size / 2 ** 20:.2f} MB ({size_diff / 2 ** 20:+.2f} MB, {count_diff:+d} blocks)"
+                 for name, (size, size_diff, count_diff) in rows]
+        summary = "\n".join([header] + [f"• {line}" for line in lines[:6]])
+
+        report = [header, ""] + lines + ["", f"Top {TOP_SITES} growing allocation sites:"]
+        for diff in sorted(diffs, key=lambda diff: diff.size_diff, reverse=True)[:TOP_SITES]:
+            report.append(f"\n{diff.size_diff / 1024:+.1f} KiB ({diff.count_diff:+d} blocks) "
+                          f"[{subsystem_of(diff.traceback)}]")
+            report.extend(diff.traceback.format(limit=self.frames))
+        return "\n".join(report) + "\n", summary
+
+
+memory_profiler = MemoryProfiler(config.PROFILE_DIR, config.PROFILE_MEMORY_FRAMES)
@@ -0,0 +1,319 @@
+import asyncio
+import bisect
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from pyrogram.errors import FloodWait
+
+from app.utils.logger import info, error
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def _format_labels(self, key: Tuple, extra: str = "") -> str:
+        parts = [f'{label}="{value}"' for label, value in zip(self.labelnames, key)]
+        extra and parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(header + self.samples())
+
+
+class RollingWindow:
+    """Sum over the last ``span`` seconds, kept in fixed time slots so updates are O(1)."""
+
+    def __init__(self, span: float = 3600.0, slots: int = 60):
+        self.slot_seconds = span / slots
+        self.slots = [0.0] * slots
+        self.stamps = [-1] * slots
+
+    def add(self, amount: float, now: Optional[float] = None) -> None:
+        tick = int((time.monotonic() if now is None else now) // self.slot_seconds)
+        index = tick % len(self.slots)
+        if self.stamps[index] != tick:
+            self.stamps[index], self.slots[index] = tick, 0.0
+        self.slots[index] += amount
+
+    def total(self, now: Optional[float] = None) -> float:
+        tick = int((time.monotonic() if now is None else now) // self.slot_seconds)
+        return sum(value for value, stamp in zip(self.slots, self.stamps) if tick - stamp < len(self.slots))
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 window: Optional[float] = None):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple, float] = {}
+        self.window = RollingWindow(window) if window else None
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+        self.window and self.window.add(amount)
+
+    def recent(self) -> float:
+        """Total across labels over the counter's rolling window (0 when it has none)."""
+        return self.window.total() if self.window else 0
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._function() if self._function else self.values.get(self._key(labels), 0)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value on scrape instead of tracking it."""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function:
+            return [f"{self.name} {self._function()}"]
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # Per bucket counts (non-cumulative) followed by sum and count
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le_label = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-2]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                window: Optional[float] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, window))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+POLL_LATENCY = registry.histogram("gifts_buyer_catalog_poll_seconds",
+                                  "Catalog poll latency per account", ("user_id",))
+RPC_CALLS = registry.counter("gifts_buyer_rpc_calls_total", "MTProto calls by method", ("method",))
+RPC_ERRORS = registry.counter("gifts_buyer_rpc_errors_total", "Failed MTProto calls by method and error",
+                              ("method", "error"))
+FLOOD_WAIT_SECONDS = registry.counter("gifts_buyer_flood_wait_seconds_total",
+                                      "FLOOD_WAIT seconds requested by Telegram", ("method",))
+FLOOD_WAITS = registry.counter("gifts_buyer_flood_waits_total", "FLOOD_WAIT responses", ("method",))
+PURCHASES_ATTEMPTED = registry.counter("gifts_buyer_purchases_attempted_total", "send_gift attempts")
+PURCHASES_SUCCEEDED = registry.counter("gifts_buyer_purchases_succeeded_total", "Successful gift purchases",
+                                       window=3600)
+PURCHASES_FAILED = registry.counter("gifts_buyer_purchases_failed_total", "Failed gift purchases", window=3600)
+SHADOW_PURCHASES = registry.counter("gifts_buyer_shadow_purchases_total", "Purchases recorded instead of sent in shadow mode")
+LAST_POLL_TIME = registry.gauge("gifts_buyer_last_poll_timestamp_seconds",
+                                "Unix time of the last catalog poll per account", ("user_id",))
+LAST_POLL_LATENCY = registry.gauge("gifts_buyer_last_poll_seconds", "Latency of the last catalog poll per account",
+                                   ("user_id",))
+NOTIFICATIONS_IN_FLIGHT = registry.gauge("gifts_buyer_notifications_in_flight",
+                                         "Notification messages being sent right now")
+EVENT_LOOP_LAG = registry.gauge("gifts_buyer_event_loop_lag_seconds", "Most recent event loop lag")
+ACTIVE_USERS = registry.gauge("gifts_buyer_active_users", "User bots running in this process")
+PROCESS_RSS = registry.gauge("gifts_buyer_process_resident_memory_bytes", "Resident set size of the process")
+DB_QUERIES = registry.counter("gifts_buyer_db_queries_total", "Database queries by table and operation",
+                              ("table", "operation"))
+DB_ERRORS = registry.counter("gifts_buyer_db_errors_total", "Failed database queries by table and operation",
+                             ("table", "operation"))
+
+
+class RpcTracker:
+    """Async context manager counting an MTProto call and its outcome."""
+
+    def __init__(self, method: str):
+        self.method = method
+
+    async def __aenter__(self) -> "RpcTracker":
+        RPC_CALLS.inc(method=self.method)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None and not isinstance(exc, asyncio.CancelledError):
+            RPC_ERRORS.inc(method=self.method, error=getattr(exc, "ID", None) or exc_type.__name__)
+            if isinstance(exc, FloodWait):
+                FLOOD_WAITS.inc(method=self.method)
+                FLOOD_WAIT_SECONDS.inc(exc.value or 0, method=self.method)
+        return False
+
+
+@contextmanager
+def track_db(table: str, operation: str) -> Iterator[None]:
+    """Count a database query and its failure, re-raising any error."""
+    DB_QUERIES.inc(table=table, operation=operation)
+    try:
+        yield
+    except Exception:
+        DB_ERRORS.inc(table=table, operation=operation)
+        raise
+
+
+def rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc is unavailable, 0 without either."""
+    if resource is None:
+        return 0
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+PROCESS_RSS.set_function(rss_bytes)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - expected)
+            EVENT_LOOP_LAG.set(self.lag)
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving the registry in Prometheus text format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, metrics_registry: MetricsRegistry = registry):
+        self.registry = metrics_registry
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip():
+                pass
+
+            path = request_line[1] if len(request_line) > 1 else ""
+            status, body = ("200 OK", self.registry.render()) if path.split("?")[0] in ("/", "/metrics") \
+                else ("404 Not Found", "not found\n")
+
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {self.CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except Exception as ex:
+            error(f"Metrics request failed: {str(ex)}")
+        finally:
+            writer.close()
+
+
+loop_lag_monitor = LoopLagMonitor()
+metrics_server = MetricsServer()
+track_rpc = RpcTracker
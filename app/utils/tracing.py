@@ -0,0 +1,170 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.logger import info
+from data.config import config
+
+current_trace: ContextVar[Optional["GiftTrace"]] = ContextVar("current_trace", default=None)
+
+Mark = Tuple[str, float, Dict[str, Any]]
+
+
+def _stage_durations(marks: List[Mark]) -> Dict[str, float]:
+    """Milliseconds spent reaching each mark from the previous one, summed over repeated stages."""
+    durations: Dict[str, float] = {}
+    for (_, previous, _), (stage, at, _) in zip(marks, marks[1:]):
+        durations[stage] = durations.get(stage, 0.0) + (at - previous) * 1000
+    return durations
+
+
+class TraceWriter:
+    """Appends finished gift traces as JSON lines."""
+
+    def __init__(self, file_path: str = "data/traces/drops.jsonl", enabled: bool = True):
+        self.file_path = Path(file_path)
+        self.enabled = enabled
+        self._file = None
+
+    def emit(self, records: List[Dict[str, Any]]) -> None:
+        if not self.enabled or not records:
+            return
+
+        if self._file is None:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.file_path.open("a", encoding="utf-8")
+
+        self._file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        self._file.flush()
+
+
+class GiftTrace:
+    """Timestamps of one gift going through the pipeline for one user."""
+
+    def __init__(self, drop: "DropTrace", gift_id: int):
+        self.drop = drop
+        self.gift_id = gift_id
+        self.marks: List[Mark] = list(drop.marks)
+        self.shared_marks = len(self.marks)
+
+    def mark(self, stage: str, **fields) -> None:
+        self.marks.append((stage, time.perf_counter(), fields))
+
+    def to_record(self) -> Dict[str, Any]:
+        origin = self.marks[0][1]
+        return {
+            "drop_id": self.drop.drop_id,
+            "user_id": self.drop.user_id,
+            "gift_id": self.gift_id,
+            "started_at": self.drop.started_at,
+            "stages": [
+                {"stage": stage, "at_ms": round((at - origin) * 1000, 3), **fields}
+                for stage, at, fields in self.marks
+            ],
+            "total_ms": round((self.marks[-1][1] - origin) * 1000, 3),
+        }
+
+
+class DropTrace:
+    """Tick-level trace shared by every gift detected in the same poll."""
+
+    def __init__(self, user_id: int, writer: Optional[TraceWriter] = None):
+        self.user_id = user_id
+        self.writer = writer or trace_writer
+        self.started_at = time.time()
+        self.drop_id = f"{user_id}-{int(self.started_at * 1000)}"
+        self.marks: List[Mark] = [("catalog_fetch_start", time.perf_counter(), {})]
+        self.gifts: List[GiftTrace] = []
+        self._pending = 0
+        self._finishing = False
+
+    def mark(self, stage: str, **fields) -> None:
+        self.marks.append((stage, time.perf_counter(), fields))
+
+    def hold(self) -> None:
+        """Keep the drop open while purchase work traced by it is still queued."""
+        self._pending += 1
+
+    def release(self) -> None:
+        self._pending -= 1
+        self._finishing and self._pending == 0 and self._emit()
+
+    @contextmanager
+    def gift(self, gift_id: int) -> Iterator[GiftTrace]:
+        """Trace a single gift; purchase and notification code mark it via ``current_trace``."""
+        trace = GiftTrace(self, gift_id)
+        # Time until the gift is picked up is spent behind gifts processed before it
+        trace.mark("queued")
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+            self.gifts.append(trace)
+
+    def finish(self) -> None:
+        """Emit gift traces once no queued purchase of the drop is outstanding."""
+        self._finishing = True
+        self._pending == 0 and self._emit()
+
+    def _emit(self) -> None:
+        """Write gift traces and log where the drop's time went."""
+        self._finishing = False
+        if not self.gifts:
+            return
+
+        self.writer.emit([trace.to_record() for trace in self.gifts])
+
+        totals = _stage_durations(self.marks)
+        for trace in self.gifts:
+            # Gift marks start after the shared ones; "queued" overlaps other gifts and is left out
+            for stage, duration in _stage_durations(trace.marks[trace.shared_marks:]).items():
+                totals[stage] = totals.get(stage, 0.0) + duration
+
+        elapsed = (max(trace.marks[-1][1] for trace in self.gifts) - self.marks[0][1]) * 1000
+        info(f"Drop {self.drop_id}: {len(self.gifts)} gifts in {elapsed:.0f}ms | " +
+             ", ".join(f"{stage} {duration:.0f}ms" for stage, duration in totals.items()))
+
+
+def mark(stage: str, **fields) -> None:
+    """Mark a stage on the gift being traced in the current context, if any."""
+    trace = current_trace.get()
+    trace and trace.mark(stage, **fields)
+
+
+def report(file_path: str, gift_id: Optional[int] = None) -> str:
+    """Summarize traced drops per gift, user and stage."""
+    by_gift: Dict[int, List[Dict[str, Any]]] = {}
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if gift_id is None or record["gift_id"] == gift_id:
+                by_gift.setdefault(record["gift_id"], []).append(record)
+
+    lines = []
+    for current_gift_id, records in by_gift.items():
+        first_seen = min(record["started_at"] for record in records)
+        lines.append(f"Gift {current_gift_id} (first seen {time.strftime('%d.%m.%y %H:%M:%S', time.localtime(first_seen))})")
+
+        for record in sorted(records, key=lambda r: r["started_at"] + r["total_ms"] / 1000):
+            stages = record["stages"]
+            durations: Dict[str, float] = {}
+            for previous, stage in zip(stages, stages[1:]):
+                durations[stage["stage"]] = durations.get(stage["stage"], 0.0) + stage["at_ms"] - previous["at_ms"]
+
+            lag = record["started_at"] - first_seen
+            lines.append(f"  user {record['user_id']}: +{lag:.2f}s poll offset, {record['total_ms']:.0f}ms total | " +
+                         ", ".join(f"{stage} {duration:.0f}ms" for stage, duration in durations.items()))
+
+    return "\n".join(lines)
+
+
+trace_writer = TraceWriter(config.TRACE_FILE, config.TRACE_ENABLED)
+
+if __name__ == "__main__":
+    print(report(sys.argv[1] if len(sys.argv) > 1 else "data/traces/drops.jsonl",
+                 int(sys.argv[2]) if len(sys.argv) > 2 else None))
@@ -25,6 +25,60 @@ class Config:
 
         # Bot Configuration
         self.LANGUAGE = self.parser.get('Bot', 'LANGUAGE', fallback='EN').upper()
+        self.CONFIG_RELOAD_INTERVAL = self.parser.getfloat('Bot', 'CONFIG_RELOAD_INTERVAL', fallback=5.0)
+
+        # Metrics endpoint (disabled when the port is 0)
+        self.METRICS_HOST = self.parser.get('Metrics', 'HOST', fallback='127.0.0.1')
+        self.METRICS_PORT = self.parser.getint('Metrics', 'PORT', fallback=0)
+
+        # Drop-to-purchase latency traces
+        self.TRACE_ENABLED = self.parser.getboolean('Tracing', 'ENABLED', fallback=True)
+        self.TRACE_FILE = self.parser.get('Tracing', 'FILE', fallback='data/traces/drops.jsonl')
+
+        # Shadow mode: run the whole pipeline but record purchases to FILE instead of sending them (every user when ENABLED)
+        self.SHADOW_ENABLED = self.parser.getboolean('Shadow', 'ENABLED', fallback=False)
+        self.SHADOW_FILE = self.parser.get('Shadow', 'FILE', fallback='data/shadow/purchases.jsonl')
+
+        # Catalog responses recorded to FILE for replaying through the pipeline (python -m app.core.replay)
+        self.REPLAY_RECORD = self.parser.getboolean('Replay', 'RECORD', fallback=False)
+        self.REPLAY_FILE = self.parser.get('Replay', 'FILE', fallback='data/replay/catalog.jsonl')
+
+        # Remaining-supply samples of limited gifts (BLOCKS x 4 KiB ring, one sample per RESOLUTION seconds)
+        self.SUPPLY_ENABLED = self.parser.getboolean('Supply', 'ENABLED', fallback=True)
+        self.SUPPLY_FILE = self.parser.get('Supply', 'FILE', fallback='data/supply/supply.bin')
+        self.SUPPLY_BLOCKS = self.parser.getint('Supply', 'BLOCKS', fallback=1024)
+        self.SUPPLY_RESOLUTION = self.parser.getfloat('Supply', 'RESOLUTION', fallback=1.0)
+
+        # Session storage: "file" (data/sessions) or "database" (in-memory clients, flushed every FLUSH_INTERVAL seconds)
+        self.SESSION_STORAGE = self.parser.get('Sessions', 'STORAGE', fallback='file').lower()
+        self.SESSION_FLUSH_INTERVAL = self.parser.getfloat('Sessions', 'FLUSH_INTERVAL', fallback=300.0)
+
+        # User client profile: "full" (Pyrogram's defaults) or "lean" (no updates, one worker, small caches, session in memory)
+        self.CLIENT_PROFILE = self.parser.get('Clients', 'PROFILE', fallback='full').lower()
+
+        # Multi-node operation: users are split between instances by leases in LEASE_STORE ("database" or "sqlite")
+        self.CLUSTER_ENABLED = self.parser.getboolean('Cluster', 'ENABLED', fallback=False)
+        self.CLUSTER_NODE_ID = self.parser.get('Cluster', 'NODE_ID', fallback='')
+        self.CLUSTER_LEASE_STORE = self.parser.get('Cluster', 'LEASE_STORE', fallback='database').lower()
+        self.CLUSTER_SQLITE_FILE = self.parser.get('Cluster', 'SQLITE_FILE', fallback='data/cluster.db')
+        self.CLUSTER_LEASE_TTL = self.parser.getfloat('Cluster', 'LEASE_TTL', fallback=30.0)
+        self.CLUSTER_HEARTBEAT_INTERVAL = self.parser.getfloat('Cluster', 'HEARTBEAT_INTERVAL', fallback=10.0)
+
+        # Catalog bus: one process per host polls the catalog and shares it with the others over SOCKET
+        self.BUS_ENABLED = self.parser.getboolean('Bus', 'ENABLED', fallback=False)
+        self.BUS_SOCKET = self.parser.get('Bus', 'SOCKET', fallback='data/bus/catalog.sock')
+        self.BUS_INTERVAL = self.parser.getfloat('Bus', 'INTERVAL', fallback=5.0)
+
+        # On-demand profiling: memory (/admin_memory or SIGUSR2, MEMORY_FRAMES per traceback) and CPU
+        # (/admin_cpu or SIGUSR1 for CPU_SECONDS, one sample per CPU_INTERVAL seconds); reports go to DIR
+        self.PROFILE_DIR = self.parser.get('Profiling', 'DIR', fallback='data/profiles')
+        self.PROFILE_MEMORY_FRAMES = self.parser.getint('Profiling', 'MEMORY_FRAMES', fallback=10)
+        self.PROFILE_CPU_SECONDS = self.parser.getfloat('Profiling', 'CPU_SECONDS', fallback=30.0)
+        self.PROFILE_CPU_INTERVAL = self.parser.getfloat('Profiling', 'CPU_INTERVAL', fallback=0.005)
+
+        # Console logging: "text" or "json" (JSON lines); status line redraw interval
+        self.LOG_FORMAT = self.parser.get('Logging', 'FORMAT', fallback='text')
+        self.LOG_STATUS_INTERVAL = self.parser.getfloat('Logging', 'STATUS_INTERVAL', fallback=1.0)
 
         # Set localization
         localization.set_locale(self.LANGUAGE.lower())
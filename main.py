@@ -1,4 +1,5 @@
 import asyncio
+import signal
 import traceback
 import os
 from dotenv import load_dotenv
@@ -9,14 +10,16 @@ load_dotenv()
 from pyrogram import Client
 
 from app.core.banner import display_title, get_app_info, set_window_title
-from app.core.multi_user_manager import MultiUserManager
+from app.core.multi_user_manager import multi_user_manager
 from app.telegram.handlers import setup_handlers
 from app.database import AuthManager
-from app.utils.logger import info, error
+from app.utils.logger import info, error, configure_logging
+from app.utils.cpu_profiler import cpu_profiler
+from app.utils.memory_profiler import memory_profiler
+from app.utils.metrics import ACTIVE_USERS, loop_lag_monitor, metrics_server
 from data.config import config, t, get_language_display
 
 app_info = get_app_info()
-multi_user_manager = MultiUserManager()
 auth_manager = AuthManager()
 
 
@@ -36,6 +39,17 @@ class Application:
         
         # Setup Telegram command handlers
         setup_handlers(bot_api_client)
+        multi_user_manager.bot_client = bot_api_client
+
+        # Expose metrics locally if enabled
+        loop_lag_monitor.start()
+        if config.METRICS_PORT:
+            ACTIVE_USERS.set_function(multi_user_manager.get_active_user_count)
+            await metrics_server.start(config.METRICS_HOST, config.METRICS_PORT)
+
+        # kill -USR1 <pid> logs a CPU profile, kill -USR2 <pid> a memory snapshot (not available on Windows)
+        for name, handler in (("SIGUSR1", cpu_profiler.on_signal), ("SIGUSR2", memory_profiler.on_signal)):
+            hasattr(signal, name) and asyncio.get_running_loop().add_signal_handler(getattr(signal, name), handler)
         
         async with bot_api_client:
             info("Bot API client started - ready to accept commands")
@@ -49,9 +63,12 @@ class Application:
             except asyncio.CancelledError:
                 info("Shutting down...")
                 await multi_user_manager.stop_all_users()
+                await metrics_server.stop()
 
     @staticmethod
     def main() -> None:
+        configure_logging(config.LOG_FORMAT, config.LOG_STATUS_INTERVAL)
+
         # Check for required environment variables
         required_env_vars = ['SUPABASE_URL', 'SUPABASE_ANON_KEY']
         missing_vars = [var for var in required_env_vars if not os.getenv(var)]
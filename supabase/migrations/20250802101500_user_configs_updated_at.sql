@@ -0,0 +1,26 @@
+/*
+  # Keep user_configs.updated_at current
+
+  1. Changes
+    - Add `set_updated_at` trigger function
+    - Stamp `user_configs.updated_at` on every update so running bots can
+      pick up configuration changes by polling on `updated_at`
+    - Index `user_configs.updated_at` for the change-feed query
+*/
+
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_configs_set_updated_at ON user_configs;
+
+CREATE TRIGGER user_configs_set_updated_at
+  BEFORE UPDATE ON user_configs
+  FOR EACH ROW
+  EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX IF NOT EXISTS user_configs_updated_at_idx ON user_configs (updated_at);
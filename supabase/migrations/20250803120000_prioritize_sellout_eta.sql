@@ -0,0 +1,11 @@
+/*
+  # Sell-out ETA prioritization
+
+  1. Changes
+    - Add `user_configs.prioritize_sellout_eta` (boolean) - buy the gifts
+      predicted to sell out soonest first; takes precedence over
+      `prioritize_low_supply`
+*/
+
+ALTER TABLE user_configs
+  ADD COLUMN IF NOT EXISTS prioritize_sellout_eta boolean DEFAULT false;
@@ -0,0 +1,40 @@
+/*
+  # Store Pyrogram sessions in the database
+
+  1. New Tables
+    - `user_sessions`
+      - `user_id` (bigint, primary key) - Telegram user ID
+      - `session_string` (text) - Pyrogram session string (DC, auth key, account)
+      - `peers` (jsonb) - Most recently seen peers: [id, access_hash, type, username, phone_number]
+      - `updated_at` (timestamp)
+
+  2. Security
+    - Enable RLS
+    - Add policy for authenticated access
+
+  Used with `[Sessions] STORAGE = database`: clients keep sessions in memory and any
+  node can start any account. Kept out of `user_configs` so session flushes do not
+  show up as configuration changes.
+*/
+
+CREATE TABLE IF NOT EXISTS user_sessions (
+  user_id bigint PRIMARY KEY,
+  session_string text,
+  peers jsonb DEFAULT '[]'::jsonb,
+  updated_at timestamptz DEFAULT now()
+);
+
+ALTER TABLE user_sessions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Sessions can be managed"
+  ON user_sessions
+  FOR ALL
+  TO authenticated
+  USING (true);
+
+DROP TRIGGER IF EXISTS user_sessions_set_updated_at ON user_sessions;
+
+CREATE TRIGGER user_sessions_set_updated_at
+  BEFORE UPDATE ON user_sessions
+  FOR EACH ROW
+  EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,86 @@
+/*
+  # Lease-based ownership of users across bot instances
+
+  1. New Tables
+    - `cluster_nodes`
+      - `node_id` (text, primary key) - Instance identifier
+      - `expires_at` (timestamp) - Node is considered dead after this time
+    - `user_leases`
+      - `user_id` (bigint, primary key) - Telegram user ID
+      - `node_id` (text) - Instance running the user's bot
+      - `expires_at` (timestamp) - Other nodes may take over after this time
+
+  2. Functions
+    - `cluster_heartbeat` - extend a node's liveness and list live nodes
+    - `acquire_user_lease` - take a free or expired lease, or extend our own
+    - `renew_user_leases` - extend the leases a node still holds
+
+  3. Security
+    - Enable RLS on both tables
+    - Add policies for authenticated access
+
+  Expiry always uses the database clock, so nodes do not need synchronized clocks.
+*/
+
+CREATE TABLE IF NOT EXISTS cluster_nodes (
+  node_id text PRIMARY KEY,
+  expires_at timestamptz NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_leases (
+  user_id bigint PRIMARY KEY,
+  node_id text NOT NULL,
+  expires_at timestamptz NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS user_leases_node_id_idx ON user_leases (node_id);
+
+ALTER TABLE cluster_nodes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE user_leases ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Cluster nodes can be managed"
+  ON cluster_nodes
+  FOR ALL
+  TO authenticated
+  USING (true);
+
+CREATE POLICY "User leases can be managed"
+  ON user_leases
+  FOR ALL
+  TO authenticated
+  USING (true);
+
+CREATE OR REPLACE FUNCTION cluster_heartbeat(p_node_id text, p_ttl double precision)
+RETURNS TABLE (live_node_id text) AS $$
+BEGIN
+  INSERT INTO cluster_nodes (node_id, expires_at)
+  VALUES (p_node_id, now() + make_interval(secs => p_ttl))
+  ON CONFLICT (node_id) DO UPDATE SET expires_at = EXCLUDED.expires_at;
+
+  DELETE FROM cluster_nodes WHERE expires_at < now() - interval '1 hour';
+
+  RETURN QUERY
+    SELECT cn.node_id FROM cluster_nodes cn WHERE cn.expires_at > now() ORDER BY cn.node_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION acquire_user_lease(p_user_id bigint, p_node_id text, p_ttl double precision)
+RETURNS boolean AS $$
+  WITH claimed AS (
+    INSERT INTO user_leases (user_id, node_id, expires_at)
+    VALUES (p_user_id, p_node_id, now() + make_interval(secs => p_ttl))
+    ON CONFLICT (user_id) DO UPDATE
+      SET node_id = EXCLUDED.node_id, expires_at = EXCLUDED.expires_at
+      WHERE user_leases.node_id = EXCLUDED.node_id OR user_leases.expires_at < now()
+    RETURNING 1
+  )
+  SELECT count(*) > 0 FROM claimed;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION renew_user_leases(p_node_id text, p_user_ids bigint[], p_ttl double precision)
+RETURNS TABLE (leased_user_id bigint) AS $$
+  UPDATE user_leases
+  SET expires_at = now() + make_interval(secs => p_ttl)
+  WHERE node_id = p_node_id AND user_id = ANY(p_user_ids)
+  RETURNING user_id;
+$$ LANGUAGE sql;
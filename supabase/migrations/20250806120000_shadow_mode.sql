@@ -0,0 +1,11 @@
+/*
+  # Shadow mode
+
+  1. Changes
+    - Add `user_configs.shadow_mode` (boolean) - run the full purchase
+      pipeline but record the purchases to the shadow file instead of
+      sending them
+*/
+
+ALTER TABLE user_configs
+  ADD COLUMN IF NOT EXISTS shadow_mode boolean DEFAULT false;
@@ -0,0 +1,11 @@
+/*
+  # Gift filter rules
+
+  1. Changes
+    - Add `user_configs.gift_rules` (text) - filter rules set with `/rules`:
+      gift id allow/deny lists, upgrade price caps and budgets, globally
+      or per gift range; compiled together with `gift_ranges`
+*/
+
+ALTER TABLE user_configs
+  ADD COLUMN IF NOT EXISTS gift_rules text DEFAULT '';
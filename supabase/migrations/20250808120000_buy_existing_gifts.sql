@@ -0,0 +1,11 @@
+/*
+  # Buy existing gifts on first start
+
+  1. Changes
+    - Add `user_configs.buy_existing_gifts` (boolean) - when a user's bot
+      starts without gift history, leave the gifts their ranges and rules
+      would buy out of the seeded history so the first poll buys them
+*/
+
+ALTER TABLE user_configs
+  ADD COLUMN IF NOT EXISTS buy_existing_gifts boolean DEFAULT false;